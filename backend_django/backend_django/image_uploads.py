@@ -0,0 +1,239 @@
+"""
+Upload handlers that check image uploads while they stream in, and the
+serializer field that trusts their check. Shared by the product and
+members endpoints.
+
+The handlers are not the global FILE_UPLOAD_HANDLERS: they reject files
+by raising DRF APIExceptions, which only DRF views (and the async product
+views) turn into 400/413 responses. Views opt in with
+@image_upload_handlers.
+"""
+import hashlib
+import io
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, serializers
+
+# Bytes of an image kept to identify it. Image headers are small, but a
+# JPEG's frame header can come after up to 64 KiB of EXIF data.
+IMAGE_HEAD_SIZE = 128 * 1024
+
+INVALID_IMAGE_MESSAGE = serializers.ImageField.default_error_messages['invalid_image']
+
+
+class ImageHeaderError(ValueError):
+    pass
+
+
+class UploadRejected(exceptions.APIException):
+    status_code = 400
+    default_detail = 'Invalid upload.'
+    default_code = 'invalid_upload'
+
+
+class UploadTooLarge(UploadRejected):
+    status_code = 413
+    default_detail = 'Upload too large.'
+    default_code = 'upload_too_large'
+
+
+def read_image_header(head, complete=True):
+    """
+    Identify an image from its first bytes without decoding any pixels.
+
+    Returns (format, (width, height)), or None if head is not complete
+    and more bytes may still make it an image. Raises ImageHeaderError
+    for anything but a supported image within the pixel limit.
+    """
+    # Pillow is only imported once an upload needs it
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(head), formats=settings.UPLOAD_IMAGE_FORMATS) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise ImageHeaderError('The image has too many pixels.')
+    except (OSError, SyntaxError, ValueError, EOFError):
+        if not complete:
+            return None
+        raise ImageHeaderError(INVALID_IMAGE_MESSAGE)
+    if size[0] * size[1] > settings.UPLOAD_IMAGE_MAX_PIXELS:
+        raise ImageHeaderError(f'The image has too many pixels, at most {settings.UPLOAD_IMAGE_MAX_PIXELS} are allowed.')
+    return image_format, size
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Placeholder for an upload that was dropped while it streamed in; its
+    bytes were discarded and upload_error says why
+    """
+
+    def __init__(self, name, upload_error):
+        super().__init__(io.BytesIO(), name=name, size=0)
+        self.upload_error = upload_error
+
+
+def handles_file(handler):
+    # A memory handler that isn't activated passes every chunk on to the
+    # temporary file handler, which does the work instead
+    return getattr(handler, 'activated', True)
+
+
+class HashingUploadMixin:
+    """
+    Compute the SHA-256 of an upload while its chunks arrive and set it
+    as the ``sha256`` attribute of the resulting file
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: the handlers' new_file may raise StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if handles_file(self):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class ImageUploadLimitsMixin:
+    """
+    Check uploads to the form fields in UPLOAD_IMAGE_FIELDS while their
+    chunks arrive: a file is rejected as soon as it grows past the field's
+    max_size, or as soon as its first bytes show it isn't a supported
+    image. The image format and dimensions are read from the header and
+    set as the ``image_format`` and ``image_size`` attributes of the file.
+
+    A rejection aborts the request with a 413 or 400 response, or, for
+    fields with per_file_errors, discards the rest of that file and
+    leaves a RejectedUpload in its place so the other files still count.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        self.limits = settings.UPLOAD_IMAGE_FIELDS.get(field_name)
+        self.upload_error = None
+        self.header = None
+        self.head = b''
+        # Not the previous file's: that one may already be in request.FILES
+        self.file = None
+        if self.limits and content_length and content_length > self.limits['max_size']:
+            self.reject(field_name, self.too_large_message(), UploadTooLarge)
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.limits or not handles_file(self):
+            return super().receive_data_chunk(raw_data, start)
+        if self.upload_error:
+            # Drop the rest of a rejected file
+            return None
+
+        if start + len(raw_data) > self.limits['max_size']:
+            self.reject(self.field_name, self.too_large_message(), UploadTooLarge)
+            return None
+        if self.header is None:
+            self.head += raw_data
+            try:
+                self.header = read_image_header(self.head, complete=len(self.head) >= IMAGE_HEAD_SIZE)
+            except ImageHeaderError as e:
+                self.reject(self.field_name, str(e), UploadRejected)
+                return None
+            if self.header:
+                self.head = b''
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.limits or not handles_file(self):
+            return super().file_complete(file_size)
+
+        if self.header is None and not self.upload_error:
+            # Smaller than IMAGE_HEAD_SIZE: all of it was the head
+            try:
+                self.header = read_image_header(self.head)
+            except ImageHeaderError as e:
+                self.reject(self.field_name, str(e), UploadRejected)
+        if self.upload_error:
+            if self.file is not None:
+                self.file.close()
+            return RejectedUpload(self.file_name, self.upload_error)
+
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.image_format, file.image_size = self.header
+        return file
+
+    def reject(self, field_name, message, exception_class):
+        self.head = b''
+        if self.file is not None:
+            # Deletes a temporary file
+            self.file.close()
+            self.file = None
+        if not self.limits.get('per_file_errors'):
+            raise exception_class({field_name: [message]})
+        self.upload_error = message
+
+    def too_large_message(self):
+        return f"The file is larger than {self.limits['max_size']} bytes."
+
+
+class StreamingMemoryFileUploadHandler(ImageUploadLimitsMixin, HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class StreamingTemporaryFileUploadHandler(ImageUploadLimitsMixin, HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class UploadedImageField(serializers.ImageField):
+    """
+    ImageField for files that went through the streaming upload handlers:
+    it trusts their header check instead of opening and verifying the
+    whole image with Pillow again
+    """
+
+    def to_internal_value(self, data):
+        upload_error = getattr(data, 'upload_error', None)
+        if upload_error:
+            raise serializers.ValidationError(upload_error)
+        file = serializers.FileField.to_internal_value(self, data)
+        if getattr(file, 'image_format', None) is None:
+            # Not streamed in, e.g. a file built in code: check its header
+            file.seek(0)
+            head = file.read(IMAGE_HEAD_SIZE)
+            file.seek(0)
+            try:
+                file.image_format, file.image_size = read_image_header(head)
+            except ImageHeaderError as e:
+                raise serializers.ValidationError(str(e))
+        return file
+
+
+def image_upload_handlers(view):
+    """
+    Parse a view's uploads with the IMAGE_UPLOAD_HANDLERS. Goes above
+    @api_view: the handlers are set on the Django request before its body
+    is read.
+    """
+    def set_handlers(request):
+        request.upload_handlers = [import_string(handler)(request) for handler in settings.IMAGE_UPLOAD_HANDLERS]
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            set_handlers(request)
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            set_handlers(request)
+            return view(request, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,56 @@
+"""
+URL patterns whose view is imported the first time a request matches
+them, instead of when the URLconf is loaded.
+
+A serverless instance usually answers a handful of routes before it is
+recycled, so it should not import every view module (and what those pull
+in) before the first response.
+
+URLResolver._populate() reads the callback of every pattern to build the
+reverse map, so until its view is imported a lazy pattern's callback is
+its dotted path. Reversing them by URL name imports nothing; reversing
+them by view function isn't supported.
+"""
+from django.urls import URLPattern
+from django.urls.resolvers import RoutePattern
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+class LazyURLPattern(URLPattern):
+    def __init__(self, pattern, view_path, default_args=None, name=None):
+        self.view_path = view_path
+        self._callback = None
+        super().__init__(pattern, None, default_args, name)
+
+    @property
+    def callback(self):
+        return self._callback or self.view_path
+
+    @callback.setter
+    def callback(self, value):
+        self._callback = value
+
+    def load_view(self):
+        if self._callback is None:
+            view = import_string(self.view_path)
+            # Class-based views are given by their class
+            self._callback = view.as_view() if hasattr(view, 'as_view') else view
+
+    def resolve(self, path):
+        # Only the pattern a request is routed to imports its view
+        if self.pattern.match(path):
+            self.load_view()
+        return super().resolve(path)
+
+    @cached_property
+    def lookup_str(self):
+        return self.view_path
+
+
+def lazy_path(route, view_path, kwargs=None, name=None):
+    """
+    path() for a view given by dotted path, e.g.
+    lazy_path('jobs/<int:pk>/', 'product.views.get_job_status', name='job-status')
+    """
+    return LazyURLPattern(RoutePattern(route, name=name, is_endpoint=True), view_path, kwargs, name)
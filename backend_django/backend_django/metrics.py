@@ -0,0 +1,268 @@
+"""
+Per-view performance metrics in Prometheus format.
+
+MetricsMiddleware records for every resolved URL name the request
+latency, the number and time of ORM queries, and the bytes read from and
+written to storage through MeteredFileSystemStorage. metrics_view serves
+them on /metrics.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory before
+the workers start: every worker then writes its samples to mmap'ed files
+in it and /metrics aggregates all workers.
+"""
+import contextvars
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# View label for work done outside a request (jobs, commands) and for
+# requests that did not resolve to a view
+NO_VIEW = 'none'
+UNRESOLVED = 'unresolved'
+
+REQUEST_LATENCY = Histogram(
+    'django_view_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_QUERIES = Histogram(
+    'django_view_db_queries',
+    'ORM queries per request by URL name',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+DB_QUERY_SECONDS = Counter(
+    'django_view_db_query_seconds',
+    'Time spent in ORM queries by URL name',
+    ['view'],
+)
+STORAGE_READ_BYTES = Counter(
+    'django_view_storage_read_bytes',
+    'Bytes read from storage by URL name',
+    ['view'],
+)
+STORAGE_WRITTEN_BYTES = Counter(
+    'django_view_storage_written_bytes',
+    'Bytes written to storage by URL name',
+    ['view'],
+)
+
+# The request being handled, used to attribute storage I/O to its view
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def view_label(request):
+    if request is None:
+        return NO_VIEW
+    match = request.resolver_match
+    return match.view_name if match and match.url_name else UNRESOLVED
+
+
+class QueryRecorder:
+    """
+    execute_wrapper that counts and times the queries of one request
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Works in both sync and async mode, so async views stay async under
+    ASGI instead of being pushed through a thread by this middleware
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.recording(request) as recorder:
+            response = self.get_response(request)
+        self.observe(request, response, recorder)
+        return self.attribute_stream(request, response)
+
+    async def __acall__(self, request):
+        with self.recording(request) as recorder:
+            response = await self.get_response(request)
+        self.observe(request, response, recorder)
+        return self.attribute_stream(request, response)
+
+    @contextmanager
+    def recording(self, request):
+        recorder = QueryRecorder()
+        recorder.start = time.perf_counter()
+        token = current_request.set(request)
+        try:
+            with ExitStack() as stack:
+                # Wrapping doesn't open a connection, it only hooks the cursor
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                yield recorder
+        finally:
+            current_request.reset(token)
+
+    @staticmethod
+    def attribute_stream(request, response):
+        """
+        A streaming body is read after the view has returned and
+        recording() has reset current_request, so set it again around
+        every chunk for the storage reads the body does. A FileResponse's
+        file was opened by the view, and replacing its content would lose
+        the server's wsgi.file_wrapper.
+        """
+        if not response.streaming or isinstance(response, FileResponse):
+            return response
+        content = response.streaming_content
+        if response.is_async:
+            async def chunks():
+                iterator = aiter(content)
+                while True:
+                    token = current_request.set(request)
+                    try:
+                        chunk = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        current_request.reset(token)
+                    yield chunk
+        else:
+            def chunks():
+                iterator = iter(content)
+                while True:
+                    token = current_request.set(request)
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        current_request.reset(token)
+                    yield chunk
+        response.streaming_content = chunks()
+        return response
+
+    @staticmethod
+    def observe(request, response, recorder):
+        view = view_label(request)
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(time.perf_counter() - recorder.start)
+        DB_QUERIES.labels(view).observe(recorder.count)
+        if recorder.seconds:
+            DB_QUERY_SECONDS.labels(view).inc(recorder.seconds)
+
+
+class MeteredFile:
+    """
+    Proxy around a storage file that counts the bytes read from it
+    """
+
+    def __init__(self, file, view):
+        self._file = file
+        self._view = view
+
+    def read(self, *args, **kwargs):
+        data = self._file.read(*args, **kwargs)
+        STORAGE_READ_BYTES.labels(self._view).inc(len(data))
+        return data
+
+    def chunks(self, *args, **kwargs):
+        for chunk in self._file.chunks(*args, **kwargs):
+            STORAGE_READ_BYTES.labels(self._view).inc(len(chunk))
+            yield chunk
+
+    def __iter__(self):
+        for line in self._file:
+            STORAGE_READ_BYTES.labels(self._view).inc(len(line))
+            yield line
+
+    def __enter__(self):
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._file.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class MeteredStorageMixin:
+    """
+    Count the bytes a storage backend reads and writes, by URL name
+    """
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        size = getattr(content, 'size', None)
+        if size:
+            STORAGE_WRITTEN_BYTES.labels(view_label(current_request.get())).inc(size)
+        return name
+
+    def _open(self, name, mode='rb'):
+        return MeteredFile(super()._open(name, mode), view_label(current_request.get()))
+
+
+class MeteredFileSystemStorage(MeteredStorageMixin, FileSystemStorage):
+    pass
+
+
+def metrics_registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate the samples every worker wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def may_scrape(request):
+    """
+    Whether a request may read the metrics: it sends METRICS_TOKEN as a
+    bearer token or comes from an address in METRICS_ALLOWED_IPS. With
+    neither configured, nobody may.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+def metrics_view(request):
+    """
+    Serve the metrics in the Prometheus text format to scrapers allowed by
+    may_scrape()
+    """
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,22 @@
+"""
+URL configuration for the serverless deployment (settings_serverless.py).
+
+The same API routes as backend_django/urls.py, without the admin and
+/metrics, and with every view imported on the first request routed to it.
+"""
+from django.conf import settings
+from django.conf.urls.static import static
+from django.urls import include, path
+from members.routes import members_urlpatterns
+from product.routes import product_urlpatterns
+from .lazy_urls import lazy_path
+
+urlpatterns = [
+    lazy_path('api/token/', 'rest_framework_simplejwt.views.TokenObtainPairView', name='token_obtain_pair'),
+    lazy_path('api/token/refresh/', 'rest_framework_simplejwt.views.TokenRefreshView', name='token_refresh'),
+    path('api/', include(product_urlpatterns(settings.PRODUCT_ASYNC_VIEWS, lazy=True))),
+    path('api/', include(members_urlpatterns(lazy=True))),
+]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,62 @@
+"""
+Settings for the serverless (Vercel) deployment, loaded by vercel_app.py.
+
+A serverless instance is started for a burst of API requests and thrown
+away, so every import it makes before its first response is paid on each
+cold start. These settings start from settings.py and leave out what the
+JSON API doesn't use; `python manage.py profile_startup --entry serverless`
+shows what is left.
+"""
+from .settings import *  # noqa: F401,F403
+
+# The admin and its session, message and static file apps aren't served
+# here. rest_framework_simplejwt is only installed for its translations;
+# leaving it out defers importing simplejwt (and django.test, which its
+# settings module imports) until a request authenticates.
+SERVERLESS_SKIPPED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'rest_framework_simplejwt',
+]
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in SERVERLESS_SKIPPED_APPS]
+
+# API requests authenticate with JWTs, so the session, auth and message
+# middleware have nothing to do. Metrics are left out: each instance only
+# lives for a few requests and can't be scraped.
+SERVERLESS_SKIPPED_MIDDLEWARE = [
+    'backend_django.metrics.MetricsMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in SERVERLESS_SKIPPED_MIDDLEWARE]
+
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    'django.template.context_processors.request',
+]
+
+# Unmetered storage; the metered ones import prometheus_client
+SERVERLESS_STORAGE_BACKENDS = {
+    'backend_django.metrics.MeteredFileSystemStorage': 'django.core.files.storage.FileSystemStorage',
+    'backend_django.storage_backends.MeteredS3Storage': 'backend_django.storage_backends.DirectUploadS3Storage',
+}
+STORAGES = {
+    **STORAGES,
+    'default': {
+        **STORAGES['default'],
+        'BACKEND': SERVERLESS_STORAGE_BACKENDS.get(STORAGES['default']['BACKEND'], STORAGES['default']['BACKEND']),
+    },
+}
+
+# JSON only: the browsable API needs templates and static files
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+# Views are imported by the first request that routes to them
+ROOT_URLCONF = 'backend_django.serverless_urls'
+WSGI_APPLICATION = 'vercel_app.app'
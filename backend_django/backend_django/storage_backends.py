@@ -0,0 +1,63 @@
+"""
+Object storage backends for MEDIA_STORAGE=s3 (see settings.py): any
+S3-compatible service, e.g. AWS S3, MinIO or a local moto server.
+
+Besides storing files like the default storage, these backends let
+clients upload straight to the bucket (product/direct_uploads.py), so the
+bytes of large uploads never pass through an app worker.
+"""
+from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+from .metrics import STORAGE_READ_BYTES, MeteredStorageMixin, current_request, view_label
+
+
+class DirectUploadS3Storage(S3Storage):
+    """
+    S3 storage that can presign uploads, read the start of an object and
+    stream one
+    """
+
+    def presigned_upload(self, name, content_type, max_size, expires_in):
+        """
+        A presigned POST for one object of this content type and at most
+        max_size bytes at name: {'url': ..., 'fields': {...}}. The client
+        sends the fields, then the file, as multipart/form-data to url.
+        """
+        return self.connection.meta.client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=self._normalize_name(clean_name(name)),
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_size],
+            ],
+            ExpiresIn=expires_in,
+        )
+
+    def read_head(self, name, size):
+        """
+        The first size bytes of a stored object, with one ranged GET
+        instead of downloading all of it
+        """
+        obj = self.bucket.Object(self._normalize_name(clean_name(name)))
+        return obj.get(Range=f'bytes=0-{size - 1}')['Body'].read()
+
+    def stream(self, name, chunk_size):
+        """
+        Yield a stored object in chunks straight from the GET response;
+        open() would first download all of it to a temporary file
+        """
+        body = self.bucket.Object(self._normalize_name(clean_name(name))).get()['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+
+class MeteredS3Storage(MeteredStorageMixin, DirectUploadS3Storage):
+
+    def stream(self, name, chunk_size):
+        view = view_label(current_request.get())
+        for chunk in super().stream(name, chunk_size):
+            STORAGE_READ_BYTES.labels(view).inc(len(chunk))
+            yield chunk
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .metrics import metrics_view
 
 
 from rest_framework_simplejwt.views import (
@@ -30,6 +31,7 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include('product.urls')),
     path('api/', include('members.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
 ]
 
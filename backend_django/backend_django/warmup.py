@@ -0,0 +1,62 @@
+"""
+Work done before a server process takes its first request, so that the
+first request is as fast as the thousandth.
+
+Called from the gunicorn hooks in gunicorn.conf.py: warm_imports() runs
+once in the master after the preloaded app is imported, so forked workers
+share its result; warm_connections() runs in every worker, after the fork.
+"""
+import logging
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_imports():
+    """
+    Import and build everything Django and DRF otherwise set up lazily on
+    the first request
+    """
+    # Imports every URLconf and view module, then builds the reverse map
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    # DRF imports its default classes on first use
+    api_settings.DEFAULT_RENDERER_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    api_settings.DEFAULT_PERMISSION_CLASSES
+    api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS
+    jwt_settings.AUTH_TOKEN_CLASSES
+    jwt_settings.TOKEN_USER_CLASS
+
+    import members.serializers  # noqa: F401
+    import product.serializers  # noqa: F401
+    from product.csv_templates import get_shopify_template
+
+    try:
+        get_shopify_template()
+    except FileNotFoundError:
+        logger.warning('Shopify CSV template is missing, it will not be preloaded')
+
+
+def warm_connections():
+    """
+    Open this worker's database connection pools (DATABASE_POOL), so the
+    first requests don't wait for connections. Pools must not be opened
+    before forking, since workers can't share connections.
+
+    Without a pool there is nothing to warm: persistent connections
+    belong to a thread, and a connection opened here would never serve a
+    request of the gthread worker's request threads.
+    """
+    for connection in connections.all():
+        if connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            # Opens the pool with its min_size connections, then hands
+            # this one back to it
+            connection.ensure_connection()
+            connection.close()
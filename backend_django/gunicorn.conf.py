@@ -0,0 +1,68 @@
+"""
+gunicorn settings for production serving:
+
+    gunicorn --config gunicorn.conf.py backend_django.wsgi:application
+
+Every value can be overridden with an environment variable.
+"""
+import multiprocessing
+import os
+import shutil
+
+
+def cpu_count():
+    # Respect CPU affinity (e.g. docker --cpuset-cpus) where available
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8001')}")
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound slow memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+# Import the app once in the master; workers fork with it already loaded
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+# /metrics aggregates the workers through files in this directory. It
+# must be set before prometheus_client is imported, i.e. before the app.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def when_ready(server):
+    from backend_django.warmup import warm_imports
+
+    # Runs in the master after the preloaded import, so workers inherit it
+    warm_imports()
+
+
+def post_fork(server, worker):
+    from backend_django.warmup import warm_connections
+
+    # The imports were warmed in the master, before the fork
+    warm_connections()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,120 @@
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password as check_encoded_password, make_password
+from django.db.models.functions import Lower
+
+User = get_user_model()
+
+_password_executor = None
+_password_executor_lock = threading.Lock()
+
+# Hashes running at once in all the processes forked from this one: the
+# gunicorn master imports this module before it forks the workers
+_hash_slots = multiprocessing.BoundedSemaphore(settings.LOGIN_HASH_WORKERS)
+
+# Logins of this process hashing or waiting for a slot
+_logins = 0
+_logins_lock = threading.Lock()
+
+
+class LoginThrottled(Exception):
+    """
+    Raised when too many logins are already hashing or waiting to
+    """
+
+
+def users_with_email(email):
+    """
+    Case-insensitive email lookup that uses the LOWER(email) index
+    (members migration 0004). email__iexact would compile to LIKE on
+    SQLite and UPPER() on Postgres, which the index doesn't cover.
+    """
+    return User.objects.alias(email_lower=Lower('email')).filter(email_lower=email.lower())
+
+
+def find_login_user(login):
+    """
+    Return the user whose email (any case) or username is the login, or
+    None. Two indexed lookups instead of one OR that can't use either index.
+    """
+    user = users_with_email(login).order_by('pk').first()
+    if user is None:
+        user = User.objects.filter(username=login).first()
+    return user
+
+
+def get_password_executor():
+    """
+    Return the process-wide thread pool that verifies passwords.
+
+    Hashing is CPU-bound and releases the GIL, so the pool size caps how
+    many cores a burst of logins can take from the rest of the site.
+    """
+    global _password_executor
+    if _password_executor is None:
+        with _password_executor_lock:
+            if _password_executor is None:
+                _password_executor = ThreadPoolExecutor(
+                    max_workers=settings.LOGIN_HASH_WORKERS,
+                    thread_name_prefix='password-hash',
+                )
+    return _password_executor
+
+
+@contextmanager
+def hash_slot():
+    """
+    Hold one of the LOGIN_HASH_WORKERS hashing slots. Raises LoginThrottled
+    when LOGIN_HASH_QUEUE logins of this process are waiting already, or
+    no slot frees up within LOGIN_HASH_WAIT seconds.
+    """
+    global _logins
+    with _logins_lock:
+        if _logins >= settings.LOGIN_HASH_WORKERS + settings.LOGIN_HASH_QUEUE:
+            raise LoginThrottled()
+        _logins += 1
+    try:
+        if not _hash_slots.acquire(timeout=settings.LOGIN_HASH_WAIT):
+            raise LoginThrottled()
+        try:
+            yield
+        finally:
+            _hash_slots.release()
+    finally:
+        with _logins_lock:
+            _logins -= 1
+
+
+def verify_password(password, encoded):
+    """
+    Check a password against an encoded hash in the hashing pool. Returns
+    (valid, the password hashed with the preferred hasher if the stored
+    hash is outdated, else None). Nothing here touches the database.
+    """
+    if encoded is None:
+        # Unknown users take as long to answer as wrong passwords
+        make_password(password)
+        return False, None
+    upgraded = []
+    valid = check_encoded_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+def check_login_password(user, password):
+    """
+    Verify a login's password in the hashing pool, and store an upgraded
+    hash from this thread. With no user, hash the password anyway.
+
+    Raises LoginThrottled when the hashing pool is saturated.
+    """
+    with hash_slot():
+        future = get_password_executor().submit(verify_password, password, user.password if user else None)
+        valid, upgraded = future.result()
+    if valid and upgraded:
+        user.password = upgraded
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,93 @@
+import copy
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .user_cache import SHARED_CACHE_KEY, shared_user_cache, user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through an in-process
+    TTL cache, then the optional shared cache, before the database.
+
+    Entries are invalidated by the User post_save/post_delete receivers in
+    members.signals. Changes that bypass signals (QuerySet.update) show up
+    after JWT_USER_CACHE_TTL.
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(self.token_user_id(validated_token))
+        return self.check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views; only a cache miss touches the
+        database, through the async ORM
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        user = await self.aget_cached_user(self.token_user_id(validated_token))
+        return self.check_user(user, validated_token), validated_token
+
+    @staticmethod
+    def token_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    @staticmethod
+    def check_user(user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+    def get_cached_user(self, user_id):
+        key = str(user_id)
+        user = user_cache.get(key)
+        if user is None:
+            shared = shared_user_cache()
+            if shared is not None:
+                user = shared.get(SHARED_CACHE_KEY.format(user_id))
+            if user is None:
+                try:
+                    user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+                except self.user_model.DoesNotExist as e:
+                    raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+                if shared is not None:
+                    shared.set(SHARED_CACHE_KEY.format(user_id), user, settings.JWT_USER_CACHE_TTL)
+            user_cache.set(key, user)
+        # Every request gets its own instance, so a view changing
+        # request.user can't leak into other requests
+        return copy.copy(user)
+
+    async def aget_cached_user(self, user_id):
+        key = str(user_id)
+        user = user_cache.get(key)
+        if user is None:
+            shared = shared_user_cache()
+            if shared is not None:
+                user = await shared.aget(SHARED_CACHE_KEY.format(user_id))
+            if user is None:
+                try:
+                    user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+                except self.user_model.DoesNotExist as e:
+                    raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+                if shared is not None:
+                    await shared.aset(SHARED_CACHE_KEY.format(user_id), user, settings.JWT_USER_CACHE_TTL)
+            user_cache.set(key, user)
+        return copy.copy(user)
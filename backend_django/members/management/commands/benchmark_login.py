@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+from product.benchmarks import benchmark_database, latency_summary
+
+LOGIN_PATH = '/api/login/'
+PRODUCT_LIST_PATH = '/api/shopify-products/'
+PRODUCT_LIST_QUERY = 'page_size=50'
+EMAIL = 'Benchmark.Login@example.com'
+PASSWORD = 'benchmark-password'
+
+
+def call(application, environ):
+    """
+    Send one request through the WSGI application, returning its status
+    code
+    """
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    response = application(environ, start_response)
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return statuses[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent logins and the product list latency while they run, '
+        'served like one gunicorn gthread worker'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Total login requests')
+        parser.add_argument('--concurrency', type=int, default=32, help='Logins in flight at once')
+        parser.add_argument('--probes', type=int, default=50, help='Product list requests per measurement')
+        parser.add_argument('--threads', type=int, default=4, help="Request threads, like gunicorn's --threads")
+
+    def handle(self, *args, **options):
+        # Every throttled login would log a warning
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        # A file: threads can't share an in-memory SQLite database
+        with benchmark_database(file_backed=True):
+            user = get_user_model().objects.create_user(username=EMAIL, email=EMAIL, password=PASSWORD)
+            token = str(RefreshToken.for_user(user).access_token)
+            results = self.run(WSGIHandler(), token, options)
+
+        self.stdout.write(
+            f"{options['threads']} request threads, LOGIN_HASH_WORKERS={settings.LOGIN_HASH_WORKERS}, "
+            f"LOGIN_HASH_QUEUE={settings.LOGIN_HASH_QUEUE}"
+        )
+        self.stdout.write(f"{'measurement':<28} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, latencies in results['latencies'].items():
+            summary = latency_summary(latencies)
+            self.stdout.write(f"{name:<28} {summary['p50_ms']:8.1f} {summary['p95_ms']:8.1f} {summary['max_ms']:8.1f}")
+        statuses = results['login_statuses']
+        self.stdout.write(
+            f"logins: {statuses.count(200)} succeeded, {statuses.count(429)} throttled, "
+            f"{statuses.count(200) / results['login_wall']:.1f} succeeded/s"
+        )
+
+    def run(self, application, token, options):
+        login_environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': LOGIN_PATH,
+            'CONTENT_TYPE': 'application/json',
+            'HTTP_HOST': 'testserver',
+        }
+        # Lower-cased on purpose: the lookup is case-insensitive
+        login_body = json.dumps({'email': EMAIL.lower(), 'password': PASSWORD}).encode()
+        list_environ = {
+            'PATH_INFO': PRODUCT_LIST_PATH,
+            'QUERY_STRING': PRODUCT_LIST_QUERY,
+            'HTTP_HOST': 'testserver',
+            'HTTP_AUTHORIZATION': f'Bearer {token}',
+        }
+        setup_testing_defaults(list_environ)
+
+        def login():
+            environ = {**login_environ, 'CONTENT_LENGTH': str(len(login_body))}
+            setup_testing_defaults(environ)
+            environ['wsgi.input'].write(login_body)
+            environ['wsgi.input'].seek(0)
+            return call(application, environ)
+
+        # The worker's request threads: requests queue for a free one,
+        # as they do in gunicorn's gthread worker
+        request_threads = ThreadPoolExecutor(max_workers=options['threads'])
+
+        def timed(fn):
+            start = time.perf_counter()
+            status = request_threads.submit(fn).result()
+            return status, time.perf_counter() - start
+
+        def probe():
+            # Sequential product list requests, as a user browsing would send
+            latencies = []
+            for _ in range(options['probes']):
+                status, latency = timed(lambda: call(application, dict(list_environ)))
+                assert status == 200, status
+                latencies.append(latency)
+            return latencies
+
+        try:
+            # Warm up lazy imports and the hashing pool
+            assert timed(login)[0] == 200
+            idle = probe()
+
+            login_statuses = []
+            login_latencies = []
+            lock = threading.Lock()
+
+            def client(count):
+                for _ in range(count):
+                    status, latency = timed(login)
+                    assert status in (200, 429), status
+                    with lock:
+                        login_statuses.append(status)
+                        login_latencies.append(latency)
+
+            per_client, extra = divmod(options['logins'], options['concurrency'])
+            clients = ThreadPoolExecutor(max_workers=options['concurrency'])
+            start = time.perf_counter()
+            running = [clients.submit(client, per_client + (i < extra)) for i in range(options['concurrency'])]
+            busy = probe()
+            for future in running:
+                future.result()
+            login_wall = time.perf_counter() - start
+            clients.shutdown()
+        finally:
+            request_threads.shutdown()
+
+        return {
+            'latencies': {
+                'login': login_latencies,
+                'product list, idle': idle,
+                'product list, during logins': busy,
+            },
+            'login_statuses': login_statuses,
+            'login_wall': login_wall,
+        }
@@ -9,4 +9,47 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
-        return f"{self.user.username}'s profile"
\ No newline at end of file
+        return f"{self.user.username}'s profile"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def _tracked_values(self):
+        return {
+            field.attname: field.get_prep_value(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def get_dirty_fields(self):
+        """
+        Return the names of the fields changed since the profile was
+        loaded, or None for a profile that wasn't loaded from the database
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.attname not in loaded:
+                continue
+            value = getattr(self, field.attname)
+            # A newly assigned upload is a change even if its name matches
+            if not getattr(value, '_committed', True) or field.get_prep_value(value) != loaded[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def save(self, *args, **kwargs):
+        """
+        Only write the fields that changed, and nothing when no field did
+        """
+        dirty = None if self._state.adding or kwargs.get('update_fields') is not None else self.get_dirty_fields()
+        if dirty is not None:
+            if not dirty:
+                return
+            kwargs['update_fields'] = {*dirty, 'updated_at'}
+        super().save(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
\ No newline at end of file
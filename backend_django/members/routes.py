@@ -0,0 +1,22 @@
+from django.urls import path
+from django.utils.module_loading import import_string
+from backend_django.lazy_urls import lazy_path
+
+# (route, view function, URL name)
+ROUTES = [
+    ('register/', 'register_user', 'register'),
+    ('login/', 'user_login', 'login'),
+    ('profile/', 'get_profile', 'get_profile'),
+    ('profile/update/', 'update_profile', 'update_profile'),
+    # other URL patterns
+]
+
+
+def members_urlpatterns(lazy=False):
+    """
+    The members routes; with lazy, members.views is only imported once a
+    request needs it
+    """
+    if lazy:
+        return [lazy_path(route, f'members.views.{view}', name=name) for route, view, name in ROUTES]
+    return [path(route, import_string(f'members.views.{view}'), name=name) for route, view, name in ROUTES]
@@ -5,6 +5,8 @@ from rest_framework import serializers
 from django.core.validators import FileExtensionValidator
 import re
 import os
+from backend_django.image_uploads import UploadedImageField
+from .auth import users_with_email
 User = get_user_model()
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -29,7 +31,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Enter a valid email address.")
         
         # Check if email already exists
-        if User.objects.filter(email=value).exists():
+        if users_with_email(value).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
     
@@ -82,7 +84,7 @@ class ProfileSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='user.first_name')
     last_name = serializers.ReadOnlyField(source='user.last_name')
     bio = serializers.CharField(max_length=2000)
-    profile_picture = serializers.ImageField(
+    profile_picture = UploadedImageField(
         validators=[
             validate_file_size,
             FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif']),
@@ -1,7 +1,8 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
+from .user_cache import invalidate_cached_user
 from .models import Profile
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -16,5 +17,18 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """
     Updates the Profile when User is updated
+
+    Only a profile that was loaded through the user can have been changed
+    on it, and the save is a no-op unless one of its fields did change.
+    """
+    if sender.profile.related.is_cached(instance):
+        instance.profile.save()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_jwt_user(sender, instance, **kwargs):
+    """
+    Drops the user from the JWT authentication cache when it changes
     """
-    instance.profile.save()
\ No newline at end of file
+    invalidate_cached_user(instance.pk)
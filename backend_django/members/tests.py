@@ -1,3 +1,210 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import auth
+from .authentication import CachedJWTAuthentication
+from .user_cache import TTLCache, user_cache
+from .models import Profile
 
-# Create your tests here.
+User = get_user_model()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MembersQueryBudgetTests(TestCase):
+    """
+    Fail when an endpoint starts making more queries than it needs, e.g.
+    an N+1 on the profile's user or a redundant profile write
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='member@example.com', email='member@example.com', password='member-password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_register(self):
+        # Email check, user INSERT, profile INSERT
+        with self.assertNumQueries(3):
+            response = APIClient().post('/api/register/', {
+                'email': 'new@example.com',
+                'first_name': 'New',
+                'last_name': 'Member',
+                'password': 'new-password',
+                'confirm_password': 'new-password',
+            })
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        # One indexed email lookup
+        with self.assertNumQueries(1):
+            response = APIClient().post('/api/login/', {'email': 'MEMBER@example.com', 'password': 'member-password'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_profile(self):
+        # Authentication, then the profile joined with its user
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'member@example.com')
+
+        # The authenticated user is cached now
+        with self.assertNumQueries(1):
+            self.client.get('/api/profile/')
+
+    def test_update_profile(self):
+        # Authentication, profile with user, profile UPDATE
+        with self.assertNumQueries(3):
+            response = self.client.put('/api/profile/update/', {'bio': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Profile.objects.get(user=self.user).bio, 'Hello')
+
+    def test_unchanged_profile_is_not_saved(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Changed'
+        # Only the user UPDATE: the profile wasn't loaded
+        with self.assertNumQueries(1):
+            user.save()
+
+        profile = user.profile
+        # Loaded but unchanged: still only the user UPDATE
+        with self.assertNumQueries(1):
+            user.save()
+
+        profile.bio = 'Changed'
+        with self.assertNumQueries(2):
+            user.save()
+        self.assertEqual(Profile.objects.get(pk=profile.pk).bio, 'Changed')
+
+    @override_settings(UPLOAD_IMAGE_FIELDS={'profile_picture': {'max_size': 1024}})
+    def test_profile_picture_is_checked_while_it_streams_in(self):
+        response = self.client.put('/api/profile/update/', {
+            'bio': 'Hello',
+            'profile_picture': SimpleUploadedFile('me.png', bytes(4096), 'image/png'),
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('profile_picture', response.data)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """
+    Users resolved from JWTs are cached until they change or expire
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='cached@example.com', email='cached@example.com', password='cached-password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_cached_user_skips_the_database(self):
+        authentication = CachedJWTAuthentication()
+        with self.assertNumQueries(1):
+            first = authentication.get_cached_user(self.user.pk)
+        with self.assertNumQueries(0):
+            second = authentication.get_cached_user(self.user.pk)
+        self.assertEqual(second, self.user)
+        # Each request gets its own copy
+        self.assertIsNot(first, second)
+        second.first_name = 'Changed'
+        self.assertEqual(authentication.get_cached_user(self.user.pk).first_name, '')
+
+    def test_saved_user_is_invalidated(self):
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_deleted_user_is_invalidated(self):
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        self.user.delete()
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_not_found')
+
+    @override_settings(JWT_USER_CACHE_ALIAS='default')
+    def test_shared_cache(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.client.get('/api/profile/')
+
+        # Another process: nothing cached locally, the shared cache has it
+        user_cache.clear()
+        authentication = CachedJWTAuthentication()
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.get_cached_user(self.user.pk), self.user)
+
+        self.user.save()
+        with self.assertNumQueries(1):
+            authentication.get_cached_user(self.user.pk)
+
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        with mock.patch('members.user_cache.time.monotonic', return_value=1000):
+            cache.set('a', 1)
+            cache.set('b', 2)
+            cache.set('c', 3)
+            # The least recently used entry made room
+            self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (None, 2, 3))
+        with mock.patch('members.user_cache.time.monotonic', return_value=1061):
+            self.assertIsNone(cache.get('b'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginHashingTests(TestCase):
+    """
+    Logins hash in a bounded pool and are turned away when it is full
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='login@example.com', email='login@example.com', password='login-password')
+
+    def login(self, password='login-password'):
+        return APIClient().post('/api/login/', {'email': 'login@example.com', 'password': password}, format='json')
+
+    def test_wrong_password(self):
+        self.assertEqual(self.login('wrong').status_code, 401)
+
+    @override_settings(LOGIN_HASH_WAIT=0)
+    def test_saturated_pool(self):
+        # Every slot taken by logins of other workers
+        for _ in range(settings.LOGIN_HASH_WORKERS):
+            auth._hash_slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            for _ in range(settings.LOGIN_HASH_WORKERS):
+                auth._hash_slots.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_full_queue(self):
+        with mock.patch.object(auth, '_logins', settings.LOGIN_HASH_WORKERS + settings.LOGIN_HASH_QUEUE):
+            self.assertEqual(self.login().status_code, 429)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ])
+    def test_outdated_hash_is_upgraded_by_the_request(self):
+        self.user.password = make_password('login-password', hasher='scrypt')
+        self.user.save()
+        save = User.save
+        threads = []
+
+        def record_thread(user, *args, **kwargs):
+            threads.append(threading.current_thread())
+            return save(user, *args, **kwargs)
+
+        with mock.patch.object(User, 'save', record_thread):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('md5$'))
+        # Saved by the request thread, not the hashing pool's
+        self.assertEqual(threads, [threading.current_thread()])
@@ -0,0 +1,70 @@
+"""
+The per-process cache of users resolved from JWTs, kept apart from the
+authentication class so members.signals can invalidate it without
+importing simplejwt at startup.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+SHARED_CACHE_KEY = 'jwt-user:{}'
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries also expire after ttl seconds
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+user_cache = TTLCache(settings.JWT_USER_CACHE_SIZE, settings.JWT_USER_CACHE_TTL)
+
+
+def shared_user_cache():
+    alias = settings.JWT_USER_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop a user from this process's cache and the shared cache. Other
+    processes keep their own copy until JWT_USER_CACHE_TTL runs out.
+    """
+    user_cache.delete(str(user_id))
+    shared = shared_user_cache()
+    if shared is not None:
+        shared.delete(SHARED_CACHE_KEY.format(user_id))
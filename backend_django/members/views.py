@@ -9,7 +9,12 @@ from rest_framework.permissions import IsAuthenticated
 from .serializers import *
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import *
-from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from backend_django.image_uploads import image_upload_handlers
+from .auth import LoginThrottled, check_login_password, find_login_user
+import json
 
 User = get_user_model()
 
@@ -46,35 +51,55 @@ def register_user(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
+def login_credentials(request):
+    """
+    Read email and password from a JSON or form-encoded login request
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+    else:
+        data = request.POST
+    return data.get('email'), data.get('password')
+
+
+@csrf_exempt
+@require_POST
 def user_login(request):
     """
     Authenticate a user and set JWT tokens in cookies
+
+    The password hash is checked in the bounded pool from members.auth.
+    When the pool and its short queue are full, the login is answered
+    with a 429 instead of holding a request thread the product endpoints
+    need.
     """
-    email = request.data.get('email')
-    password = request.data.get('password')
+    email, password = login_credentials(request)
     
     if not email or not password:
-        return Response(
+        return JsonResponse(
             {"error": "Please provide both email and password"},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    try:
-        user = User.objects.get(
-            Q(email=email) | Q(username=email)
-        )
-
-    except User.DoesNotExist:
-        return Response(
-            {"error": "Invalid credentials"},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
+    user = find_login_user(email)
     
     # Check password
-    if not user.check_password(password):
-        return Response(
+    try:
+        valid = check_login_password(user, password)
+    except LoginThrottled:
+        response = JsonResponse(
+            {"error": "Too many logins in progress, please try again"},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        response['Retry-After'] = '1'
+        return response
+    if not valid:
+        return JsonResponse(
             {"error": "Invalid credentials"},
             status=status.HTTP_401_UNAUTHORIZED
         )
@@ -84,7 +109,7 @@ def user_login(request):
     access_token = refresh.access_token
     
     # Create response 
-    response = Response(
+    response = JsonResponse(
         {
             "status": "success",
             "message": "Login successful",
@@ -129,12 +154,13 @@ def get_profile(request):
     """
 
     # If no user_id provided, get the authenticated user's profile
-    profile = get_object_or_404(Profile, user=request.user)
+    profile = get_object_or_404(Profile.objects.select_related('user'), user=request.user)
     
     serializer = ProfileSerializer(profile)
     return Response(serializer.data)
 
 
+@image_upload_handlers
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_profile(request):
@@ -142,8 +168,7 @@ def update_profile(request):
     Update a user's profile
     Only bio and profile_picture can be updated
     """
-    print(request.data)
-    profile = get_object_or_404(Profile, user=request.user)
+    profile = get_object_or_404(Profile.objects.select_related('user'), user=request.user)
     
     # Only include bio and profile_picture fields
     update_data = {}
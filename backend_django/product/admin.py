@@ -2,4 +2,5 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 
-admin.site.register(Product)
\ No newline at end of file
+admin.site.register(Product)
+admin.site.register(ProductJob)
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Async versions of the product list, detail, create and delete endpoints,
+served instead of the sync ones when PRODUCT_ASYNC_VIEWS is on (ASGI
+deployments).
+
+DRF has no async views, so async_api_view runs each request through an
+APIView's checks itself, awaiting the JWT authentication. The responses
+are the same as the sync views'. Database access goes through the async ORM; request parsing,
+image validation and storage writes run in worker threads, so one event
+loop can serve many uploads at once.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.views import APIView
+from backend_django.image_uploads import image_upload_handlers
+from .conditional import alist_state, detail_state_for, filtered_products
+from .models import Product as ShopifyProduct
+from .pagination import CreatedAtCursorPagination
+from .serializers import AmazonProductCreateSerializer, ShopifyProductCreateSerializer, ShopifyProductSerializer
+from .views import amazon_product_data, create_context, job_accepted_data
+
+async def aauthenticate(request):
+    """
+    Async Request._authenticate(): the first authenticator returning a
+    user wins. Authenticators without an aauthenticate() run in a thread.
+    """
+    for authenticator in request.authenticators:
+        authenticate = getattr(authenticator, 'aauthenticate', None) or sync_to_async(authenticator.authenticate)
+        try:
+            result = await authenticate(request)
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+        if result is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = result
+            return
+    request._not_authenticated()
+
+
+def async_api_view(methods, parsers=None):
+    """
+    Async @api_view. The request goes through an APIView the way DRF's
+    dispatch() runs it: the configured authentication, permission and
+    throttle classes, the EXCEPTION_HANDLER and the Allow header, with
+    authentication awaited instead of run on the event loop.
+    """
+    def decorator(view):
+        attrs = {'http_method_names': [method.lower() for method in methods]}
+        if parsers is not None:
+            attrs['parser_classes'] = parsers
+        # APIView.allowed_methods lists the handlers the class has
+        attrs.update((method.lower(), view) for method in methods)
+        view_class = type(view.__name__, (APIView,), attrs)
+
+        @csrf_exempt
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            self = view_class()
+            self.args, self.kwargs = args, kwargs
+            drf_request = self.initialize_request(request, *args, **kwargs)
+            self.request = drf_request
+            self.headers = self.default_response_headers
+            try:
+                if request.method.lower() not in self.http_method_names:
+                    raise exceptions.MethodNotAllowed(request.method)
+                await aauthenticate(drf_request)
+                # Permissions and throttles may query the database or cache
+                await sync_to_async(self.initial)(drf_request, *args, **kwargs)
+                response = await view(drf_request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(exc)
+            return self.finalize_response(drf_request, response, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def precondition_response(request, state):
+    """
+    The 304 or 412 response for a conditional request whose resource is
+    in this (etag, last_modified) state, or None to serve it in full
+    """
+    etag, last_modified = state
+    return get_conditional_response(
+        request,
+        etag=quote_etag(etag) if etag else None,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def tag_response(response, state):
+    etag, last_modified = state
+    if etag:
+        response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    return response
+
+
+async def read_data(request):
+    """
+    Parse the request body in a worker thread: multipart parsing spools
+    the uploads to memory or disk
+    """
+    return await sync_to_async(lambda: request.data, thread_sensitive=False)()
+
+
+@async_api_view(['GET'])
+async def get_shopify_product_list(request):
+    """
+    Async get_shopify_product_list, with the same label filter, cursor
+    pagination and conditional GET support
+    """
+    state = await alist_state(request)
+    response = precondition_response(request, state)
+    if response is not None:
+        return response
+
+    products = filtered_products(request)
+    if CreatedAtCursorPagination.is_requested(request):
+        paginator = CreatedAtCursorPagination()
+        page = await paginator.apaginate_queryset(products, request)
+        data = paginator.get_paginated_data(ShopifyProductSerializer(page, many=True).data)
+    else:
+        rows = [product async for product in products.order_by('-created_at', '-pk')]
+        data = ShopifyProductSerializer(rows, many=True).data
+    return tag_response(JsonResponse(data, safe=False), state)
+
+
+@async_api_view(['GET'])
+async def get_shopify_product_detail(request, pk):
+    """
+    Async get_shopify_product_detail; the ETag comes from the loaded row,
+    so a request costs one query
+    """
+    try:
+        product = await ShopifyProduct.objects.aget(pk=pk, is_active=True)
+    except ShopifyProduct.DoesNotExist:
+        return JsonResponse({'error': 'Shopify product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    state = detail_state_for(request, product)
+    response = precondition_response(request, state)
+    if response is not None:
+        return response
+    return tag_response(JsonResponse(ShopifyProductSerializer(product).data), state)
+
+
+async def acreate_product(request, serializer_class, product_data, messages):
+    """
+    Validate an upload and create its product, answering like the sync
+    create views. messages has the 'created', 'queued' and 'reused' texts.
+    """
+    data = await read_data(request)
+    serializer = serializer_class(data=data, context=create_context(request))
+    # Decoding the image to validate it is CPU work
+    if not await sync_to_async(serializer.is_valid, thread_sensitive=False)():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    product = await serializer.asave()
+    if getattr(serializer, 'reused', False):
+        return JsonResponse(product_data(product, messages['reused']), status=status.HTTP_200_OK)
+    job = getattr(serializer, 'job', None)
+    if job:
+        return JsonResponse(job_accepted_data(request, product, job, messages['queued']), status=status.HTTP_202_ACCEPTED)
+    return JsonResponse(product_data(product, messages['created']), status=status.HTTP_201_CREATED)
+
+
+@image_upload_handlers
+@async_api_view(['POST'], parsers=[MultiPartParser, FormParser])
+async def create_shopify_product(request):
+    """
+    Async create_shopify_product
+    """
+    return await acreate_product(
+        request,
+        ShopifyProductCreateSerializer,
+        lambda product, message: {'message': message, 'product': ShopifyProductSerializer(product).data},
+        {
+            'created': 'Shopify product created successfully',
+            'queued': 'Shopify product created, CSV generation queued',
+            'reused': 'An identical image was already uploaded, returning the existing product',
+        },
+    )
+
+
+@image_upload_handlers
+@async_api_view(['POST'], parsers=[MultiPartParser, FormParser])
+async def amazon_product_create(request):
+    """
+    Async amazon_product_create
+    """
+    return await acreate_product(
+        request,
+        AmazonProductCreateSerializer,
+        lambda product, message: {**amazon_product_data(product), 'message': message},
+        {
+            'created': 'Amazon product CSV created successfully',
+            'queued': 'Amazon product created, CSV generation queued',
+            'reused': 'An identical image was already uploaded, returning the existing product',
+        },
+    )
+
+
+async def asoft_delete(pk, message):
+    # One UPDATE; updated_at is set explicitly because update() skips auto_now
+    deleted = await ShopifyProduct.objects.filter(pk=pk).aupdate(is_active=False, updated_at=timezone.now())
+    if not deleted:
+        return JsonResponse({'error': 'Shopify product not found'}, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse({'message': message}, status=status.HTTP_200_OK)
+
+
+@async_api_view(['DELETE'])
+async def delete_shopify_product(request, pk):
+    """
+    Async delete_shopify_product (soft delete)
+    """
+    return await asoft_delete(pk, 'Shopify product deleted successfully')
+
+
+@async_api_view(['DELETE'])
+async def amazon_product_delete(request, pk):
+    """
+    Async amazon_product_delete (soft delete)
+    """
+    return await asoft_delete(pk, 'amazon product deleted successfully')
@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks of the product generation hot paths, run by the
+``benchmark`` management command.
+
+Each benchmark is a function that takes a BenchmarkContext and returns
+the operation to time. The view benchmarks run against a throwaway test
+database and in-memory storage, so nothing touches real data or media.
+"""
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .csv_templates import get_shopify_template, render_amazon_csv
+
+SAMPLE_FILENAME = 'little_cupcake'
+SAMPLE_IMAGE_URL = '/media/product_images/little_cupcake.png'
+
+# Settings every benchmark runs with: in-memory storage and no background
+# work, so a run only measures the request itself
+BENCHMARK_SETTINGS = {
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    'PRODUCT_IMAGE_DERIVATIVES': False,
+    'PRODUCT_CSV_ASYNC': False,
+    'ALLOWED_HOSTS': ['testserver'],
+}
+
+
+def make_png(seed, size=(256, 256)):
+    """
+    Return the bytes of a small PNG that differs for every seed, so
+    uploads aren't deduplicated against each other
+    """
+    image = Image.new('RGB', size, (seed % 256, (seed // 256) % 256, 128))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class BenchmarkContext:
+    """
+    Shared fixtures: an authenticated API client and a supply of
+    distinct PNG uploads
+    """
+
+    def __init__(self):
+        from django.contrib.auth import get_user_model
+
+        user = get_user_model().objects.create_user(
+            username='benchmark@example.com',
+            email='benchmark@example.com',
+            password='benchmark-password',
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self._seed = 0
+
+    def next_upload(self, prefix='design'):
+        self._seed += 1
+        return SimpleUploadedFile(f'{prefix}_{self._seed}.png', make_png(self._seed), content_type='image/png')
+
+
+def shopify_render(context):
+    template = get_shopify_template()
+    return lambda: template.render(SAMPLE_FILENAME, SAMPLE_IMAGE_URL)
+
+
+def amazon_render(context):
+    return lambda: render_amazon_csv(SAMPLE_FILENAME, SAMPLE_IMAGE_URL)
+
+
+def image_upload_validation(context):
+    from .serializers import ShopifyProductCreateSerializer
+
+    data = make_png(0)
+
+    def validate():
+        upload = SimpleUploadedFile('design.png', data, content_type='image/png')
+        serializer = ShopifyProductCreateSerializer(data={'product_image': upload})
+        assert serializer.is_valid(), serializer.errors
+    return validate
+
+
+def shopify_create_view(context):
+    def create():
+        response = context.client.post('/api/shopify-products/create/', {'product_image': context.next_upload()}, format='multipart')
+        assert response.status_code == 201, response.status_code
+    return create
+
+
+def amazon_create_view(context):
+    def create():
+        response = context.client.post('/api/amazon-products/create/', {'product_image': context.next_upload()}, format='multipart')
+        assert response.status_code == 201, response.status_code
+    return create
+
+
+def product_list_view(context):
+    from .models import Product
+
+    Product.objects.bulk_create([
+        Product(product_name=f'Design {i}', product_image=f'product_images/design_{i}.png', sku=f'benchmark-{i}', label='shopify')
+        for i in range(200)
+    ])
+
+    def list_products():
+        response = context.client.get('/api/shopify-products/?page_size=50&label=shopify')
+        assert response.status_code == 200, response.status_code
+    return list_products
+
+
+# name: (benchmark, operations per timing run)
+BENCHMARKS = {
+    'render.shopify': (shopify_render, 2000),
+    'render.amazon': (amazon_render, 2000),
+    'validate.image_upload': (image_upload_validation, 200),
+    'view.shopify_create': (shopify_create_view, 30),
+    'view.amazon_create': (amazon_create_view, 30),
+    'view.product_list': (product_list_view, 50),
+}
+
+
+def measure(operation, number, repeat):
+    """
+    Time an operation and trace one extra call of it.
+
+    Returns a dict with the median time per operation in microseconds,
+    the peak memory traced during one call in KiB and the number of
+    memory blocks that call allocated and kept.
+    """
+    # Warm up caches and lazy imports before measuring
+    operation()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        samples.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        operation()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    return {
+        'us_per_op': statistics.median(samples) * 1e6,
+        'peak_kib': peak / 1024,
+        'allocated_blocks': blocks,
+    }
+
+
+async def run_concurrently(send, total, concurrency):
+    """
+    Await send() total times with at most concurrency calls in flight.
+    Returns (latencies in seconds, wall time in seconds).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def latency_summary(latencies):
+    """
+    p50/p95/max of a list of latencies in seconds, in milliseconds
+    """
+    ordered = sorted(latencies)
+    return {
+        'p50_ms': ordered[len(ordered) // 2] * 1e3,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e3,
+        'max_ms': ordered[-1] * 1e3,
+    }
+
+
+class benchmark_database:
+    """
+    Context manager that runs the body against a throwaway test database
+    with BENCHMARK_SETTINGS applied.
+
+    With file_backed, an SQLite test database is a temporary file instead
+    of shared-cache memory, which locks whole tables and so can't take
+    writes from many threads at once.
+    """
+
+    def __init__(self, file_backed=False):
+        self.file_backed = file_backed
+
+    def __enter__(self):
+        from django.db import connection
+
+        self.settings = override_settings(**BENCHMARK_SETTINGS)
+        self.settings.enable()
+        self.test_settings = dict(connection.settings_dict.get('TEST', {}))
+        if self.file_backed and connection.vendor == 'sqlite':
+            self.directory = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST'] = {**self.test_settings, 'NAME': os.path.join(self.directory.name, 'benchmark.sqlite3')}
+        self.old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    def __exit__(self, *exc_info):
+        from django.db import connection
+
+        connection.creation.destroy_test_db(self.old_name, verbosity=0)
+        connection.settings_dict['TEST'] = self.test_settings
+        if self.file_backed and connection.vendor == 'sqlite':
+            self.directory.cleanup()
+        self.settings.disable()
+
+
+def run_benchmarks(names, repeat=5, scale=1.0):
+    """
+    Run the named benchmarks in a throwaway database and return
+    {name: measurement}
+    """
+    results = {}
+    with benchmark_database():
+        context = BenchmarkContext()
+        for name in names:
+            benchmark, number = BENCHMARKS[name]
+            results[name] = measure(benchmark(context), max(1, int(number * scale)), repeat)
+    return results
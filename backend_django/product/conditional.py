@@ -0,0 +1,105 @@
+import hashlib
+from django.db.models import Count, Max, Q
+from .models import Product
+
+
+def labelled_products(request):
+    """
+    All the products with the label a list request asks for, deactivated
+    ones included
+    """
+    products = Product.objects.all()
+    label = request.query_params.get('label')
+    if label:
+        products = products.filter(label=label)
+    return products
+
+
+def filtered_products(request):
+    """
+    The active products a list request asks for, before ordering and
+    pagination
+    """
+    return labelled_products(request).filter(is_active=True)
+
+
+# Deactivating a product bumps its updated_at, so the newest updated_at
+# of all the label's rows, deactivated ones included, moves on every soft
+# delete. Hard deletes leave no row behind; they change the active count.
+LIST_AGGREGATES = {
+    'last_updated': Max('updated_at'),
+    'count': Count('pk', filter=Q(is_active=True)),
+}
+
+
+def _list_state(request):
+    """
+    Compute (and remember on the request) the ETag of a product list from
+    a single aggregate query, without loading rows.
+
+    Lists have no Last-Modified: a hard-deleted product leaves no date
+    behind to move it forward, so If-Modified-Since would keep getting
+    304s for a list that lost rows. The ETag catches that through the
+    count.
+    """
+    state = getattr(request, '_product_list_state', None)
+    if state is None:
+        aggregate = labelled_products(request).aggregate(**LIST_AGGREGATES)
+        state = request._product_list_state = _list_state_from(request, aggregate)
+    return state
+
+
+async def alist_state(request):
+    """
+    _list_state() for async views
+    """
+    aggregate = await labelled_products(request).aaggregate(**LIST_AGGREGATES)
+    return _list_state_from(request, aggregate)
+
+
+def _list_state_from(request, aggregate):
+    last_updated = aggregate['last_updated']
+    key = '|'.join([
+        str(aggregate['count']),
+        last_updated.isoformat() if last_updated else '',
+        request.query_params.get('label', ''),
+        request.query_params.get('cursor', ''),
+        request.query_params.get('page_size', ''),
+        str(getattr(request, 'accepted_media_type', '')),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest(), None
+
+
+def product_list_etag(request, *args, **kwargs):
+    return _list_state(request)[0]
+
+
+def _detail_state(request, pk):
+    state = getattr(request, '_product_detail_state', None)
+    if state is None:
+        updated_at = Product.objects.filter(pk=pk, is_active=True).values_list('updated_at', flat=True).first()
+        state = request._product_detail_state = _detail_state_from(request, pk, updated_at)
+    return state
+
+
+def _detail_state_from(request, pk, updated_at):
+    if updated_at is None:
+        # Let the view answer with its 404
+        return None, None
+    key = f'{pk}|{updated_at.isoformat()}|{getattr(request, "accepted_media_type", "")}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest(), updated_at
+
+
+def detail_state_for(request, product):
+    """
+    The ETag and Last-Modified of a product the view already loaded
+    """
+    return _detail_state_from(request, product.pk, product.updated_at)
+
+
+def product_detail_etag(request, pk):
+    return _detail_state(request, pk)[0]
+
+
+def product_detail_last_modified(request, pk):
+    return _detail_state(request, pk)[1]
@@ -0,0 +1,359 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from django.conf import settings
+
+# Path to the Shopify CSV template file
+SHOPIFY_TEMPLATE_PATH = os.path.join(settings.BASE_DIR, 'templates', 'Shopify Output Flat File TEMPLATE.csv')
+
+SHOPIFY_HANDLE_SUFFIX = "-baby-boy-girl-clothes-bodysuit-funny-cute"
+SHOPIFY_TITLE_SUFFIX = " - Baby Boy Girl Clothes Bodysuit Funny Cute"
+
+# Predefined static image URLs (for positions 2-5)
+SHOPIFY_STATIC_IMAGE_URLS = [
+    "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/26363115-65e5-4936-b422-aca4c5535ae1-copy.jpg?v=1741427541",
+    "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/a050c7dc-d0d5-4798-acdd-64b5da3cc70c-copy.jpg?v=1741427541",
+    "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/7159a2aa-6595-4f28-8c53-9fe803487504-copy.jpg?v=1741427541",
+    "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/700cea5a-034d-4520-99ee-218911d7e905-copy.jpg?v=1741427541"
+]
+
+# Number of product rows (excluding header) every Shopify CSV contains
+SHOPIFY_ROW_COUNT = 6
+
+HANDLE = 'handle'
+TITLE = 'title'
+IMAGE_SRC = 'image_src'
+
+
+def format_title(base_filename):
+    """
+    Capitalize each word of a filename, treating '_' and '-' as spaces
+    """
+    return ' '.join(word.capitalize() for word in base_filename.replace('_', ' ').replace('-', ' ').split())
+
+
+def shopify_handle(base_filename):
+    # Create handle value with the specified format - remove all spaces
+    return f"{base_filename.replace(' ', '')}{SHOPIFY_HANDLE_SUFFIX}"
+
+
+def shopify_title(base_filename):
+    return f"{format_title(base_filename)}{SHOPIFY_TITLE_SUFFIX}"
+
+
+def encode_csv_field(value):
+    """
+    Encode a single field exactly the way csv.writer would inside a row
+    of more than one field.
+    """
+    if value == '':
+        return ''
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow([value])
+    return buffer.getvalue()
+
+
+class CompiledShopifyTemplate:
+    """
+    The Shopify CSV template parsed once, with column positions resolved
+    and every static cell already CSV-encoded.
+
+    Rendering a product only encodes the cells that change per product
+    (Handle on every row, Title and Image Src on the first row) and joins
+    them with the pre-encoded static chunks.
+    """
+
+    def __init__(self, csv_data, mtime=None):
+        self.mtime = mtime
+        # Set by shopify_fingerprint() on first use
+        self.fingerprint = None
+
+        # Get the header row to find column indices
+        headers = csv_data[0]
+        self.handle_index = headers.index("Handle") if "Handle" in headers else 0
+        self.title_index = headers.index("Title") if "Title" in headers else 1
+        self.image_src_index = headers.index("Image Src") if "Image Src" in headers else 28
+        self.image_position_index = headers.index("Image Position") if "Image Position" in headers else 29
+
+        # Make sure there are at least 6 data rows (excluding header)
+        csv_data = [list(row) for row in csv_data]
+        while len(csv_data) < SHOPIFY_ROW_COUNT + 1:
+            csv_data.append([""] * len(headers))
+
+        # Ensure each product row has enough columns
+        for i in range(1, SHOPIFY_ROW_COUNT + 1):
+            while len(csv_data[i]) < len(headers):
+                csv_data[i].append("")
+
+        # Bake the cells that are the same for every product into the rows:
+        # title only on the first row, static images on rows 2-5
+        for i in range(2, SHOPIFY_ROW_COUNT + 1):
+            csv_data[i][self.title_index] = ""
+        csv_data[1][self.image_position_index] = "1"
+        for i in range(2, 6):
+            if i-2 < len(SHOPIFY_STATIC_IMAGE_URLS):
+                csv_data[i][self.image_src_index] = SHOPIFY_STATIC_IMAGE_URLS[i-2]
+                csv_data[i][self.image_position_index] = str(i)
+
+        # Cells filled per product, as (row, column, value key)
+        slots = [(i, self.handle_index, HANDLE) for i in range(1, SHOPIFY_ROW_COUNT + 1)]
+        slots.append((1, self.title_index, TITLE))
+        slots.append((1, self.image_src_index, IMAGE_SRC))
+
+        self.rows = [tuple(row) for row in csv_data]
+        self.slots = slots
+        self.header = self._compile(csv_data[:1], [])[0]
+        # Slot rows are shifted by one because the header is compiled apart
+        self.chunks = self._compile(csv_data[1:], [(row - 1, column, key) for row, column, key in slots])
+
+    @staticmethod
+    def _compile(csv_data, slots):
+        """
+        Split the encoded template into static text chunks and slot keys,
+        so a render is a single ''.join()
+        """
+        slots_by_row = {}
+        for row, column, key in slots:
+            slots_by_row.setdefault(row, {})[column] = key
+
+        chunks = []
+        static = []
+        for row_index, row in enumerate(csv_data):
+            row_slots = slots_by_row.get(row_index, {})
+            if not row_slots:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerow(row)
+                static.append(buffer.getvalue())
+                continue
+            for column, value in enumerate(row):
+                if column:
+                    static.append(',')
+                if column in row_slots:
+                    chunks.append(''.join(static))
+                    chunks.append(row_slots[column])
+                    static = []
+                else:
+                    static.append(encode_csv_field(value))
+            static.append('\r\n')
+        chunks.append(''.join(static))
+
+        # Even positions are static text, odd positions are slot keys
+        return chunks
+
+    def values_for(self, base_filename, image_url):
+        return {
+            HANDLE: shopify_handle(base_filename),
+            TITLE: shopify_title(base_filename),
+            IMAGE_SRC: image_url,
+        }
+
+    def render_rows(self, base_filename, image_url):
+        """
+        Return the template rows with the product cells filled in
+        """
+        values = self.values_for(base_filename, image_url)
+        csv_data = [list(row) for row in self.rows]
+        for row, column, key in self.slots:
+            csv_data[row][column] = values[key]
+        return csv_data
+
+    def render(self, base_filename, image_url):
+        """
+        Return the CSV text for a product, identical to writing
+        render_rows() through csv.writer
+        """
+        return self.header + self.render_body(base_filename, image_url)
+
+    def render_body(self, base_filename, image_url):
+        """
+        Return the CSV text of a product's rows without the header, used
+        to concatenate many products into one import file
+        """
+        values = self.values_for(base_filename, image_url)
+        encoded = {key: encode_csv_field(value) for key, value in values.items()}
+        chunks = self.chunks
+        parts = []
+        for i, chunk in enumerate(chunks):
+            parts.append(encoded[chunk] if i % 2 else chunk)
+        return ''.join(parts)
+
+
+_shopify_template = None
+_shopify_template_lock = threading.Lock()
+
+
+def load_shopify_template(path=SHOPIFY_TEMPLATE_PATH):
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, 'r', encoding='utf-8') as f:
+        csv_data = list(csv.reader(f))
+    return CompiledShopifyTemplate(csv_data, mtime=mtime)
+
+
+def get_shopify_template():
+    """
+    Return the process-wide compiled Shopify template, recompiling it
+    only when the template file's mtime changes.
+
+    Raises FileNotFoundError if the template file is missing.
+    """
+    global _shopify_template
+    mtime = os.stat(SHOPIFY_TEMPLATE_PATH).st_mtime_ns
+    template = _shopify_template
+    if template is not None and template.mtime == mtime:
+        return template
+    with _shopify_template_lock:
+        if _shopify_template is None or _shopify_template.mtime != mtime:
+            _shopify_template = load_shopify_template()
+        return _shopify_template
+
+
+AMAZON_COLUMNS = ['item_sku', 'item_name', 'parent_child', 'parent_sku', 'main_image_url']
+AMAZON_TITLE_SUFFIX = " - Baby Boy Girl Clothes Bodysuit Funny"
+
+# Placeholder in the flat file that is replaced with the product image URL
+AMAZON_MAIN_IMAGE_PLACEHOLDER = "main_image"
+
+# The child variants listed under every parent product
+AMAZON_VARIANTS = [
+    "Newborn White Short Sleeve",
+    "Newborn White Long Sleeve",
+    "Newborn Natural Short Sleeve",
+    "0-3M White Short Sleeve",
+    "0-3M White Long Sleeve",
+    "0-3M Pink Short Sleeve",
+    "0-3M Blue Short Sleeve",
+    "3-6M White Short Sleeve",
+    "3-6M White Long Sleeve",
+    "3-6M Blue Short Sleeve",
+    "3-6M Pink Short Sleeve",
+    "6M Natural Short Sleeve",
+    "6-9M White Short Sleeve",
+    "6-9M White Long Sleeve",
+    "6-9M Pink Short Sleeve",
+    "6-9M Blue Short Sleeve",
+    "12M White Short Sleeve",
+    "12M White Long Sleeve",
+    "12M Natural Short Sleeve",
+    "12M Pink Short Sleeve",
+    "12M Blue Short Sleeve",
+    "18M White Short Sleeve",
+    "18M White Long Sleeve",
+    "18M Natural Short Sleeve",
+    "24M White Short Sleeve",
+    "24M White Long Sleeve",
+    "24M Natural Short Sleeve"
+]
+
+# Variant names with the spaces removed, as used in the item SKUs
+_AMAZON_VARIANT_SKUS = [''.join(variant.split()) for variant in AMAZON_VARIANTS]
+
+
+def amazon_rows(user_text, image_url=AMAZON_MAIN_IMAGE_PLACEHOLDER):
+    """
+    Yield the Amazon flat-file rows (without the header) for a product.
+
+    Parameters:
+    user_text (str): The base text for product SKUs (e.g., "littlecupcake")
+    image_url (str): The value of the main_image_url column
+    """
+    # Format the user text
+    user_text_title = user_text.title()  # First letter capitalized
+    item_name = f"{user_text.upper()}{AMAZON_TITLE_SUFFIX}"
+    parent_sku = f"{user_text_title}-Parent"
+
+    yield (parent_sku, item_name, "Parent", "", image_url)
+    for variant_sku in _AMAZON_VARIANT_SKUS:
+        yield (f"{user_text_title}-{variant_sku}", item_name, "Child", parent_sku, image_url)
+
+
+def render_amazon_csv(user_text, image_url):
+    """
+    Return the Amazon flat-file CSV text for a product.
+
+    The output is byte-identical to the previous pandas
+    DataFrame.to_csv(index=False) rendering, which ends lines with
+    os.linesep.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator=os.linesep)
+    writer.writerow(AMAZON_COLUMNS)
+    writer.writerows(amazon_rows(user_text, image_url))
+    return buffer.getvalue()
+
+
+# Bump when the rendering code changes in a way the fingerprinted inputs
+# below don't capture, so every stored CSV counts as outdated
+CSV_GENERATOR_VERSION = 1
+
+
+def fingerprint(*inputs):
+    return hashlib.sha256(json.dumps([CSV_GENERATOR_VERSION, *inputs]).encode('utf-8')).hexdigest()
+
+
+def shopify_fingerprint():
+    """
+    Fingerprint of everything a Shopify CSV is rendered from: the compiled
+    template (which holds the static image URLs) and the suffixes. Hashed
+    once per compiled template, since every create records it.
+    """
+    template = get_shopify_template()
+    if template.fingerprint is None:
+        template.fingerprint = fingerprint(
+            'shopify', template.header, template.chunks, SHOPIFY_HANDLE_SUFFIX, SHOPIFY_TITLE_SUFFIX
+        )
+    return template.fingerprint
+
+
+AMAZON_FINGERPRINT = fingerprint(
+    'amazon', AMAZON_COLUMNS, AMAZON_TITLE_SUFFIX, AMAZON_MAIN_IMAGE_PLACEHOLDER, AMAZON_VARIANTS, os.linesep
+)
+
+
+def amazon_fingerprint():
+    return AMAZON_FINGERPRINT
+
+
+CSV_FINGERPRINTS = {
+    'shopify': shopify_fingerprint,
+    'amazon': amazon_fingerprint,
+}
+
+# csv_fingerprint() results by (label fingerprint, XLSX copy)
+_csv_fingerprints = {}
+
+
+def csv_fingerprint(label):
+    """
+    The current generator fingerprint of a label's CSVs; a stored CSV with
+    another fingerprint is outdated. It also changes when the label starts
+    or stops getting an XLSX copy (PRODUCT_EXCEL_LABELS).
+    """
+    label_fingerprint = CSV_FINGERPRINTS[label]()
+    with_excel = label in settings.PRODUCT_EXCEL_LABELS
+    key = (label_fingerprint, with_excel)
+    result = _csv_fingerprints.get(key)
+    if result is None:
+        result = _csv_fingerprints[key] = fingerprint(label_fingerprint, with_excel)
+    return result
+
+
+def product_rows(label, base_filename, image_url):
+    """
+    The rows of a product's marketplace file, header first, for writers
+    other than the CSV renderers (XLSX)
+    """
+    if label == 'shopify':
+        return get_shopify_template().render_rows(base_filename, image_url)
+    return [AMAZON_COLUMNS, *amazon_rows(base_filename, image_url)]
+
+
+def render_csv(label, base_filename, image_url):
+    """
+    The marketplace CSV text of a product of a label
+    """
+    if label == 'shopify':
+        return get_shopify_template().render(base_filename, image_url)
+    return render_amazon_csv(base_filename, image_url)
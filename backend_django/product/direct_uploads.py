@@ -0,0 +1,99 @@
+"""
+Direct-to-storage product image uploads.
+
+Instead of posting the image to a create endpoint, the client
+
+1. asks /api/uploads/presign/ for a presigned upload of one image,
+2. uploads the file straight to object storage with it, and
+3. calls /api/uploads/finalize/ with the upload token it was given, which
+   creates the product from the stored object and renders its CSV.
+
+The app only ever handles metadata: it presigns, checks the object's size
+and reads the first few KiB to check it is an image. Requires a storage
+backend with presigned_upload() and read_head(), i.e. MEDIA_STORAGE=s3.
+"""
+import os
+import uuid
+from django.conf import settings
+from django.core import signing
+from backend_django.image_uploads import IMAGE_HEAD_SIZE, ImageHeaderError, read_image_header
+from .models import Product
+
+TOKEN_SALT = 'product.direct_uploads'
+
+# Content types a presigned upload can be made for, and the Pillow formats
+# they must turn out to be
+CONTENT_TYPE_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/webp': 'WEBP',
+    'image/gif': 'GIF',
+}
+
+
+def image_storage():
+    return Product._meta.get_field('product_image').storage
+
+
+def supports_direct_uploads(storage=None):
+    storage = storage or image_storage()
+    return hasattr(storage, 'presigned_upload') and hasattr(storage, 'read_head')
+
+
+def new_upload(user, filename, content_type, label):
+    """
+    Presign the upload of one product image and return (presigned POST,
+    upload token). Every upload gets its own key under product_images/.
+    """
+    upload_id = str(uuid.uuid4())
+    storage = image_storage()
+    name = f"product_images/{upload_id}/{storage.get_valid_name(os.path.basename(filename))}"
+    presigned = storage.presigned_upload(
+        name,
+        content_type,
+        settings.PRODUCT_DIRECT_UPLOAD_MAX_SIZE,
+        settings.PRODUCT_DIRECT_UPLOAD_EXPIRES,
+    )
+    token = signing.dumps(
+        {'id': upload_id, 'name': name, 'filename': filename, 'content_type': content_type, 'label': label, 'user': user.pk},
+        salt=TOKEN_SALT,
+    )
+    return presigned, token
+
+
+def read_upload_token(token, user):
+    """
+    The upload a token was issued for, or None if it is invalid, expired
+    or was issued to another user
+    """
+    try:
+        upload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.PRODUCT_DIRECT_UPLOAD_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if upload['user'] != user.pk:
+        return None
+    return upload
+
+
+def check_uploaded_image(upload):
+    """
+    Check the stored object of an upload without downloading it. Returns
+    an error message, or None if it is an image of the announced type.
+    """
+    storage = image_storage()
+    try:
+        size = storage.size(upload['name'])
+    except FileNotFoundError:
+        return 'Nothing has been uploaded for this token yet'
+    # The presigned POST already limits the size; not every S3 stand-in
+    # enforces that
+    if size > settings.PRODUCT_DIRECT_UPLOAD_MAX_SIZE:
+        return f'The image is larger than {settings.PRODUCT_DIRECT_UPLOAD_MAX_SIZE} bytes'
+
+    try:
+        image_format, size = read_image_header(storage.read_head(upload['name'], IMAGE_HEAD_SIZE))
+    except ImageHeaderError as e:
+        return str(e)
+    if image_format != CONTENT_TYPE_FORMATS[upload['content_type']]:
+        return f"The uploaded file is not a {upload['content_type']} image"
+    return None
@@ -0,0 +1,100 @@
+import csv
+import io
+import os
+from .csv_templates import AMAZON_COLUMNS, amazon_rows, get_shopify_template
+from .models import Product
+from .xlsx import iter_xlsx
+
+EXPORT_LABELS = ('shopify', 'amazon')
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_CHUNK_SIZE = 500
+
+
+def export_queryset(label):
+    """
+    The active products of a label in a stable export order, loading only
+    the columns the renderers need
+    """
+    return (
+        Product.objects
+        .filter(is_active=True, label=label)
+        .order_by('created_at', 'pk')
+        .only('pk', 'product_image', 'marketplace_image', 'base_filename')
+    )
+
+
+def iter_shopify_export(products, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one Shopify import file for many products: the template header
+    once, then every product's rows
+    """
+    template = get_shopify_template()
+    yield template.header
+    for product in products.iterator(chunk_size=chunk_size):
+        yield template.render_body(product.base_filename, product.marketplace_image_url())
+
+
+def iter_amazon_export(products, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one Amazon flat file for many products: the column header once,
+    then the parent and variant rows of every product
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator=os.linesep)
+    writer.writerow(AMAZON_COLUMNS)
+    for product in products.iterator(chunk_size=chunk_size):
+        writer.writerows(amazon_rows(product.base_filename, product.marketplace_image_url()))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when there are no products
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    'shopify': iter_shopify_export,
+    'amazon': iter_amazon_export,
+}
+
+
+def iter_export(label, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the combined import file of every active product of a label as
+    text chunks, holding one product at a time in memory
+    """
+    return EXPORTERS[label](export_queryset(label), chunk_size=chunk_size)
+
+
+def iter_shopify_rows(products, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the rows of the combined Shopify import file: the template
+    header once, then every product's rows
+    """
+    template = get_shopify_template()
+    yield template.rows[0]
+    for product in products.iterator(chunk_size=chunk_size):
+        yield from template.render_rows(product.base_filename, product.marketplace_image_url())[1:]
+
+
+def iter_amazon_rows(products, chunk_size=EXPORT_CHUNK_SIZE):
+    yield AMAZON_COLUMNS
+    for product in products.iterator(chunk_size=chunk_size):
+        yield from amazon_rows(product.base_filename, product.marketplace_image_url())
+
+
+ROW_EXPORTERS = {
+    'shopify': iter_shopify_rows,
+    'amazon': iter_amazon_rows,
+}
+
+
+def iter_xlsx_export(label, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the combined import file of every active product of a label as
+    an XLSX workbook, in compressed chunks; like iter_export() only a
+    block of rows is held in memory
+    """
+    rows = ROW_EXPORTERS[label](export_queryset(label), chunk_size=chunk_size)
+    return iter_xlsx(rows, sheet_name=label)
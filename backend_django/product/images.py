@@ -0,0 +1,131 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from .jobs import get_executor
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# The Product field each rendition is stored in
+RENDITION_FIELDS = {
+    'marketplace': 'marketplace_image',
+    'thumbnail': 'thumbnail_image',
+}
+
+RENDITION_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'WEBP': 'webp',
+}
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    Return the process pool that does the Pillow work, so resizing never
+    holds the GIL of a web worker
+    """
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn instead of fork: forking a threaded web worker is unsafe
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=settings.PRODUCT_IMAGE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _process_pool
+
+
+def store_renditions(product, renditions):
+    """
+    Save rendition bytes next to the original image and set the fields,
+    without saving the product
+    """
+    stem = os.path.splitext(os.path.basename(product.product_image.name))[0]
+    for name, data in renditions.items():
+        spec = settings.PRODUCT_IMAGE_RENDITIONS[name]
+        extension = RENDITION_EXTENSIONS[spec['format']]
+        getattr(product, RENDITION_FIELDS[name]).save(f"{stem}_{name}.{extension}", ContentFile(data), save=False)
+
+
+def store_renditions_for(product):
+    """
+    Resize a product's image in the process pool and store the
+    renditions, without saving the product. Returns the updated fields.
+    """
+    with product.product_image.open('rb') as f:
+        data = f.read()
+
+    # Pillow is only needed here and in the pool, so requests that never
+    # store renditions don't pay for importing it
+    from .renditions import render_renditions
+
+    renditions = get_process_pool().submit(render_renditions, data, settings.PRODUCT_IMAGE_RENDITIONS).result()
+    store_renditions(product, renditions)
+    return [RENDITION_FIELDS[name] for name in renditions]
+
+
+def generate_derivatives(product_id, force=False):
+    """
+    Render and store the renditions of a product's image, then re-render
+    its CSV so it points at the marketplace rendition. The CSV is
+    rewritten in place, so the URL the create response returned stays
+    valid.
+
+    Products that already have renditions (e.g. shared from an identical
+    upload) are left alone unless force is set.
+    """
+    # Imported here because the serializers enqueue derivatives
+    from .serializers import CREATE_SERIALIZERS_BY_LABEL
+
+    product = Product.objects.get(pk=product_id)
+    if product.marketplace_image and not force:
+        return product
+    update_fields = store_renditions_for(product) + ['updated_at']
+
+    # A product still waiting for its CSV job gets the renditions from that job
+    if product.csv_file:
+        CREATE_SERIALIZERS_BY_LABEL[product.label]().rewrite_csv(product)
+        update_fields += ['csv_fingerprint', 'excel_file']
+
+    product.save(update_fields=update_fields)
+    return product
+
+
+def _generate_in_thread(product_id):
+    try:
+        generate_derivatives(product_id)
+    except Exception:
+        logger.exception('Image derivatives for product %s failed', product_id)
+    finally:
+        connection.close()
+
+
+def enqueue_derivatives(product_ids):
+    """
+    Generate the renditions of these products off the request path, once
+    the current transaction commits
+    """
+    if not settings.PRODUCT_IMAGE_DERIVATIVES:
+        return
+    transaction.on_commit(lambda: submit_derivatives(product_ids))
+
+
+def submit_derivatives(product_ids):
+    """
+    Hand committed products to the worker pool for their renditions. Async
+    views call this directly: they run in autocommit, so the rows are
+    already committed.
+    """
+    if not settings.PRODUCT_IMAGE_DERIVATIVES:
+        return
+    executor = get_executor()
+    for product_id in product_ids:
+        executor.submit(_generate_in_thread, product_id)
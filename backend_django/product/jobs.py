@@ -0,0 +1,182 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ProductJob
+
+logger = logging.getLogger(__name__)
+
+STALE_JOB_ERROR = 'The worker running this job stopped before it finished'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the process-wide thread pool that runs queued CSV jobs
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PRODUCT_JOB_WORKERS,
+                    thread_name_prefix='product-job',
+                )
+    return _executor
+
+
+def enqueue_csv_job(product, base_filename):
+    """
+    Queue the CSV rendering for a saved product and return the job.
+
+    The job row is the queue: it is picked up by the in-process worker
+    pool once the transaction commits (if PRODUCT_JOB_RUN_IN_PROCESS is
+    on) or by the process_product_jobs management command.
+    """
+    job = ProductJob.objects.create(product=product, base_filename=base_filename)
+    if settings.PRODUCT_JOB_RUN_IN_PROCESS:
+        transaction.on_commit(lambda: get_executor().submit(_run_job_in_thread, job.pk))
+    return job
+
+
+def enqueue_csv_jobs(products, batch_size=1000):
+    """
+    Queue CSV jobs for every product of a queryset, skipping products that
+    already have a pending job. The products are read with one query and
+    the jobs inserted in batches. Returns the number of jobs queued.
+    """
+    pending = ProductJob.objects.filter(status=ProductJob.STATUS_PENDING).values('product_id')
+    rows = products.exclude(pk__in=pending).values_list('pk', 'base_filename')
+    jobs = ProductJob.objects.bulk_create(
+        [ProductJob(product_id=pk, base_filename=base_filename) for pk, base_filename in rows],
+        batch_size=batch_size,
+    )
+    # Backends that can't return the inserted ids leave the jobs to the
+    # process_product_jobs command
+    job_ids = [job.pk for job in jobs if job.pk]
+    if settings.PRODUCT_JOB_RUN_IN_PROCESS and job_ids:
+        transaction.on_commit(lambda: submit_jobs(job_ids))
+    return len(jobs)
+
+
+def submit_jobs(job_ids):
+    executor = get_executor()
+    for job_id in job_ids:
+        executor.submit(_run_job_in_thread, job_id)
+
+
+def claim_job(job_id):
+    """
+    Atomically move a pending job to running. Returns False if another
+    worker already took it.
+    """
+    return ProductJob.objects.filter(pk=job_id, status=ProductJob.STATUS_PENDING).update(
+        status=ProductJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def run_job(job_id):
+    """
+    Render and attach the CSV for a queued job.
+
+    Returns the job's final status, or None if the job was not pending.
+    """
+    # Imported here because the serializers enqueue jobs
+    from .images import store_renditions_for
+    from .serializers import CREATE_SERIALIZERS_BY_LABEL
+
+    if not claim_job(job_id):
+        return None
+
+    job = ProductJob.objects.select_related('product').get(pk=job_id)
+    product = job.product
+    try:
+        update_fields = ['csv_file', 'csv_fingerprint', 'excel_file', 'updated_at']
+        # Resize first so the CSV can point at the marketplace rendition
+        if settings.PRODUCT_IMAGE_DERIVATIVES and not product.marketplace_image:
+            update_fields += store_renditions_for(product)
+        serializer = CREATE_SERIALIZERS_BY_LABEL[product.label]()
+        serializer.attach_csv(product, job.base_filename)
+        product.save(update_fields=update_fields)
+    except Exception as e:
+        job.status = ProductJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.status = ProductJob.STATUS_DONE
+        job.error = ''
+    job.finished_at = timezone.now()
+    # Unless the job was reclaimed as stale meanwhile: its new run owns it
+    ProductJob.objects.filter(pk=job.pk, status=ProductJob.STATUS_RUNNING, attempts=job.attempts).update(
+        status=job.status,
+        error=job.error,
+        finished_at=job.finished_at,
+    )
+    return job.status
+
+
+def _run_job_in_thread(job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception('Product job %s crashed', job_id)
+    finally:
+        # Each pool thread has its own connection; don't leave it open
+        connection.close()
+
+
+def pending_job_ids(limit=None):
+    job_ids = ProductJob.objects.filter(status=ProductJob.STATUS_PENDING).order_by('created_at', 'pk').values_list('pk', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+    return list(job_ids)
+
+
+def reclaim_stale_jobs(jobs=None):
+    """
+    Queue running jobs whose lease (PRODUCT_JOB_LEASE_SECONDS) ran out
+    again, e.g. because their web worker was recycled mid-job; jobs that
+    used up PRODUCT_JOB_MAX_ATTEMPTS fail instead. jobs narrows the
+    queryset looked at. Returns the ids of the requeued jobs and the
+    number of failed ones.
+    """
+    jobs = ProductJob.objects.all() if jobs is None else jobs
+    now = timezone.now()
+    stale = jobs.filter(
+        status=ProductJob.STATUS_RUNNING,
+        started_at__lt=now - timedelta(seconds=settings.PRODUCT_JOB_LEASE_SECONDS),
+    )
+    job_ids = list(stale.filter(attempts__lt=settings.PRODUCT_JOB_MAX_ATTEMPTS).values_list('pk', flat=True))
+    if job_ids:
+        # Only those still stale: a job finishing meanwhile keeps its result
+        stale.filter(pk__in=job_ids).update(status=ProductJob.STATUS_PENDING, error=STALE_JOB_ERROR)
+    failed = stale.filter(attempts__gte=settings.PRODUCT_JOB_MAX_ATTEMPTS).update(
+        status=ProductJob.STATUS_FAILED,
+        error=STALE_JOB_ERROR,
+        finished_at=now,
+    )
+    return job_ids, failed
+
+
+def resume_stale_job(job):
+    """
+    Reclaim a job whose status is polled if its lease ran out, and run it
+    again in this process with PRODUCT_JOB_RUN_IN_PROCESS. A pending job
+    older than the lease is submitted again too, as the worker it was
+    queued in may be gone. Returns the job, refreshed if it changed.
+    """
+    job_ids, failed = reclaim_stale_jobs(ProductJob.objects.filter(pk=job.pk))
+    if job_ids or failed:
+        job.refresh_from_db()
+    lost = job.created_at < timezone.now() - timedelta(seconds=settings.PRODUCT_JOB_LEASE_SECONDS)
+    if settings.PRODUCT_JOB_RUN_IN_PROCESS and job.status == ProductJob.STATUS_PENDING and (job_ids or lost):
+        # Submitting twice is harmless, only one run can claim the job
+        submit_jobs([job.pk])
+    return job
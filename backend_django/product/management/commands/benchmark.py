@@ -0,0 +1,67 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from product.benchmarks import BENCHMARKS, run_benchmarks
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+
+# Measurements compared against the baseline
+CHECKED_METRICS = ('us_per_op', 'peak_kib')
+
+
+class Command(BaseCommand):
+    help = 'Run the product hot path benchmarks and compare them with the stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='Only run these benchmarks')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing runs per benchmark, the median is reported')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiply the operations per run by this factor')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown or memory growth, 0.25 = 25%%')
+
+    def handle(self, *args, **options):
+        names = options['only'] or list(BENCHMARKS)
+        results = run_benchmarks(names, repeat=options['repeat'], scale=options['scale'])
+
+        baseline = {}
+        if os.path.exists(options['baseline']) and not options['save_baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        regressions = []
+        self.stdout.write(f"{'benchmark':<24} {'us/op':>12} {'peak KiB':>10} {'blocks':>8}  vs baseline")
+        for name in names:
+            result = results[name]
+            comparison = ''
+            if name in baseline:
+                changes = []
+                for metric in CHECKED_METRICS:
+                    before = baseline[name][metric]
+                    change = (result[metric] - before) / before if before else 0.0
+                    changes.append(f'{metric} {change:+.0%}')
+                    if change > options['tolerance']:
+                        regressions.append(f'{name}: {metric} {before:.1f} -> {result[metric]:.1f} ({change:+.0%})')
+                comparison = ', '.join(changes)
+            self.stdout.write(
+                f"{name:<24} {result['us_per_op']:12.1f} {result['peak_kib']:10.1f} {result['allocated_blocks']:8d}  {comparison}"
+            )
+
+        if options['save_baseline']:
+            # Keep the entries of benchmarks that weren't run this time
+            stored = {}
+            if os.path.exists(options['baseline']):
+                with open(options['baseline']) as f:
+                    stored = json.load(f)
+            stored.update(results)
+            with open(options['baseline'], 'w') as f:
+                json.dump(stored, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['baseline']}"))
+            return
+
+        if regressions:
+            raise CommandError('Benchmarks regressed beyond the tolerance:\n' + '\n'.join(regressions))
+        if baseline:
+            self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+import types
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.urls import include, path
+from rest_framework_simplejwt.tokens import RefreshToken
+from product.benchmarks import BenchmarkContext, benchmark_database, latency_summary, run_concurrently
+from product.routes import product_urlpatterns
+
+CREATE_PATH = '/api/shopify-products/create/'
+LIST_PATH = '/api/shopify-products/'
+LIST_QUERY = b'page_size=50'
+
+
+def product_urlconf(async_endpoints):
+    urlconf = types.ModuleType(f"benchmark_urls_{'async' if async_endpoints else 'sync'}")
+    urlconf.urlpatterns = [path('api/', include(product_urlpatterns(async_endpoints)))]
+    return urlconf
+
+
+class SlowClient:
+    """
+    Sends one request straight to an ASGI application, trickling the body
+    in chunks with a pause between them like a client on a slow link
+    """
+
+    def __init__(self, application, token):
+        self.application = application
+        self.token = token
+
+    async def request(self, method, path, body=b'', content_type=None, query_string=b'', chunks=1, pause=0.0):
+        headers = [
+            (b'host', b'testserver'),
+            (b'authorization', f'Bearer {self.token}'.encode('ascii')),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ]
+        if content_type:
+            headers.append((b'content-type', content_type.encode('ascii')))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode('ascii'),
+            'query_string': query_string,
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+
+        size = max(1, -(-len(body) // chunks))
+        parts = [body[i:i + size] for i in range(0, len(body), size)] or [b'']
+        finished = asyncio.Event()
+        status = []
+
+        async def receive():
+            if parts:
+                part = parts.pop(0)
+                if pause:
+                    await asyncio.sleep(pause)
+                return {'type': 'http.request', 'body': part, 'more_body': bool(parts)}
+            # The client stays connected until the response is complete
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await self.application(scope, receive, send)
+        return status[0]
+
+
+class ThreadSampler:
+    """
+    Record the largest number of live threads while running
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = threading.active_count()
+
+    async def run(self, stop):
+        while not stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(self.interval)
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync and async product endpoints serving many concurrent slow uploads under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=100, help='Upload requests per run')
+        parser.add_argument('--concurrency', type=int, default=50, help='Uploads in flight at once')
+        parser.add_argument('--chunks', type=int, default=8, help='Chunks each upload body is sent in')
+        parser.add_argument('--pause', type=float, default=0.02, help='Seconds between upload chunks')
+        parser.add_argument('--lists', type=int, default=50, help='Product list requests sent alongside the uploads')
+
+    def handle(self, *args, **options):
+        with benchmark_database(file_backed=True):
+            context = BenchmarkContext()
+            token = str(RefreshToken.for_user(get_user_model().objects.get()).access_token)
+            rows = []
+            for async_endpoints in (False, True):
+                with override_settings(ROOT_URLCONF=product_urlconf(async_endpoints)):
+                    result = asyncio.run(self.run(ASGIHandler(), token, context, options))
+                rows.append(('async' if async_endpoints else 'sync', result))
+
+        self.stdout.write(
+            f"{'views':<6} {'uploads/s':>9} {'upload p50':>10} {'upload p95':>10} {'list p50':>9} {'list p95':>9} {'threads':>8} {'errors':>7}"
+        )
+        for name, result in rows:
+            uploads = latency_summary(result['uploads'])
+            lists = latency_summary(result['lists'])
+            self.stdout.write(
+                f"{name:<6} {options['uploads'] / result['wall']:9.1f} {uploads['p50_ms']:10.1f} {uploads['p95_ms']:10.1f} "
+                f"{lists['p50_ms']:9.1f} {lists['p95_ms']:9.1f} {result['peak_threads']:8d} {result['errors']:7d}"
+            )
+        self.stdout.write('Latencies in ms; threads is the peak number of live threads during the run')
+
+    async def run(self, application, token, context, options):
+        client = SlowClient(application, token)
+        errors = []
+
+        async def upload():
+            body = encode_multipart(BOUNDARY, {'product_image': context.next_upload()})
+            status = await client.request(
+                'POST', CREATE_PATH, body, MULTIPART_CONTENT,
+                chunks=options['chunks'], pause=options['pause'],
+            )
+            if status != 201:
+                errors.append(status)
+
+        async def list_products():
+            status = await client.request('GET', LIST_PATH, query_string=LIST_QUERY)
+            if status != 200:
+                errors.append(status)
+
+        # Warm up imports, the template cache and the URL resolver
+        await upload()
+        await list_products()
+        errors.clear()
+
+        sampler = ThreadSampler()
+        stop = asyncio.Event()
+        sampling = asyncio.create_task(sampler.run(stop))
+        start = time.perf_counter()
+        (upload_latencies, _), (list_latencies, _) = await asyncio.gather(
+            run_concurrently(upload, options['uploads'], options['concurrency']),
+            run_concurrently(list_products, options['lists'], 1),
+        )
+        wall = time.perf_counter() - start
+        stop.set()
+        await sampling
+        return {
+            'uploads': upload_latencies,
+            'lists': list_latencies,
+            'wall': wall,
+            'peak_threads': sampler.peak,
+            'errors': len(errors),
+        }
@@ -0,0 +1,108 @@
+import time
+from wsgiref.util import setup_testing_defaults
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from rest_framework_simplejwt.tokens import RefreshToken
+from product.benchmarks import BenchmarkContext, benchmark_database, latency_summary, product_list_view
+
+LIST_PATH = '/api/shopify-products/'
+LIST_QUERY = 'page_size=50&label=shopify'
+
+
+def connection_modes():
+    """
+    (name, CONN_MAX_AGE, pool options) for the modes the configured
+    database supports
+    """
+    modes = [
+        ('new connection per request', 0, None),
+        ('persistent (CONN_MAX_AGE=600)', 600, None),
+    ]
+    if connection.vendor == 'postgresql':
+        pool = connection.settings_dict['OPTIONS'].get('pool') or {'min_size': 2, 'max_size': 10}
+        modes.append(('psycopg pool', 0, pool))
+    return modes
+
+
+class Command(BaseCommand):
+    help = 'Measure how much of a request goes to connecting to the database, for each connection mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Product list requests per mode')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            # Same fixtures as the view.product_list benchmark
+            product_list_view(BenchmarkContext())
+            token = str(RefreshToken.for_user(get_user_model().objects.get()).access_token)
+
+            # The real handler: unlike the test client, it closes or keeps
+            # connections at the end of each request per CONN_MAX_AGE
+            application = WSGIHandler()
+            settings_dict = connection.settings_dict
+            saved = settings_dict['CONN_MAX_AGE'], settings_dict['OPTIONS'].get('pool')
+            rows = []
+            try:
+                for name, max_age, pool in connection_modes():
+                    self.use_mode(max_age, pool)
+                    rows.append((name, self.run(application, token, options['requests'])))
+            finally:
+                self.use_mode(*saved)
+
+        self.stdout.write(f"Database: {connection.vendor}, {options['requests']} sequential requests per mode")
+        self.stdout.write(f"{'mode':<30} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'set up':>7}")
+        for name, (latencies, connects) in rows:
+            summary = latency_summary(latencies)
+            self.stdout.write(
+                f"{name:<30} {summary['p50_ms']:8.2f} {summary['p95_ms']:8.2f} {summary['max_ms']:8.2f} {connects:7d}"
+            )
+        self.stdout.write('set up: connections Django initialised; in pool mode that is a cheap checkout from the pool')
+        if connection.vendor == 'sqlite':
+            self.stdout.write('SQLite test databases are kept in memory and never reconnect; run against PostgreSQL (DATABASE_URL)')
+
+    def use_mode(self, max_age, pool):
+        connection.close()
+        if connection.vendor == 'postgresql':
+            connection.close_pool()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        if pool:
+            connection.settings_dict['OPTIONS']['pool'] = pool
+        else:
+            connection.settings_dict['OPTIONS'].pop('pool', None)
+
+    def run(self, application, token, requests):
+        connects = []
+
+        def count_connect(**kwargs):
+            connects.append(kwargs['connection'].alias)
+
+        def start_response(status, headers, exc_info=None):
+            assert status.startswith('200'), status
+
+        environ = {
+            'PATH_INFO': LIST_PATH,
+            'QUERY_STRING': LIST_QUERY,
+            'HTTP_HOST': 'testserver',
+            'HTTP_AUTHORIZATION': f'Bearer {token}',
+        }
+        setup_testing_defaults(environ)
+        # Warm up imports, caches and, in pool mode, the pool itself
+        response = application(dict(environ), start_response)
+        b''.join(response)
+        response.close()
+
+        connection_created.connect(count_connect)
+        latencies = []
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = application(dict(environ), start_response)
+                b''.join(response)
+                response.close()
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection_created.disconnect(count_connect)
+        return latencies, len(connects)
@@ -0,0 +1,140 @@
+import csv
+import io
+import os
+from django.core.management.base import BaseCommand
+from product.benchmarks import SAMPLE_FILENAME, SAMPLE_IMAGE_URL, measure
+from product.csv_templates import (
+    AMAZON_VARIANTS,
+    SHOPIFY_STATIC_IMAGE_URLS,
+    SHOPIFY_TEMPLATE_PATH,
+    get_shopify_template,
+    render_amazon_csv,
+    shopify_handle,
+    shopify_title,
+)
+
+
+def render_shopify_uncached(base_filename, image_url):
+    """
+    The per-request render used before the template was compiled:
+    reopen and parse the template and resolve the columns every time.
+    """
+    with open(SHOPIFY_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        csv_data = list(csv.reader(f))
+
+    headers = csv_data[0]
+    handle_index = headers.index("Handle") if "Handle" in headers else 0
+    title_index = headers.index("Title") if "Title" in headers else 1
+    image_src_index = headers.index("Image Src") if "Image Src" in headers else 28
+    image_position_index = headers.index("Image Position") if "Image Position" in headers else 29
+
+    while len(csv_data) < 7:
+        csv_data.append([""] * len(headers))
+    for i in range(1, 7):
+        while len(csv_data[i]) < len(headers):
+            csv_data[i].append("")
+        csv_data[i][handle_index] = shopify_handle(base_filename)
+    csv_data[1][title_index] = shopify_title(base_filename)
+    for i in range(2, 7):
+        csv_data[i][title_index] = ""
+    csv_data[1][image_src_index] = image_url
+    csv_data[1][image_position_index] = "1"
+    for i in range(2, 6):
+        if i-2 < len(SHOPIFY_STATIC_IMAGE_URLS):
+            csv_data[i][image_src_index] = SHOPIFY_STATIC_IMAGE_URLS[i-2]
+            csv_data[i][image_position_index] = str(i)
+
+    csv_buffer = io.StringIO()
+    csv_writer = csv.writer(csv_buffer)
+    for row in csv_data:
+        csv_writer.writerow(row)
+    return csv_buffer.getvalue()
+
+
+def render_shopify_compiled(base_filename, image_url):
+    return get_shopify_template().render(base_filename, image_url)
+
+
+def render_amazon_pandas(base_filename, image_url):
+    """
+    The Amazon render used before the pandas-free writer: build a
+    DataFrame, replace the image placeholder and call to_csv.
+    """
+    import pandas as pd
+
+    user_text_capital = base_filename.upper()
+    user_text_title = base_filename.title()
+    item_sku = [f"{user_text_title}-Parent"]
+    item_name = [f"{user_text_capital} - Baby Boy Girl Clothes Bodysuit Funny"]
+    parent_child = ["Parent"]
+    parent_sku = [""]
+    main_image_url = ["main_image"]
+    for variant in AMAZON_VARIANTS:
+        variant_no_space = ''.join(variant.split())
+        item_sku.append(f"{user_text_title}-{variant_no_space}")
+        item_name.append(f"{user_text_capital} - Baby Boy Girl Clothes Bodysuit Funny")
+        parent_child.append("Child")
+        parent_sku.append(f"{user_text_title}-Parent")
+        main_image_url.append("main_image")
+    df = pd.DataFrame({
+        'item_sku': item_sku,
+        'item_name': item_name,
+        'parent_child': parent_child,
+        'parent_sku': parent_sku,
+        'main_image_url': main_image_url
+    })
+    df['main_image_url'] = df['main_image_url'].replace("main_image", image_url)
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False)
+    return csv_buffer.getvalue()
+
+
+def render_amazon_streamed(base_filename, image_url):
+    return render_amazon_csv(base_filename, image_url)
+
+
+# Groups of implementations that must produce the same bytes; the first
+# one of each group is the baseline
+BENCHMARKS = {
+    'shopify': [
+        ('shopify (uncached)', render_shopify_uncached),
+        ('shopify (compiled)', render_shopify_compiled),
+    ],
+    'amazon': [
+        ('amazon (pandas)', render_amazon_pandas),
+        ('amazon (csv writer)', render_amazon_streamed),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the per-request cost of rendering the product CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help='Renders per timing run')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing runs, the median is reported')
+        parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='Only run these groups')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        repeat = options['repeat']
+
+        self.stdout.write(f'template: {os.path.basename(SHOPIFY_TEMPLATE_PATH)}')
+        self.stdout.write(f'{number} renders x {repeat} runs (median run reported)')
+        self.stdout.write(f"{'implementation':<24} {'us/render':>10} {'peak KiB':>10} {'blocks':>8}")
+        for group in options['only'] or BENCHMARKS:
+            cases = BENCHMARKS[group]
+
+            # Every implementation must produce the same bytes
+            expected = cases[0][1](SAMPLE_FILENAME, SAMPLE_IMAGE_URL)
+            for name, func in cases[1:]:
+                if func(SAMPLE_FILENAME, SAMPLE_IMAGE_URL) != expected:
+                    self.stderr.write(self.style.ERROR(f'{name} output differs from {cases[0][0]}'))
+                    return
+
+            for name, func in cases:
+                # Timed the same way as the render benchmarks of the benchmark command
+                result = measure(lambda: func(SAMPLE_FILENAME, SAMPLE_IMAGE_URL), number, repeat)
+                self.stdout.write(
+                    f"{name:<24} {result['us_per_op']:10.2f} {result['peak_kib']:10.1f} {result['allocated_blocks']:8d}"
+                )
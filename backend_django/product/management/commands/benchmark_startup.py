@@ -0,0 +1,105 @@
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# The WSGI applications a cold process can start from, as module:attribute
+ENTRY_POINTS = {
+    'wsgi': 'backend_django.wsgi:application',
+    'serverless': 'vercel_app:app',
+}
+
+# Run in a fresh interpreter: import the entry point's WSGI application
+# and send it one request, the way a new serverless instance answers its
+# first caller. Reports the time until the app was loaded, the time until
+# the response was complete, peak RSS and the response status.
+STARTUP_SCRIPT = """
+import os, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {base_dir!r})
+from importlib import import_module
+application = getattr(import_module({module!r}), {attribute!r})
+for module in {extra_modules!r}:
+    __import__(module)
+loaded = time.perf_counter() - start
+
+from wsgiref.util import setup_testing_defaults
+environ = {{'PATH_INFO': {path!r}, 'HTTP_HOST': 'localhost'}}
+setup_testing_defaults(environ)
+status = []
+response = application(environ, lambda line, headers, exc_info=None: status.append(line))
+b''.join(response)
+response.close()
+answered = time.perf_counter() - start
+print(loaded, answered, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'pandas' in sys.modules, status[0].split()[0])
+"""
+
+
+def startup_command(entry='wsgi', extra_modules=(), path='/api/shopify-products/', python_options=()):
+    """
+    The command line that runs STARTUP_SCRIPT for an entry point
+    """
+    module, attribute = ENTRY_POINTS[entry].split(':')
+    script = STARTUP_SCRIPT.format(
+        base_dir=str(settings.BASE_DIR),
+        module=module,
+        attribute=attribute,
+        extra_modules=list(extra_modules),
+        path=path,
+    )
+    return [sys.executable, *python_options, '-c', script]
+
+
+def startup_environment():
+    # Each entry point picks its own settings module
+    return {key: value for key, value in os.environ.items() if key != 'DJANGO_SETTINGS_MODULE'}
+
+
+def measure_startup(entry='wsgi', extra_modules=(), path='/api/shopify-products/'):
+    """
+    Start a new interpreter and return (seconds until the app is loaded,
+    seconds until the first response, peak RSS in KiB, whether pandas was
+    imported, response status)
+    """
+    output = subprocess.run(
+        startup_command(entry, extra_modules, path),
+        env=startup_environment(),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[0]), float(output[1]), int(output[2]), output[3] == 'True', output[4]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the cold start of a worker: loading the app and answering its first request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Interpreters started per case')
+        parser.add_argument(
+            '--path', default='/api/shopify-products/',
+            help='Path of the first request (unauthenticated, so API routes answer 401)',
+        )
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        cases = [
+            ('wsgi', 'wsgi', ()),
+            # What every worker paid when the serializers imported pandas
+            ('wsgi + pandas', 'wsgi', ('pandas',)),
+            ('serverless', 'serverless', ()),
+        ]
+
+        self.stdout.write(f"{runs} cold starts per case, first request GET {options['path']} (medians reported)")
+        self.stdout.write(f"{'entry':<16} {'loaded':>9} {'answered':>9} {'peak RSS':>10}  status  pandas")
+        for name, entry, extra_modules in cases:
+            samples = [measure_startup(entry, extra_modules, options['path']) for _ in range(runs)]
+            loaded = statistics.median(sample[0] for sample in samples)
+            answered = statistics.median(sample[1] for sample in samples)
+            rss = statistics.median(sample[2] for sample in samples)
+            self.stdout.write(
+                f'{name:<16} {loaded * 1000:6.1f} ms {answered * 1000:6.1f} ms {rss / 1024:6.1f} MiB'
+                f'  {samples[0][4]:>6}  {"yes" if samples[0][3] else "no"}'
+            )
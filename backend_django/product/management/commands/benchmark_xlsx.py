@@ -0,0 +1,88 @@
+import io
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from product.csv_templates import AMAZON_COLUMNS, amazon_rows, get_shopify_template
+from product.xlsx import iter_xlsx
+
+SAMPLE_IMAGE_URL = '/media/product_images/little_cupcake.png'
+
+
+def catalogue_rows(label, products):
+    """
+    Header and rows of a combined import file of synthetic products, the
+    same rows the XLSX exports write
+    """
+    if label == 'shopify':
+        template = get_shopify_template()
+        yield template.rows[0]
+        for i in range(products):
+            yield from template.render_rows(f'design_{i}', SAMPLE_IMAGE_URL)[1:]
+    else:
+        yield AMAZON_COLUMNS
+        for i in range(products):
+            yield from amazon_rows(f'design_{i}', SAMPLE_IMAGE_URL)
+
+
+def write_pandas(label, products):
+    """
+    The baseline: the whole sheet as a DataFrame, written by to_excel
+    """
+    import pandas as pd
+
+    rows = catalogue_rows(label, products)
+    header = next(rows)
+    buffer = io.BytesIO()
+    pd.DataFrame(list(rows), columns=header).to_excel(buffer, index=False)
+    return buffer.getbuffer().nbytes
+
+
+def write_streaming(label, products):
+    # Chunks are dropped as they come, as when streamed to a response or file
+    return sum(len(chunk) for chunk in iter_xlsx(catalogue_rows(label, products), sheet_name=label))
+
+
+WRITERS = [
+    ('pandas to_excel', write_pandas),
+    ('streaming writer', write_streaming),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the time and peak memory of writing XLSX marketplace files with pandas and the streaming writer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', choices=['amazon', 'shopify'], default='amazon')
+        parser.add_argument('--products', type=int, nargs='*', default=[1, 1000, 10000], help='Catalogue sizes to write')
+
+    def handle(self, *args, **options):
+        label = options['label']
+        # Warm up imports and caches so the first size isn't charged for them
+        for name, writer in WRITERS:
+            try:
+                writer(label, 1)
+            except ImportError:
+                pass
+
+        self.stdout.write(f"{label}: {'products':>8} {'rows':>8} {'writer':<18} {'ms':>9} {'peak MiB':>9} {'KiB':>8}")
+        for products in options['products']:
+            rows = sum(1 for _ in catalogue_rows(label, products))
+            for name, writer in WRITERS:
+                try:
+                    start = time.perf_counter()
+                    size = writer(label, products)
+                    elapsed = time.perf_counter() - start
+                except ImportError as e:
+                    self.stdout.write(f'{name}: skipped, {e}')
+                    continue
+
+                # Separate run: tracing allocations slows the writers down
+                tracemalloc.start()
+                try:
+                    writer(label, products)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.stdout.write(
+                    f"{'':7} {products:>8} {rows:>8} {name:<18} {elapsed * 1000:9.1f} {peak / 2**20:9.2f} {size / 1024:8.0f}"
+                )
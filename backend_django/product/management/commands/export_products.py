@@ -0,0 +1,37 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from product.exports import EXPORT_CHUNK_SIZE, EXPORT_LABELS, iter_export, iter_xlsx_export
+
+
+class Command(BaseCommand):
+    help = 'Write one combined marketplace import file of all active products of a label'
+
+    def add_arguments(self, parser):
+        parser.add_argument('label', choices=EXPORT_LABELS)
+        parser.add_argument('--output', '-o', help='File to write, stdout if omitted')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows fetched per database round trip')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help='File format, xlsx needs --output')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'xlsx':
+            return self.export_xlsx(options)
+
+        chunks = iter_export(options['label'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+
+        # newline='' keeps the line endings the renderers produced
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['label']} products to {options['output']}"))
+
+    def export_xlsx(self, options):
+        if not options['output']:
+            raise CommandError('--format xlsx writes a binary workbook, give an --output file')
+        with open(options['output'], 'wb') as f:
+            for chunk in iter_xlsx_export(options['label'], chunk_size=options['chunk_size']):
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['label']} products to {options['output']}"))
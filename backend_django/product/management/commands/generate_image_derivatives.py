@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from product.images import generate_derivatives
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized marketplace and thumbnail renditions of product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate renditions that already exist too')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many products')
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(is_active=True).order_by('pk')
+        if not options['all']:
+            products = products.filter(marketplace_image__in=['', None])
+        product_ids = list(products.values_list('pk', flat=True)[:options['limit']])
+
+        failed = 0
+        for product_id in product_ids:
+            try:
+                generate_derivatives(product_id, force=options['all'])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Product {product_id}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {len(product_ids) - failed} products, {failed} failed'
+        ))
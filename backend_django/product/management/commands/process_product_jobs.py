@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from product.jobs import pending_job_ids, reclaim_stale_jobs, run_job
+from product.models import ProductJob
+
+
+def run_job_and_close(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Drain the queue of pending product CSV jobs, after queueing stale running ones again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many jobs')
+        parser.add_argument('--workers', type=int, default=1, help='Number of jobs run in parallel')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue failed jobs again before draining')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        workers = options['workers']
+
+        # Jobs whose worker died while running them
+        requeued, failed = reclaim_stale_jobs()
+        if requeued or failed:
+            self.stdout.write(f'Queued {len(requeued)} stale running jobs again, {failed} out of attempts failed')
+
+        if options['retry_failed']:
+            retried = ProductJob.objects.filter(status=ProductJob.STATUS_FAILED).update(status=ProductJob.STATUS_PENDING)
+            self.stdout.write(f'Queued {retried} failed jobs again')
+
+        counts = {ProductJob.STATUS_DONE: 0, ProductJob.STATUS_FAILED: 0}
+        processed = 0
+        while limit is None or processed < limit:
+            batch_size = 100 if limit is None else min(100, limit - processed)
+            job_ids = pending_job_ids(batch_size)
+            if not job_ids:
+                break
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    statuses = list(executor.map(run_job_and_close, job_ids))
+            else:
+                statuses = [run_job(job_id) for job_id in job_ids]
+            for job_status in statuses:
+                # None means another worker claimed the job first
+                if job_status is not None:
+                    counts[job_status] += 1
+            processed += len(job_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {counts[ProductJob.STATUS_DONE] + counts[ProductJob.STATUS_FAILED]} jobs: '
+            f'{counts[ProductJob.STATUS_DONE]} done, {counts[ProductJob.STATUS_FAILED]} failed'
+        ))
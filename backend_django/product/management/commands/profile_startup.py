@@ -0,0 +1,85 @@
+import re
+import subprocess
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from .benchmark_startup import ENTRY_POINTS, startup_command, startup_environment
+
+# One line of `python -X importtime` output:
+# "import time: <self us> | <cumulative us> | <indent><module>"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def parse_importtime(lines):
+    """
+    Parse -X importtime output into a list of (module, self us, cumulative
+    us, importer) in import order. importer is the module whose import
+    caused this one, or None for imports made at the top level.
+    """
+    imports = []
+    # The output is post-order: a module's line comes after its children's,
+    # so children wait here until the line of the module one level up
+    pending = defaultdict(list)
+    for line in lines:
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        depth = len(indent) // 2
+        entry = [module, int(self_us), int(cumulative_us), None]
+        for child in pending.pop(depth + 1, ()):
+            child[3] = module
+        pending[depth].append(entry)
+        imports.append(entry)
+    return [tuple(entry) for entry in imports]
+
+
+def import_chain(module, importers):
+    chain = [module]
+    while importers.get(chain[-1]) and len(chain) < 6:
+        chain.append(importers[chain[-1]])
+    return ' <- '.join(chain)
+
+
+class Command(BaseCommand):
+    help = 'Report what a cold start spends importing, per module and per top-level package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=sorted(ENTRY_POINTS), default='wsgi', help='Entry point to profile')
+        parser.add_argument(
+            '--path', default='/api/shopify-products/',
+            help='Path of the first request; imports it triggers are included',
+        )
+        parser.add_argument('--top', type=int, default=20, help='Modules and packages listed')
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            startup_command(options['entry'], path=options['path'], python_options=['-X', 'importtime']),
+            env=startup_environment(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        loaded, answered = (float(value) for value in result.stdout.split()[:2])
+        imports = parse_importtime(result.stderr.splitlines())
+        importers = {module: importer for module, _, _, importer in imports}
+        top = options['top']
+
+        total = sum(self_us for _, self_us, _, _ in imports)
+        self.stdout.write(
+            f"{options['entry']}: loaded in {loaded * 1000:.1f} ms, answered GET {options['path']} in "
+            f"{answered * 1000:.1f} ms; {len(imports)} modules imported in {total / 1000:.1f} ms "
+            '(timings include the profiling overhead)'
+        )
+
+        # Self times add up without counting anything twice
+        packages = defaultdict(int)
+        for module, self_us, _, _ in imports:
+            packages[module.partition('.')[0]] += self_us
+        self.stdout.write(f'\nTop {top} packages by import time')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'{self_us / 1000:8.1f} ms  {package}')
+
+        # Cumulative times overlap, but show which import pulled a package in
+        self.stdout.write(f'\nTop {top} modules by cumulative import time (module <- imported by)')
+        for module, _, cumulative_us, _ in sorted(imports, key=lambda entry: -entry[2])[:top]:
+            self.stdout.write(f'{cumulative_us / 1000:8.1f} ms  {import_chain(module, importers)}')
@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from product.csv_templates import CSV_FINGERPRINTS, csv_fingerprint
+from product.regeneration import outdated_products, regenerate_outdated
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-render the stored marketplace CSVs whose template, suffixes or variants changed. '
+        'Run it again to resume an interrupted run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', choices=sorted(CSV_FINGERPRINTS), help='Only regenerate this label')
+        parser.add_argument('--batch-size', type=int, default=200, help='Products rendered per worker task')
+        parser.add_argument('--workers', type=int, default=None, help='Render processes, 0 to render in this process (default: CPU count - 1)')
+        parser.add_argument('--rate', type=float, default=None, help='Regenerate at most this many products per second')
+        parser.add_argument('--limit', type=int, default=None, help='Regenerate at most this many products per label')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the outdated products')
+
+    def handle(self, *args, **options):
+        labels = [options['label']] if options['label'] else sorted(CSV_FINGERPRINTS)
+        for label in labels:
+            outdated = outdated_products(label, csv_fingerprint(label)).count()
+            self.stdout.write(f'{label}: {outdated} outdated CSVs')
+            if options['dry_run'] or not outdated:
+                continue
+
+            started = time.monotonic()
+
+            def progress(regenerated, failed):
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'  {regenerated + failed}/{outdated} done, {failed} failed, {regenerated / elapsed:.0f}/s')
+
+            regenerated, failed = regenerate_outdated(
+                label,
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                rate=options['rate'],
+                limit=options['limit'],
+                progress=progress,
+            )
+            style = self.style.SUCCESS if not failed else self.style.WARNING
+            self.stdout.write(style(
+                f'{label}: regenerated {regenerated} CSVs in {time.monotonic() - started:.1f}s, {failed} failed'
+            ))
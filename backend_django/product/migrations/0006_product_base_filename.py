@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+import csv
+import io
+import re
+
+from django.db import migrations, models
+
+# The suffixes the create serializers appended when these products were made
+SHOPIFY_HANDLE_SUFFIX = '-baby-boy-girl-clothes-bodysuit-funny-cute'
+SHOPIFY_TITLE_SUFFIX = ' - Baby Boy Girl Clothes Bodysuit Funny Cute'
+AMAZON_TITLE_SUFFIX = ' - Baby Boy Girl Clothes Bodysuit Funny'
+
+
+def first_row(csv_file):
+    """
+    The header and first data row of a stored CSV, or None if it can't be
+    read
+    """
+    try:
+        with csv_file.open('rb') as f:
+            rows = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+            return next(rows), next(rows)
+    except (OSError, StopIteration, UnicodeDecodeError, ValueError):
+        return None
+
+
+def shopify_base_filename(handle, title):
+    """
+    Rebuild a base filename from a Shopify handle, which is the filename
+    without its spaces, and title, whose words are the filename's words
+    split on spaces, '_' and '-'
+    """
+    handle = handle.removesuffix(SHOPIFY_HANDLE_SUFFIX)
+    base = ''
+    for i, word in enumerate(title.removesuffix(SHOPIFY_TITLE_SUFFIX).lower().split()):
+        separator = re.match(r'[_-]*', handle).group()
+        if not handle[len(separator):].startswith(word):
+            return None
+        # Words the handle runs together were separated by spaces
+        base += separator or (' ' if i else '')
+        base += word
+        handle = handle[len(separator) + len(word):]
+    return base if base and not handle else None
+
+
+def csv_base_filename(csv_file):
+    """
+    The base filename a stored CSV was rendered from: the Amazon item_name
+    is the filename in capitals, the Shopify handle and title give it back
+    together
+    """
+    row = first_row(csv_file)
+    if row is None:
+        return None
+    header, values = row
+    values = dict(zip(header, values))
+    if values.get('item_name', '').endswith(AMAZON_TITLE_SUFFIX):
+        return values['item_name'].removesuffix(AMAZON_TITLE_SUFFIX).lower() or None
+    if values.get('Handle', '').endswith(SHOPIFY_HANDLE_SUFFIX) and values.get('Title'):
+        return shopify_base_filename(values['Handle'], values['Title'])
+    return None
+
+
+def backfill_base_filename(apps, schema_editor):
+    """
+    Recover each product's base filename from its stored CSV, falling back
+    to its title. The CSV file name can't be used: storage replaced the
+    spaces and dropped the punctuation in it.
+    """
+    Product = apps.get_model('product', 'Product')
+    products = Product.objects.filter(base_filename='').only('pk', 'csv_file', 'product_name')
+    for product in products.iterator(chunk_size=500):
+        base_filename = csv_base_filename(product.csv_file) if product.csv_file else None
+        if base_filename is None:
+            base_filename = product.product_name
+            for suffix in (SHOPIFY_TITLE_SUFFIX, AMAZON_TITLE_SUFFIX):
+                base_filename = base_filename.removesuffix(suffix)
+            base_filename = base_filename.lower()
+        Product.objects.filter(pk=product.pk).update(base_filename=base_filename)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='base_filename',
+            field=models.CharField(blank=True, default='', max_length=250),
+        ),
+        migrations.RunPython(backfill_base_filename, migrations.RunPython.noop),
+    ]
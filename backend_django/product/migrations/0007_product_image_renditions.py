@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_product_base_filename'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='marketplace_image',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_image',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_product_image_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='csv_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -7,6 +7,11 @@ def generate_uuid():
 class Product(models.Model):
     product_name = models.CharField(max_length=250)
     product_image = models.ImageField(upload_to='product_images/')
+    # Resized renditions of product_image, generated in the background
+    marketplace_image = models.ImageField(upload_to='product_images/', null=True, blank=True)
+    thumbnail_image = models.ImageField(upload_to='product_images/', null=True, blank=True)
+    # SHA-256 of the uploaded image, used to reuse identical uploads
+    image_sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)
     sku = models.CharField(max_length=100, unique=True, default=generate_uuid)
     csv_file = models.FileField(upload_to='product_csv_files/')
     # Add this new field for Amazon Excel files
@@ -15,3 +20,53 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)    
     is_active = models.BooleanField(default=True)
     label = models.CharField(max_length=100, default='')
+    # Lowercased upload filename without extension, the input the CSVs
+    # are rendered from
+    base_filename = models.CharField(max_length=250, blank=True, default='')
+    # Fingerprint of the generator inputs csv_file was rendered with; the
+    # regenerate_csvs command re-renders CSVs whose fingerprint is outdated
+    csv_fingerprint = models.CharField(max_length=64, blank=True, default='')
+
+    def marketplace_image_url(self):
+        """
+        The image URL the marketplace CSVs point at: the optimized
+        rendition once it exists, the original upload until then
+        """
+        if self.marketplace_image:
+            return self.marketplace_image.url
+        return self.product_image.url
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the active product list, with and
+            # without a label filter
+            models.Index(fields=['is_active', 'label', 'created_at', 'id'], name='product_active_label_created'),
+            models.Index(fields=['is_active', 'created_at', 'id'], name='product_active_created'),
+        ]
+
+
+class ProductJob(models.Model):
+    """
+    A queued request to render and attach a product's CSV file outside
+    the upload request.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='jobs')
+    # The uploaded image's filename without extension, used to render the CSV
+    base_filename = models.CharField(max_length=250)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
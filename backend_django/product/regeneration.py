@@ -0,0 +1,182 @@
+"""
+Re-render stored marketplace CSVs whose generator inputs changed.
+
+Every product records the fingerprint of the template, suffixes and
+variants its CSV was rendered with (csv_templates.csv_fingerprint).
+regenerate_outdated() walks the products of a label whose fingerprint is
+not the current one in primary key order; a process pool renders the
+new CSVs (and XLSX copies) batch by batch over the stored files, keeping
+their names so URLs already handed out stay valid, and this process marks
+the rows current, one transaction per batch. A product is only marked
+current once its new CSV is written, so an interrupted run is resumed by
+running it again.
+"""
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .csv_templates import csv_fingerprint, format_title
+from .models import Product, ProductJob
+from .regeneration_worker import render_and_store_csvs
+from .serializers import CREATE_SERIALIZERS_BY_LABEL
+
+
+def outdated_products(label, fingerprint):
+    """
+    Active products of a label with a stored CSV rendered from other
+    inputs. Products with a queued or running CSV job are left to it.
+    """
+    busy = ProductJob.objects.filter(
+        status__in=[ProductJob.STATUS_PENDING, ProductJob.STATUS_RUNNING]
+    ).values('product_id')
+    return (
+        Product.objects
+        .filter(label=label, is_active=True)
+        .exclude(csv_fingerprint=fingerprint)
+        .exclude(Q(csv_file='') | Q(base_filename=''))
+        .exclude(pk__in=busy)
+        .order_by('pk')
+        .only('pk', 'label', 'base_filename', 'product_image', 'marketplace_image', 'csv_file', 'excel_file')
+    )
+
+
+def rendered_image_filter(product):
+    """
+    Filter matching the product only while its CSV still points at the
+    image it was rendered for
+    """
+    if product.marketplace_image:
+        return Q(marketplace_image=product.marketplace_image.name)
+    return Q(marketplace_image__isnull=True) | Q(marketplace_image='')
+
+
+def save_regenerated(label, products, fingerprint, results):
+    """
+    Mark a batch of products whose CSVs (and XLSX copies) were rewritten
+    in place as current, in one transaction.
+
+    A product whose renditions were stored meanwhile may have had the
+    CSV they wrote overwritten with the old image URL, so it is rendered
+    again from its current row. Returns (regenerated, failed).
+    """
+    title_suffix = CREATE_SERIALIZERS_BY_LABEL[label].title_suffix
+    storage = Product._meta.get_field('excel_file').storage
+    now = timezone.now()
+    regenerated = 0
+    changed = []
+    with transaction.atomic():
+        for product, excel_name in zip(products, results):
+            if excel_name is False:
+                continue
+            current = Product.objects.filter(rendered_image_filter(product), pk=product.pk, csv_file=product.csv_file.name)
+            updated = current.update(
+                excel_file=excel_name,
+                csv_fingerprint=fingerprint,
+                product_name=f"{format_title(product.base_filename)}{title_suffix}",
+                updated_at=now,
+            )
+            if updated:
+                regenerated += 1
+            else:
+                if excel_name and not product.excel_file:
+                    # A new XLSX copy the row never pointed at
+                    storage.delete(excel_name)
+                changed.append(product.pk)
+
+    for product in Product.objects.filter(pk__in=changed, is_active=True).exclude(csv_file=''):
+        try:
+            CREATE_SERIALIZERS_BY_LABEL[label]().rewrite_csv(product)
+        except Exception:
+            continue
+        product.product_name = f"{format_title(product.base_filename)}{title_suffix}"
+        product.save(update_fields=['csv_fingerprint', 'excel_file', 'product_name', 'updated_at'])
+        regenerated += 1
+    return regenerated, len(products) - regenerated
+
+
+def completed(fn, *args):
+    """
+    A finished Future of fn(*args), to render in this process
+    """
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def regenerate_outdated(label, batch_size=200, workers=None, rate=None, limit=None, progress=None):
+    """
+    Regenerate the outdated CSVs of a label. Batches are rendered and
+    stored by a pool of worker processes (this process with workers=0,
+    the default on a single core) while this one updates the rows of
+    earlier batches; rate caps the products per second. progress is called
+    with the running (regenerated, failed) totals after each batch.
+    """
+    if workers is None:
+        # One core is left to this process
+        workers = (os.cpu_count() or 1) - 1
+    fingerprint = csv_fingerprint(label)
+    products = outdated_products(label, fingerprint)
+    excel_upload_to = None
+    if label in settings.PRODUCT_EXCEL_LABELS:
+        excel_upload_to = Product._meta.get_field('excel_file').upload_to
+    regenerated = failed = fetched = 0
+    cursor = 0
+    started = time.monotonic()
+
+    pool = None
+    submit = completed
+    if workers:
+        # spawn like the image pool: forking a process with threads is unsafe
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        submit = pool.submit
+    try:
+        in_flight = deque()
+        exhausted = False
+        while True:
+            # Keep every worker busy while this process updates the rows
+            while not exhausted and len(in_flight) < max(workers, 1) * 2:
+                size = batch_size if limit is None else min(batch_size, limit - fetched)
+                batch = list(products.filter(pk__gt=cursor)[:size]) if size > 0 else []
+                if not batch:
+                    exhausted = True
+                    break
+                cursor = batch[-1].pk
+                fetched += len(batch)
+                inputs = [
+                    (product.base_filename, product.marketplace_image_url(), product.csv_file.name, product.excel_file.name or None)
+                    for product in batch
+                ]
+                in_flight.append((batch, submit(render_and_store_csvs, label, inputs, excel_upload_to)))
+            if not in_flight:
+                break
+
+            batch, result = in_flight.popleft()
+            try:
+                rendered_fingerprint, results = result.result()
+            except Exception:
+                # Still outdated, so the next run retries them
+                failed += len(batch)
+            else:
+                done, errors = save_regenerated(label, batch, rendered_fingerprint, results)
+                regenerated += done
+                failed += errors
+            if progress:
+                progress(regenerated, failed)
+
+            if rate:
+                # Spread the writes out instead of bursting at pool speed
+                delay = started + (regenerated + failed) / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return regenerated, failed
@@ -0,0 +1,67 @@
+"""
+CSV and XLSX rendering and storing for the regenerate_csvs process pool.
+
+This module runs inside the pool's worker processes, so it must not
+import Django models: they would need django.setup() in every worker.
+Settings and the default storage are fine.
+"""
+import posixpath
+import uuid
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .csv_templates import csv_fingerprint, get_shopify_template, product_rows, render_amazon_csv
+from .xlsx import render_xlsx
+
+
+def render_csvs(label, products):
+    """
+    The CSV texts of many products of a label, from (base_filename,
+    image_url, ...) tuples
+    """
+    if label == 'shopify':
+        template = get_shopify_template()
+        return [template.render(base_filename, image_url) for base_filename, image_url, *_ in products]
+    return [render_amazon_csv(base_filename, image_url) for base_filename, image_url, *_ in products]
+
+
+def overwrite(name, content):
+    """
+    Replace the content of a stored file, keeping its name
+    """
+    with default_storage.open(name, 'wb') as f:
+        f.write(content)
+
+
+def store(upload_to, base_filename, extension, content):
+    name = default_storage.generate_filename(posixpath.join(upload_to, f"{base_filename}_{uuid.uuid4()}.{extension}"))
+    return default_storage.save(name, ContentFile(content))
+
+
+def render_and_store_csvs(label, products, excel_upload_to=None):
+    """
+    Render the CSVs of a batch over the stored files, from (base_filename,
+    image_url, CSV name, XLSX name or None) tuples. The names stay the
+    same, so URLs already handed out keep working. XLSX copies are
+    rewritten too, and with excel_upload_to a product without one gets a
+    new one.
+
+    Returns the fingerprint they were rendered with and, per product, the
+    name of its XLSX copy (None without one), or False if its files could
+    not be written.
+    """
+    fingerprint = csv_fingerprint(label)
+    results = []
+    for (base_filename, image_url, csv_name, excel_name), csv_content in zip(products, render_csvs(label, products)):
+        try:
+            overwrite(csv_name, csv_content.encode('utf-8'))
+            if excel_name or excel_upload_to:
+                content = render_xlsx(product_rows(label, base_filename, image_url), label)
+                if excel_name:
+                    overwrite(excel_name, content)
+                else:
+                    excel_name = store(excel_upload_to, base_filename, 'xlsx', content)
+        except Exception:
+            results.append(False)
+        else:
+            results.append(excel_name)
+    return fingerprint, results
@@ -0,0 +1,51 @@
+"""
+Pillow resizing for the marketplace image renditions.
+
+This module runs inside the image process pool, so it must not import
+Django models or settings.
+"""
+import io
+from PIL import Image, ImageOps
+
+# Formats that can't store transparency are flattened onto this colour
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+def render_rendition(image, spec):
+    """
+    Return the encoded bytes of one rendition of an opened image.
+
+    spec is a dict with 'max_size' (longest side in pixels), 'format'
+    ('JPEG' or 'WEBP') and 'quality'.
+    """
+    image = image.copy()
+    image.thumbnail((spec['max_size'], spec['max_size']), Image.LANCZOS)
+
+    if spec['format'] == 'JPEG':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, BACKGROUND_COLOR)
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        options = {'quality': spec['quality'], 'optimize': True, 'progressive': True}
+    else:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        options = {'quality': spec['quality'], 'method': 4}
+
+    buffer = io.BytesIO()
+    image.save(buffer, spec['format'], **options)
+    return buffer.getvalue()
+
+
+def render_renditions(data, specs):
+    """
+    Decode an uploaded image once and return {name: encoded bytes} for
+    every rendition in specs
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+        return {name: render_rendition(original, spec) for name, spec in specs.items()}
@@ -0,0 +1,50 @@
+from django.urls import path
+from django.utils.module_loading import import_string
+from backend_django.lazy_urls import lazy_path
+
+# (route, view function, URL name)
+ROUTES = [
+    ('shopify-products/', 'get_shopify_product_list', 'shopify-product-list'),
+    ('shopify-products/create/', 'create_shopify_product', 'create-shopify-product'),
+    ('shopify-products/batch-create/', 'batch_create_shopify_products', 'batch-create-shopify-products'),
+    ('amazon-products/create/', 'amazon_product_create', 'amazon_product_create'),
+    ('amazon-products/batch-create/', 'amazon_product_batch_create', 'amazon_product_batch_create'),
+    ('amazon-products/<int:pk>/delete/', 'amazon_product_delete', 'amazon_product_delete'),
+    ('shopify-products/<int:pk>/', 'get_shopify_product_detail', 'shopify-product-detail'),
+    ('shopify-products/<int:pk>/delete/', 'delete_shopify_product', 'delete-shopify-product'),
+    ('products/export/<str:label>/', 'export_products', 'export-products'),
+    ('products/export/<str:label>/xlsx/', 'export_products_xlsx', 'export-products-xlsx'),
+    ('products/bulk/delete/', 'bulk_delete_products', 'bulk-delete-products'),
+    ('products/bulk/restore/', 'bulk_restore_products', 'bulk-restore-products'),
+    ('products/bulk/regenerate/', 'bulk_regenerate_products', 'bulk-regenerate-products'),
+    ('products/bulk/download/', 'bulk_download_products', 'bulk-download-products'),
+    ('uploads/presign/', 'create_direct_upload', 'create-direct-upload'),
+    ('uploads/finalize/', 'finalize_direct_upload', 'finalize-direct-upload'),
+    ('jobs/<int:pk>/', 'get_job_status', 'job-status'),
+]
+
+# Views that have an async version in product/async_views.py
+ASYNC_VIEWS = {
+    'get_shopify_product_list',
+    'get_shopify_product_detail',
+    'create_shopify_product',
+    'amazon_product_create',
+    'amazon_product_delete',
+    'delete_shopify_product',
+}
+
+
+def product_urlpatterns(async_endpoints=False, lazy=False):
+    """
+    The product routes, with the async list, detail, create and delete
+    views when async_endpoints is on. With lazy, each view module is only
+    imported once a request needs it (see backend_django/lazy_urls.py).
+    """
+    patterns = []
+    for route, view, name in ROUTES:
+        module = 'product.async_views' if async_endpoints and view in ASYNC_VIEWS else 'product.views'
+        if lazy:
+            patterns.append(lazy_path(route, f'{module}.{view}', name=name))
+        else:
+            patterns.append(path(route, import_string(f'{module}.{view}'), name=name))
+    return patterns
@@ -1,12 +1,33 @@
 from rest_framework import serializers
-from .models import Product as ShopifyProduct
+from .models import Product as ShopifyProduct, ProductJob
 import os
-import csv
-import io
 import uuid
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.files.base import ContentFile
-import pandas as pd
+from django.db import IntegrityError, transaction
+from backend_django.image_uploads import UploadedImageField
+from .direct_uploads import CONTENT_TYPE_FORMATS, check_uploaded_image, read_upload_token
+from .images import enqueue_derivatives, submit_derivatives
+from .jobs import enqueue_csv_job
+from .uploads import (
+    aassign_image,
+    afind_existing_product,
+    assign_image,
+    delete_unshared_image,
+    find_existing_product,
+    upload_sha256,
+)
+from .xlsx import render_xlsx
+from .csv_templates import (
+    AMAZON_TITLE_SUFFIX,
+    SHOPIFY_TITLE_SUFFIX,
+    csv_fingerprint,
+    format_title,
+    product_rows,
+    get_shopify_template,
+    render_csv,
+)
 
 class ShopifyProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,143 +44,267 @@ class ShopifyProductSerializer(serializers.ModelSerializer):
         return representation
 
 
-class ShopifyProductCreateSerializer(serializers.ModelSerializer):
-    product_image = serializers.ImageField(required=True)
+def overwrite(field_file, content):
+    """
+    Replace the content of a stored file, keeping its name
+    """
+    with field_file.storage.open(field_file.name, 'wb') as f:
+        f.write(content)
+
+
+class ProductCreateSerializer(serializers.ModelSerializer):
+    """
+    Base serializer for creating a product from an uploaded image.
+
+    Subclasses set the product label and title suffix; the marketplace CSV
+    is rendered for the label by render_csv().
+    """
+    product_image = UploadedImageField(required=True)
+    product_label = None
+    title_suffix = None
     
     class Meta:
         model = ShopifyProduct
         fields = ('product_image',)
     
     def create(self, validated_data):
+        """
+        Create the product with a single INSERT.
+
+        The image and the CSV are stored first, so their names and URLs
+        are known up front, then the row is inserted inside a transaction.
+        If the insert fails the stored files are deleted again. In async
+        mode ('defer_csv' context flag) the CSV is left to a background job
+        queued in the same transaction.
+        """
         image = validated_data.get('product_image')
-        
+        defer_csv = self.context.get('defer_csv')
+
+        product = self.prepare_product(image, attach_csv=not defer_csv)
+        if product.pk:
+            self.reused = True
+            return product
+
+        try:
+            self.insert_product(product, defer_csv)
+        except Exception:
+            self.discard_files(product)
+            raise
+
+        if not defer_csv:
+            enqueue_derivatives([product.pk])
+        return product
+
+    async def asave(self):
+        """
+        save() for async views: lookups and the INSERT go through the async
+        ORM and storage writes run in worker threads, so the event loop is
+        never blocked on the database or the disk
+        """
+        image = self.validated_data.get('product_image')
+        defer_csv = self.context.get('defer_csv')
+
+        product = await self.aprepare_product(image, attach_csv=not defer_csv)
+        if product.pk:
+            self.reused = True
+            self.instance = product
+            return product
+
+        try:
+            if defer_csv:
+                # The job row has to be queued in the insert's transaction
+                await sync_to_async(self.insert_product)(product, defer_csv)
+            else:
+                await product.asave(force_insert=True)
+        except Exception:
+            await sync_to_async(self.discard_files)(product)
+            raise
+
+        if not defer_csv:
+            submit_derivatives([product.pk])
+        self.instance = product
+        return product
+
+    def insert_product(self, product, defer_csv):
+        with transaction.atomic():
+            product.save(force_insert=True)
+            if defer_csv:
+                self.job = enqueue_csv_job(product, product.base_filename)
+
+    def prepare_product(self, image, attach_csv=True):
+        """
+        Store the image and its rendered CSV and return the unsaved product,
+        ready to be inserted with save() or bulk_create.
+
+        With the 'reuse_existing' context flag, an existing product made
+        from an identical image is returned instead (it already has a pk).
+        """
         # Get the image filename without extension
         filename = os.path.splitext(image.name)[0]
-        
-        # Generate a unique UUID for this file (using full UUID)
-        unique_id = str(uuid.uuid4())
-        
-        # Add UUID to filename to make it unique
-        unique_filename = f"{filename}_{unique_id}"
-        
-        # Format the product name by capitalizing each word
-        formatted_name = ' '.join(word.capitalize() for word in filename.replace('_', ' ').replace('-', ' ').split())
-        
-        # Add the custom text
-        product_name = f"{formatted_name} - Baby Boy Girl Clothes Bodysuit Funny Cute"
-        
-        # Create the product instance without csv_file first
-        product = ShopifyProduct(
-            product_name=product_name,
-            product_image=image,
-            label = "shopify",
-        )
-        
 
-        # Save to get the image URL
-        product.save()
-    
+        # An identical image may already have a product to reuse
+        image_sha256 = upload_sha256(image)
+        if self.context.get('reuse_existing'):
+            existing = find_existing_product(image_sha256, self.product_label)
+            if existing:
+                return existing
 
-        # Now generate CSV with the product image URL included
-        csv_content = self.generate_csv_from_template(filename.lower(), product.product_image.url)
-        
-        # Create the CSV file with UUID for uniqueness
-        csv_file_name = f"{filename.lower()}_{unique_id}.csv"
-        
-        # First, delete any existing CSV file if it exists
-        if product.csv_file:
+        product = self.new_product(filename, image_sha256)
+        # Store the image, or point at an identical stored one. Batches
+        # pass 'batch_blobs' so identical images of one batch share too
+        batch_blobs = self.context.get('batch_blobs')
+        assign_image(product, image, batch_blobs)
+        if attach_csv:
             try:
-                storage = product.csv_file.storage
-                if storage.exists(product.csv_file.name):
-                    storage.delete(product.csv_file.name)
-            except Exception as e:
-                # Log the error but continue
-                print(f"Error deleting existing file: {e}")
-        
-        # Create the in-memory CSV file
-        csv_buffer = io.StringIO()
-        csv_writer = csv.writer(csv_buffer)
-        for row in csv_content:
-            csv_writer.writerow(row)
-        
-        # Create a ContentFile
-        csv_file = ContentFile(csv_buffer.getvalue().encode('utf-8'), name=csv_file_name)
-        
-        # Update the product with the CSV
-        product.csv_file = csv_file
-        product.save()
-        
+                self.attach_csv(product, filename)
+            except Exception:
+                # Don't leave an image behind without its product
+                self.discard_files(product, batch_blobs)
+                raise
         return product
-    
-    def generate_csv_from_template(self, base_filename, image_url):
+
+    async def aprepare_product(self, image, attach_csv=True):
+        """
+        prepare_product() for async views
+        """
+        filename = os.path.splitext(image.name)[0]
+
+        image_sha256 = await sync_to_async(upload_sha256, thread_sensitive=False)(image)
+        if self.context.get('reuse_existing'):
+            existing = await afind_existing_product(image_sha256, self.product_label)
+            if existing:
+                return existing
+
+        product = self.new_product(filename, image_sha256)
+        await aassign_image(product, image)
+        if attach_csv:
+            try:
+                await sync_to_async(self.attach_csv, thread_sensitive=False)(product, filename)
+            except Exception:
+                await sync_to_async(self.discard_files)(product)
+                raise
+        return product
+
+    def create_from_stored_image(self, name, filename, sku):
+        """
+        Create the product for an image a client uploaded straight to
+        storage (product/direct_uploads.py). Its bytes are never read here,
+        so unlike create() it isn't matched against identical images.
+        """
+        defer_csv = self.context.get('defer_csv')
+        filename = os.path.splitext(os.path.basename(filename))[0]
+
+        product = self.new_product(filename, '')
+        product.product_image.name = name
+        product.sku = sku
+        if not defer_csv:
+            self.attach_csv(product, filename)
+
+        try:
+            self.insert_product(product, defer_csv)
+        except Exception:
+            # Keep the uploaded image, finalizing can be retried
+            for field_file in (product.csv_file, product.excel_file):
+                if field_file:
+                    field_file.delete(save=False)
+            raise
+
+        if not defer_csv:
+            enqueue_derivatives([product.pk])
+        return product
+
+    def new_product(self, filename, image_sha256):
+        return ShopifyProduct(
+            product_name=f"{format_title(filename)}{self.title_suffix}",
+            label=self.product_label,
+            base_filename=filename.lower(),
+            image_sha256=image_sha256,
+        )
+
+    def render_csv(self, base_filename, image_url):
+        """
+        Render the CSV text of a product
+        """
+        return render_csv(self.product_label, base_filename, image_url)
+
+    def attach_csv(self, product, filename):
+        """
+        Render the CSV for a product whose image is already stored and
+        attach it to csv_file without saving the product
+        """
+        base_filename = filename.lower()
+        self.store_csv(product, base_filename, self.render_csv(base_filename, product.marketplace_image_url()))
+
+    def store_csv(self, product, base_filename, csv_content):
+        """
+        Save rendered CSV text as the product's csv_file and record the
+        generator fingerprint it was rendered with, without saving the
+        product
+        """
+        unique_id = str(uuid.uuid4())
+        product.csv_file.save(
+            f"{base_filename}_{unique_id}.csv",
+            ContentFile(csv_content.encode('utf-8')),
+            save=False,
+        )
+        product.csv_fingerprint = csv_fingerprint(self.product_label)
+        if self.product_label in settings.PRODUCT_EXCEL_LABELS:
+            self.store_excel(product, base_filename)
+
+    def store_excel(self, product, base_filename):
+        """
+        Save the product's marketplace file as XLSX in excel_file, without
+        saving the product
+        """
+        rows = product_rows(self.product_label, base_filename, product.marketplace_image_url())
+        product.excel_file.save(
+            f"{base_filename}_{uuid.uuid4()}.xlsx",
+            ContentFile(render_xlsx(rows, self.product_label)),
+            save=False,
+        )
+
+    def rewrite_csv(self, product):
+        """
+        Re-render a stored product's CSV (and XLSX copy) over its existing
+        files, without saving the product. The names stay the same, so the
+        URLs already returned for them keep working.
+        """
+        base_filename = product.base_filename
+        image_url = product.marketplace_image_url()
+        overwrite(product.csv_file, self.render_csv(base_filename, image_url).encode('utf-8'))
+        product.csv_fingerprint = csv_fingerprint(self.product_label)
+        if product.excel_file:
+            overwrite(product.excel_file, render_xlsx(product_rows(self.product_label, base_filename, image_url), self.product_label))
+        elif self.product_label in settings.PRODUCT_EXCEL_LABELS:
+            self.store_excel(product, base_filename)
+
+    @staticmethod
+    def discard_files(product, batch_blobs=None):
         """
-        Copy the existing CSV template and modify specific values
+        Delete the files stored for a product that was never inserted
         """
-        # Path to your CSV template file
-        template_csv_path = os.path.join(settings.BASE_DIR, 'templates', 'Shopify Output Flat File TEMPLATE.csv')
-        
-        # Create handle value with the specified format - remove all spaces
-        base_filename_no_spaces = base_filename.replace(' ', '')
-        handle = f"{base_filename_no_spaces}-baby-boy-girl-clothes-bodysuit-funny-cute"
-        
-        # Format the title
-        formatted_title = ' '.join(word.capitalize() for word in base_filename.replace('_', ' ').replace('-', ' ').split())
-        title = f"{formatted_title} - Baby Boy Girl Clothes Bodysuit Funny Cute"
-        
-        # Predefined static image URLs (for positions 2-6)
-        static_image_urls = [
-            "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/26363115-65e5-4936-b422-aca4c5535ae1-copy.jpg?v=1741427541",
-            "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/a050c7dc-d0d5-4798-acdd-64b5da3cc70c-copy.jpg?v=1741427541",
-            "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/7159a2aa-6595-4f28-8c53-9fe803487504-copy.jpg?v=1741427541",
-            "https://cdn.shopify.com/s/files/1/0545/2018/5017/files/700cea5a-034d-4520-99ee-218911d7e905-copy.jpg?v=1741427541"
-        ]
-        
-        # Read the template CSV
+        for field_file in (product.csv_file, product.excel_file):
+            if field_file:
+                field_file.delete(save=False)
+        delete_unshared_image(product, batch_blobs)
+
+
+class ShopifyProductCreateSerializer(ProductCreateSerializer):
+    product_label = "shopify"
+    title_suffix = SHOPIFY_TITLE_SUFFIX
+
+    def render_csv(self, base_filename, image_url):
+        """
+        Render the CSV text for a product straight from the compiled template
+        """
+        return self.get_template().render(base_filename, image_url)
+
+    def get_template(self):
         try:
-            with open(template_csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                csv_data = list(reader)
+            return get_shopify_template()
         except FileNotFoundError:
             # Raise validation error if template file is missing
             raise serializers.ValidationError("CSV template file is missing. Please ensure 'Shopify Output Flat File TEMPLATE.csv' exists in the templates directory.")
-        
-        # Get the header row to find column indices
-        headers = csv_data[0]
-        handle_index = headers.index("Handle") if "Handle" in headers else 0
-        title_index = headers.index("Title") if "Title" in headers else 1
-        image_src_index = headers.index("Image Src") if "Image Src" in headers else 28
-        image_position_index = headers.index("Image Position") if "Image Position" in headers else 29
-        
-        # Make sure there are at least 6 data rows (excluding header)
-        while len(csv_data) < 7:
-            csv_data.append([""] * len(headers))
-        
-        # Update all rows with handle value (rows 2-7 in spreadsheet, indices 1-6 in array)
-        for i in range(1, 7):
-            # Ensure each row has enough columns
-            while len(csv_data[i]) < len(headers):
-                csv_data[i].append("")
-            
-            # Update the handle in all rows
-            csv_data[i][handle_index] = handle
-        
-        # Only set title for the first row (row 2 in spreadsheet, index 1 in array)
-        csv_data[1][title_index] = title
-        # Clear title from other rows if they had any value
-        for i in range(2, 7):
-            csv_data[i][title_index] = ""
-        
-        # Set the first image URL to the Django-generated URL
-        csv_data[1][image_src_index] = image_url
-        csv_data[1][image_position_index] = "1"
-        
-        # Update the static image URLs for rows 3-6 (indices 2-5)
-        for i in range(2, 6):
-            if i-2 < len(static_image_urls):
-                csv_data[i][image_src_index] = static_image_urls[i-2]
-                csv_data[i][image_position_index] = str(i)
-        
-        return csv_data
 
 
 
@@ -181,141 +326,113 @@ class AmazonProductSerializer(serializers.ModelSerializer):
         return representation
 
 
-class AmazonProductCreateSerializer(serializers.ModelSerializer):
+class AmazonProductCreateSerializer(ProductCreateSerializer):
     """Serializer for creating Amazon products with CSV generation"""
-    product_image = serializers.ImageField(required=True)
-    
+    product_label = "amazon"
+    title_suffix = AMAZON_TITLE_SUFFIX
+
+
+# The create serializer that renders the CSV for each product label
+CREATE_SERIALIZERS_BY_LABEL = {
+    'shopify': ShopifyProductCreateSerializer,
+    'amazon': AmazonProductCreateSerializer,
+}
+
+
+class ProductJobSerializer(serializers.ModelSerializer):
     class Meta:
-        model = ShopifyProduct
-        fields = ('product_image',)
-    
-    def create(self, validated_data):
-        image = validated_data.get('product_image')
-        
-        # Get the image filename without extension (this is the base user text)
-        filename = os.path.splitext(image.name)[0]
-        user_text = filename.lower()  # Use the filename as the user text
-        
-        # Generate a unique UUID for this file
-        unique_id = str(uuid.uuid4())
-        
-        # Format the product name by capitalizing each word
-        formatted_name = ' '.join(word.capitalize() for word in filename.replace('_', ' ').replace('-', ' ').split())
-        
-        # Add the custom text
-        product_name = f"{formatted_name} - Baby Boy Girl Clothes Bodysuit Funny"
-        
-        # Create the product instance without csv_file first
-        product = ShopifyProduct(
-            product_name=product_name,
-            product_image=image,
-            label = "amazon",
-        )
-        
-        # Save to get the image URL
-        product.save()
-        
-        # Now generate CSV with the product image URL included
-        df = self.create_product_dataframe(user_text)
-        
-        # Replace "main_image" with the actual image URL
-        df['main_image_url'] = df['main_image_url'].replace("main_image", product.product_image.url)
-        
-        # Create the CSV file with UUID for uniqueness
-        csv_file_name = f"{filename.lower()}_{unique_id}.csv"
-        
-        # First, delete any existing CSV file if it exists
-        if product.csv_file:
-            try:
-                storage = product.csv_file.storage
-                if storage.exists(product.csv_file.name):
-                    storage.delete(product.csv_file.name)
-            except Exception as e:
-                # Log the error but continue
-                print(f"Error deleting existing file: {e}")
-        
-        # Create the in-memory CSV file
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        
-        # Create a ContentFile
-        csv_file = ContentFile(csv_buffer.getvalue().encode('utf-8'), name=csv_file_name)
-        
-        # Update the product with the CSV
-        product.csv_file = csv_file
-        product.save()
-        
-        return product
-    
-    def create_product_dataframe(self, user_text):
+        model = ProductJob
+        fields = ('id', 'product', 'status', 'error', 'attempts', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+
+class BulkProductSelectionSerializer(serializers.Serializer):
+    """
+    The products a bulk operation applies to: a list of ids and/or a
+    filter on label and creation time. Everything given must match, and
+    at least one of them is required so a request can't select the whole
+    catalogue by accident.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    label = serializers.CharField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate_ids(self, value):
+        if len(value) > settings.PRODUCT_BULK_MAX_IDS:
+            raise serializers.ValidationError(f'At most {settings.PRODUCT_BULK_MAX_IDS} ids can be given, use a filter instead')
+        return value
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('Provide ids, label, created_after or created_before')
+        return attrs
+
+    def get_queryset(self):
         """
-        Creates a product dataframe with formatted columns based on user text.
-        
-        Parameters:
-        user_text (str): The base text for product SKUs (e.g., "littlecupcake")
-        
-        Returns:
-        pd.DataFrame: DataFrame with product variants
+        The selected products, active or not; one query per operation
         """
-        # Format the user text
-        user_text_capital = user_text.upper()
-        user_text_title = user_text.title()  # First letter capitalized
-        
-        # Define the variants
-        variants = [
-            "Newborn White Short Sleeve",
-            "Newborn White Long Sleeve",
-            "Newborn Natural Short Sleeve",
-            "0-3M White Short Sleeve",
-            "0-3M White Long Sleeve",
-            "0-3M Pink Short Sleeve",
-            "0-3M Blue Short Sleeve",
-            "3-6M White Short Sleeve",
-            "3-6M White Long Sleeve",
-            "3-6M Blue Short Sleeve",
-            "3-6M Pink Short Sleeve",
-            "6M Natural Short Sleeve",
-            "6-9M White Short Sleeve",
-            "6-9M White Long Sleeve",
-            "6-9M Pink Short Sleeve",
-            "6-9M Blue Short Sleeve",
-            "12M White Short Sleeve",
-            "12M White Long Sleeve",
-            "12M Natural Short Sleeve",
-            "12M Pink Short Sleeve",
-            "12M Blue Short Sleeve",
-            "18M White Short Sleeve",
-            "18M White Long Sleeve",
-            "18M Natural Short Sleeve",
-            "24M White Short Sleeve",
-            "24M White Long Sleeve",
-            "24M Natural Short Sleeve"
-        ]
-        
-        # Create lists for each column
-        item_sku = [f"{user_text_title}-Parent"]
-        item_name = [f"{user_text_capital} - Baby Boy Girl Clothes Bodysuit Funny"]
-        parent_child = ["Parent"]
-        parent_sku = [""]
-        main_image_url = ["main_image"]
-        
-        # Add entries for each variant
-        for variant in variants:
-            # Remove spaces for item_sku
-            variant_no_space = ''.join(variant.split())
-            item_sku.append(f"{user_text_title}-{variant_no_space}")
-            item_name.append(f"{user_text_capital} - Baby Boy Girl Clothes Bodysuit Funny")
-            parent_child.append("Child")
-            parent_sku.append(f"{user_text_title}-Parent")
-            main_image_url.append("main_image")
-        
-        # Create the DataFrame
-        df = pd.DataFrame({
-            'item_sku': item_sku,
-            'item_name': item_name,
-            'parent_child': parent_child,
-            'parent_sku': parent_sku,
-            'main_image_url': main_image_url
-        })
-        
-        return df
\ No newline at end of file
+        data = self.validated_data
+        products = ShopifyProduct.objects.all()
+        if 'ids' in data:
+            products = products.filter(pk__in=data['ids'])
+        if 'label' in data:
+            products = products.filter(label=data['label'])
+        if 'created_after' in data:
+            products = products.filter(created_at__gte=data['created_after'])
+        if 'created_before' in data:
+            products = products.filter(created_at__lt=data['created_before'])
+        return products
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    """
+    A request to presign the upload of one product image
+    """
+    filename = serializers.CharField(max_length=200)
+    content_type = serializers.ChoiceField(choices=list(CONTENT_TYPE_FORMATS))
+    label = serializers.ChoiceField(choices=list(CREATE_SERIALIZERS_BY_LABEL))
+
+    def validate_filename(self, value):
+        if not os.path.splitext(os.path.basename(value))[0].strip():
+            raise serializers.ValidationError('The filename is used as the product name and cannot be empty')
+        return value
+
+
+class DirectUploadFinalizeSerializer(serializers.Serializer):
+    """
+    Create the product for a finished direct upload. Finalizing the same
+    upload again returns the product it created (sku is the upload id).
+    """
+    upload_token = serializers.CharField()
+
+    def validate_upload_token(self, value):
+        upload = read_upload_token(value, self.context['request'].user)
+        if upload is None:
+            raise serializers.ValidationError('Invalid or expired upload token')
+        return upload
+
+    def validate(self, attrs):
+        upload = attrs['upload_token']
+        attrs['existing'] = ShopifyProduct.objects.filter(sku=upload['id']).first()
+        if attrs['existing'] is None:
+            error = check_uploaded_image(upload)
+            if error:
+                raise serializers.ValidationError({'upload_token': [error]})
+        return attrs
+
+    def create(self, validated_data):
+        upload = validated_data['upload_token']
+        if validated_data['existing']:
+            self.reused = True
+            return validated_data['existing']
+
+        create_serializer = CREATE_SERIALIZERS_BY_LABEL[upload['label']](context=self.context)
+        try:
+            product = create_serializer.create_from_stored_image(upload['name'], upload['filename'], upload['id'])
+        except IntegrityError:
+            # Finalized concurrently by another request
+            self.reused = True
+            return ShopifyProduct.objects.get(sku=upload['id'])
+        self.job = getattr(create_serializer, 'job', None)
+        return product
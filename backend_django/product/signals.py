@@ -0,0 +1,19 @@
+# signals.py
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_pre_delete
+from .models import Product
+from .uploads import SHARED_IMAGE_FIELDS, is_shared_file
+
+
+@receiver(cleanup_pre_delete, sender=Product)
+def keep_shared_image_files(sender, field_name, file_name, file, **kwargs):
+    """
+    Deduplicated uploads share one stored image between products, so only
+    let django-cleanup delete an image nobody else references
+    """
+    if field_name not in SHARED_IMAGE_FIELDS:
+        return
+
+    if is_shared_file(file_name):
+        # An empty name makes FieldFile.delete() a no-op
+        file.name = None
@@ -1,3 +1,993 @@
-from django.test import TestCase
+import importlib
+import io
+import os
+import tempfile
+import types
+import unittest
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from xml.etree import ElementTree
+from PIL import Image
+from prometheus_client import REGISTRY
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+from backend_django.lazy_urls import lazy_path
+from backend_django.metrics import NO_VIEW
+from members.user_cache import user_cache
+from . import views
+from .csv_templates import AMAZON_COLUMNS, AMAZON_VARIANTS, csv_fingerprint
+from .images import generate_derivatives
+from .jobs import STALE_JOB_ERROR, claim_job, run_job
+from .models import Product, ProductJob
+from .regeneration import completed, outdated_products, save_regenerated
+from .regeneration_worker import render_and_store_csvs
+from .routes import product_urlpatterns
+from .serializers import ShopifyProductCreateSerializer
+from .xlsx import XLSX_CONTENT_TYPE, render_xlsx
 
-# Create your tests here.
+try:
+    import boto3
+    import requests
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+User = get_user_model()
+
+
+@override_settings(PRODUCT_JOB_RUN_IN_PROCESS=False)
+class ProductBulkOperationTests(TestCase):
+    """
+    The bulk endpoints apply to any number of products with a fixed
+    number of queries
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        user = User.objects.create_user(username='bulk@example.com', email='bulk@example.com', password='bulk-password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        Product.objects.bulk_create([
+            Product(
+                product_name=f'Design {i}',
+                product_image=f'product_images/design_{i}.png',
+                base_filename=f'design_{i}',
+                sku=f'bulk-{i}',
+                label='shopify' if i % 2 else 'amazon',
+            )
+            for i in range(2000)
+        ])
+
+    def test_bulk_delete_by_filter(self):
+        # Authentication, UPDATE
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/products/bulk/delete/', {'label': 'shopify'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'deleted': 1000})
+        self.assertEqual(Product.objects.filter(is_active=True).count(), 1000)
+        self.assertFalse(Product.objects.filter(label='shopify', is_active=True).exists())
+
+    def test_bulk_delete_sets_updated_at(self):
+        before = timezone.now()
+        ids = list(Product.objects.values_list('pk', flat=True)[:10])
+        self.client.post('/api/products/bulk/delete/', {'ids': ids}, format='json')
+        self.assertEqual(Product.objects.filter(pk__in=ids, updated_at__gte=before).count(), 10)
+
+    def test_bulk_restore_by_ids_and_created_range(self):
+        Product.objects.update(is_active=False)
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:300])
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/products/bulk/restore/', {
+                'ids': ids,
+                'created_after': (timezone.now() - timedelta(days=1)).isoformat(),
+                'created_before': (timezone.now() + timedelta(days=1)).isoformat(),
+            }, format='json')
+        self.assertEqual(response.data, {'restored': 300})
+
+        # Nothing created in the future
+        response = self.client.post('/api/products/bulk/restore/', {
+            'created_after': (timezone.now() + timedelta(days=1)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.data, {'restored': 0})
+
+    def test_bulk_regenerate(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/products/bulk/regenerate/', {'label': 'amazon'}, format='json')
+        # Authentication, the products without a pending job, the job
+        # INSERTs in batches (SQLite limits their size to ~120 rows) and the
+        # transaction's savepoints
+        self.assertLessEqual(len(queries), 14)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'queued': 1000})
+        self.assertEqual(ProductJob.objects.filter(status=ProductJob.STATUS_PENDING).count(), 1000)
+
+        # Already pending products aren't queued twice
+        response = self.client.post('/api/products/bulk/regenerate/', {'label': 'amazon'}, format='json')
+        self.assertEqual(response.data, {'queued': 0})
+
+    def test_bulk_selection_is_required(self):
+        response = self.client.post('/api/products/bulk/delete/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.filter(is_active=True).count(), 2000)
+
+    @override_settings(PRODUCT_BULK_MAX_IDS=5)
+    def test_too_many_ids(self):
+        response = self.client.post('/api/products/bulk/delete/', {'ids': list(range(1, 7))}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.data)
+
+
+def png_bytes(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'pink').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(name, content, content_type='image/png'):
+    return SimpleUploadedFile(name, content, content_type)
+
+
+@override_settings(PRODUCT_IMAGE_DERIVATIVES=False, PRODUCT_JOB_RUN_IN_PROCESS=False)
+class ProductAPITestCase(TestCase):
+    """
+    An authenticated API client and a throwaway MEDIA_ROOT, with no
+    renditions or CSV jobs run behind the test's back
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='products@example.com', password='products-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+
+
+class ProductJobTests(ProductAPITestCase):
+    """
+    Queued CSV jobs are claimed once, fail without losing the product and
+    are run again when retried or when their worker is lost
+    """
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/shopify-products/create/?async=true', {'product_image': upload('little cupcake.png', png_bytes())})
+        self.assertEqual(response.status_code, 202)
+        self.job = ProductJob.objects.get(pk=response.data['job']['id'])
+
+    def process(self, *args):
+        out = io.StringIO()
+        call_command('process_product_jobs', *args, stdout=out)
+        return out.getvalue()
+
+    def test_claim_and_run(self):
+        self.assertTrue(claim_job(self.job.pk))
+        self.assertFalse(claim_job(self.job.pk))
+        # A running job isn't run twice
+        self.assertIsNone(run_job(self.job.pk))
+
+        ProductJob.objects.filter(pk=self.job.pk).update(status=ProductJob.STATUS_PENDING)
+        self.assertEqual(run_job(self.job.pk), ProductJob.STATUS_DONE)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.attempts, 2)
+        self.assertTrue(self.job.product.csv_file)
+        self.assertEqual(self.client.get(f'/api/jobs/{self.job.pk}/').data['product']['id'], self.job.product_id)
+
+    def test_failure_and_retry(self):
+        with mock.patch('product.serializers.ShopifyProductCreateSerializer.render_csv', side_effect=OSError('disk full')):
+            self.assertIn('0 done, 1 failed', self.process())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.error), (ProductJob.STATUS_FAILED, 'disk full'))
+        self.assertFalse(self.job.product.csv_file)
+
+        self.assertIn('0 done, 0 failed', self.process())
+        self.assertIn('1 done, 0 failed', self.process('--retry-failed'))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.error, self.job.attempts), (ProductJob.STATUS_DONE, '', 2))
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        claim_job(self.job.pk)
+        # Still within its lease
+        self.assertIn('0 done, 0 failed', self.process())
+
+        ProductJob.objects.filter(pk=self.job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        output = self.process()
+        self.assertIn('Queued 1 stale running jobs again', output)
+        self.assertIn('1 done, 0 failed', output)
+
+    def test_stale_jobs_out_of_attempts_fail(self):
+        ProductJob.objects.filter(pk=self.job.pk).update(
+            status=ProductJob.STATUS_RUNNING, attempts=3, started_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertIn('0 stale running jobs again, 1 out of attempts failed', self.process())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.error), (ProductJob.STATUS_FAILED, STALE_JOB_ERROR))
+
+    @override_settings(PRODUCT_JOB_RUN_IN_PROCESS=True)
+    def test_polling_a_stale_job_runs_it_again(self):
+        claim_job(self.job.pk)
+        ProductJob.objects.filter(pk=self.job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('product.jobs.submit_jobs') as submit_jobs:
+            response = self.client.get(f'/api/jobs/{self.job.pk}/')
+        self.assertEqual(response.data['status'], ProductJob.STATUS_PENDING)
+        submit_jobs.assert_called_once_with([self.job.pk])
+
+
+class StreamingUploadTests(ProductAPITestCase):
+    """
+    The upload handlers reject image uploads while they stream in
+    """
+
+    def test_image_is_created(self):
+        response = self.client.post('/api/shopify-products/create/', {'product_image': upload('little cupcake.png', png_bytes())})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Product.objects.get().product_name, 'Little Cupcake - Baby Boy Girl Clothes Bodysuit Funny Cute')
+
+    @override_settings(UPLOAD_IMAGE_FIELDS={'product_image': {'max_size': 100 * 1024}})
+    def test_too_large(self):
+        response = self.client.post('/api/shopify-products/create/', {'product_image': upload('big.png', png_bytes() + bytes(1024 * 1024))})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('product_image', response.data)
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(os.listdir(self.media), [])
+
+    def test_not_an_image(self):
+        response = self.client.post('/api/amazon-products/create/', {'product_image': upload('notes.png', b'just some text' * 20000)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_image', response.data)
+        self.assertFalse(Product.objects.exists())
+
+    def test_unsupported_format(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'BMP')
+        response = self.client.post('/api/shopify-products/create/', {'product_image': upload('old.bmp', buffer.getvalue(), 'image/bmp')})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(UPLOAD_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        response = self.client.post('/api/shopify-products/create/', {'product_image': upload('wide.png', png_bytes((100, 100)))})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pixels', str(response.data['product_image']))
+
+    @override_settings(UPLOAD_IMAGE_FIELDS={'product_images': {'max_size': 100 * 1024, 'per_file_errors': True}})
+    def test_batch_rejects_files_on_their_own(self):
+        response = self.client.post('/api/shopify-products/batch-create/', {'product_images': [
+            upload('first.png', png_bytes()),
+            upload('huge.png', png_bytes() + bytes(1024 * 1024)),
+            upload('text.png', b'not an image'),
+        ]})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'error', 'error'])
+        self.assertIn('larger than', str(response.data['results'][1]['errors']))
+        self.assertEqual(Product.objects.count(), 1)
+
+    @override_settings(UPLOAD_IMAGE_FIELDS={'product_image': {'max_size': 100 * 1024}})
+    def test_other_views_keep_the_default_handlers(self):
+        # A plain Django view parsing the same upload doesn't fail with the
+        # handlers' DRF exceptions
+        response = self.client.post('/api/login/', {'product_image': upload('big.png', png_bytes() + bytes(1024 * 1024))})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Please provide both email and password'})
+
+
+class ImageDedupTests(ProductAPITestCase):
+    """
+    Identical images are stored once, whether they come in separate
+    requests or in one batch
+    """
+
+    def stored_images(self):
+        return sorted(os.listdir(os.path.join(self.media, 'product_images')))
+
+    def test_separate_requests(self):
+        self.client.post('/api/shopify-products/create/', {'product_image': upload('a.png', png_bytes())})
+        self.client.post('/api/shopify-products/create/', {'product_image': upload('b.png', png_bytes())})
+        self.assertEqual(self.stored_images(), ['a.png'])
+        self.assertEqual(set(Product.objects.values_list('product_image', flat=True)), {'product_images/a.png'})
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_one_batch(self):
+        response = self.client.post('/api/shopify-products/batch-create/', {'product_images': [
+            upload('a.png', png_bytes()),
+            upload('b.png', png_bytes()),
+            upload('c.png', png_bytes((32, 32))),
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stored_images(), ['a.png', 'c.png'])
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('product_image', flat=True)),
+            ['product_images/a.png', 'product_images/a.png', 'product_images/c.png'],
+        )
+
+    def test_failed_batch_item_keeps_the_shared_file(self):
+        render_csv = ShopifyProductCreateSerializer.render_csv
+        calls = []
+
+        def fail_second(serializer, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            return render_csv(serializer, *args)
+
+        with mock.patch.object(ShopifyProductCreateSerializer, 'render_csv', fail_second):
+            response = self.client.post('/api/shopify-products/batch-create/', {'product_images': [
+                upload('a.png', png_bytes()),
+                upload('b.png', png_bytes()),
+            ]})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(self.stored_images(), ['a.png'])
+        self.assertEqual(Product.objects.get().product_image.name, 'product_images/a.png')
+
+
+class BatchCreateTests(ProductAPITestCase):
+    """
+    The batch endpoints create one product per image with a single INSERT
+    and report every file on its own
+    """
+
+    def test_products_are_inserted_together(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/amazon-products/batch-create/', {'product_images': [
+                upload(f'design {i}.png', png_bytes((32 + i, 32))) for i in range(3)
+            ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['existing'], response.data['failed']), (3, 0, 0))
+        self.assertEqual(
+            [result['product']['product_name'] for result in response.data['results']],
+            [f'Design {i} - Baby Boy Girl Clothes Bodysuit Funny' for i in range(3)],
+        )
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "product_product"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertTrue(all(product.csv_file for product in Product.objects.all()))
+
+    def test_every_file_failing(self):
+        response = self.client.post('/api/shopify-products/batch-create/', {'product_images': [
+            upload('a.png', b'not an image'),
+            upload('b.png', b'not an image either'),
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([result['index'] for result in response.data['results']], [0, 1])
+        self.assertFalse(Product.objects.exists())
+
+    def test_images_are_required(self):
+        response = self.client.post('/api/shopify-products/batch-create/', {})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+    @override_settings(PRODUCT_BATCH_MAX_SIZE=2)
+    def test_too_many_images(self):
+        response = self.client.post('/api/shopify-products/batch-create/', {'product_images': [
+            upload(f'design {i}.png', png_bytes((32 + i, 32))) for i in range(3)
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 2', response.data['error'])
+        self.assertFalse(Product.objects.exists())
+
+
+class ProductListPaginationTests(ProductAPITestCase):
+    """
+    The list pages through products newest first by (created_at, id)
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Two products per timestamp, so pages have to break ties by id
+        created_at = timezone.now()
+        Product.objects.bulk_create([
+            Product(
+                product_name=f'Design {i}',
+                product_image=f'product_images/design_{i}.png',
+                sku=f'page-{i}',
+                label='shopify' if i % 3 else 'amazon',
+            )
+            for i in range(12)
+        ])
+        for i, pk in enumerate(Product.objects.order_by('pk').values_list('pk', flat=True)):
+            Product.objects.filter(pk=pk).update(created_at=created_at + timedelta(seconds=i // 2))
+
+    def test_pages_cover_every_product_once(self):
+        ids = []
+        url = '/api/shopify-products/?page_size=5'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 5)
+            ids += [product['id'] for product in response.data['results']]
+            url = response.data['next']
+        expected = Product.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_label_filter(self):
+        response = self.client.get('/api/shopify-products/?page_size=50&label=amazon')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_unpaginated_list(self):
+        response = self.client.get('/api/shopify-products/')
+        self.assertEqual(len(response.data), 12)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-base64!', 'bm8gc2VwYXJhdG9y'):
+            response = self.client.get('/api/shopify-products/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {'cursor': 'Invalid cursor.'})
+
+
+class ConditionalGetTests(ProductAPITestCase):
+    """
+    The list and detail answer unchanged polls with a 304
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            product_name='Little Cupcake', product_image='product_images/a.png', sku='etag-1', label='shopify',
+        )
+
+    def test_list_not_modified(self):
+        response = self.client.get('/api/shopify-products/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # One aggregate query, no rows loaded
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/shopify-products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_changes(self):
+        etag = self.client.get('/api/shopify-products/')['ETag']
+        self.assertNotEqual(self.client.get('/api/shopify-products/?label=amazon')['ETag'], etag)
+
+        self.client.delete(f'/api/shopify-products/{self.product.pk}/delete/')
+        response = self.client.get('/api/shopify-products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_list_has_no_last_modified(self):
+        Product.objects.create(product_name='Baby Shark', product_image='product_images/b.png', sku='etag-2', label='shopify')
+        response = self.client.get('/api/shopify-products/')
+        self.assertEqual(len(response.data), 2)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        # A hard delete leaves no newer date behind, so a date can't tell
+        # the client its copy is stale
+        since = http_date(timezone.now().timestamp() + 60)
+        self.product.delete()
+        response = self.client.get('/api/shopify-products/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+    def test_detail_not_modified(self):
+        url = f'/api/shopify-products/{self.product.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_missing_detail(self):
+        response = self.client.get('/api/shopify-products/0/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+# The product routes served by the async views, as with PRODUCT_ASYNC_VIEWS
+ASYNC_URLCONF = types.ModuleType('async_product_urls')
+ASYNC_URLCONF.urlpatterns = [path('api/', include(product_urlpatterns(async_endpoints=True)))]
+
+
+def teapot_exception_handler(exc, context):
+    return Response({'handled': type(exc).__name__, 'view': type(context['view']).__name__}, status=418)
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncViewTests(ProductAPITestCase):
+    """
+    The async list, detail, create and delete views answer like the sync
+    ones
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    async def test_create_list_and_delete(self):
+        response = await self.async_client.post('/api/shopify-products/create/', {'product_image': upload('little cupcake.png', png_bytes())}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        product = response.json()['product']
+        self.assertEqual(product['product_name'], 'Little Cupcake - Baby Boy Girl Clothes Bodysuit Funny Cute')
+
+        response = await self.async_client.post('/api/amazon-products/create/', {'product_image': upload('tiny bear.png', png_bytes((32, 32)))}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['csv_file'])
+
+        response = await self.async_client.get('/api/shopify-products/', {'page_size': 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        response = await self.async_client.get(response.json()['next'], headers=self.headers)
+        self.assertEqual(response.json()['results'][0]['id'], product['id'])
+        self.assertIsNone(response.json()['next'])
+
+        response = await self.async_client.delete(f"/api/shopify-products/{product['id']}/delete/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(f"/api/shopify-products/{product['id']}/", headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_invalid_upload(self):
+        response = await self.async_client.post('/api/shopify-products/create/', {'product_image': upload('notes.png', b'just some text')}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_image', response.json())
+        self.assertFalse(await Product.objects.aexists())
+
+    async def test_conditional_get(self):
+        product = await Product.objects.acreate(
+            product_name='Little Cupcake', product_image='product_images/a.png', sku='async-1', label='shopify',
+        )
+        for url in ('/api/shopify-products/', f'/api/shopify-products/{product.pk}/'):
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.get(url, headers={**self.headers, 'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+    async def test_errors(self):
+        response = await self.async_client.get('/api/shopify-products/', {'cursor': 'not-base64!'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'cursor': 'Invalid cursor.'})
+
+    async def test_method_not_allowed(self):
+        response = await self.async_client.post('/api/shopify-products/', headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET')
+        response = await self.async_client.get('/api/shopify-products/1/delete/', headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'DELETE')
+
+    async def test_authentication(self):
+        response = await self.async_client.get('/api/shopify-products/')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+        response = await self.async_client.get('/api/shopify-products/', headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    async def test_permission_denied(self):
+        with mock.patch.object(APIView, 'permission_classes', [IsAdminUser]):
+            response = await self.async_client.get('/api/shopify-products/', headers=self.headers)
+            self.assertEqual(response.status_code, 403)
+            response = await self.async_client.delete('/api/shopify-products/1/delete/', headers=self.headers)
+            self.assertEqual(response.status_code, 403)
+
+    async def test_throttled(self):
+        class Closed(BaseThrottle):
+            def allow_request(self, request, view):
+                return False
+
+            def wait(self):
+                return 30
+
+        with mock.patch.object(APIView, 'throttle_classes', [Closed]):
+            response = await self.async_client.get('/api/shopify-products/', headers=self.headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'EXCEPTION_HANDLER': 'product.tests.teapot_exception_handler'})
+    async def test_exception_handler(self):
+        response = await self.async_client.get('/api/shopify-products/')
+        self.assertEqual(response.status_code, 418)
+        self.assertEqual(response.json(), {'handled': 'NotAuthenticated', 'view': 'get_shopify_product_list'})
+
+
+class CsvRegenerationTests(ProductAPITestCase):
+    """
+    regenerate_csvs re-renders only the CSVs whose generator inputs changed
+    """
+
+    def setUp(self):
+        super().setUp()
+        for name in ('little cupcake.png', 'baby shark.png'):
+            self.client.post('/api/shopify-products/create/', {'product_image': upload(name, png_bytes())})
+        self.client.post('/api/amazon-products/create/', {'product_image': upload('tiny bear.png', png_bytes())})
+
+    def regenerate(self, *args):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('regenerate_csvs', '--workers', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def csv_text(self, product):
+        with product.csv_file.open('rb') as csv_file:
+            return csv_file.read().decode('utf-8')
+
+    def test_current_csvs_are_left_alone(self):
+        self.assertEqual(Product.objects.filter(csv_fingerprint='').count(), 0)
+        output = self.regenerate()
+        self.assertIn('shopify: 0 outdated CSVs', output)
+        self.assertIn('amazon: 0 outdated CSVs', output)
+
+    def test_changed_suffix_regenerates_its_label(self):
+        amazon = Product.objects.get(label='amazon')
+        shopify = Product.objects.filter(label='shopify').first()
+        csv_url = shopify.csv_file.url
+        suffix = ' - Organic Cotton Onesie'
+        # A new suffix ships with a restart, which compiles the template again
+        with mock.patch('product.csv_templates.SHOPIFY_TITLE_SUFFIX', suffix), \
+                mock.patch('product.csv_templates._shopify_template', None), \
+                mock.patch('product.serializers.ShopifyProductCreateSerializer.title_suffix', suffix):
+            output = self.regenerate()
+            self.assertIn('shopify: regenerated 2 CSVs', output)
+            self.assertIn('amazon: 0 outdated CSVs', output)
+            self.assertIn('shopify: 0 outdated CSVs', self.regenerate('--dry-run'))
+
+        for product in Product.objects.filter(label='shopify'):
+            self.assertTrue(product.product_name.endswith(suffix))
+            self.assertIn(product.product_name, self.csv_text(product))
+        # Rewritten in place, so the URL handed out at create still works
+        shopify.refresh_from_db()
+        self.assertEqual(shopify.csv_file.url, csv_url)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, 'product_csv_files'))), sorted(
+            os.path.basename(name) for name in Product.objects.values_list('csv_file', flat=True)
+        ))
+        self.assertEqual(Product.objects.get(label='amazon').csv_file.name, amazon.csv_file.name)
+
+    def test_renditions_stored_meanwhile_are_kept(self):
+        Product.objects.update(csv_fingerprint='')
+        batch = list(outdated_products('amazon', csv_fingerprint('amazon')))
+        inputs = [(product.base_filename, product.marketplace_image_url(), product.csv_file.name, product.excel_file.name) for product in batch]
+        fingerprint, results = render_and_store_csvs('amazon', inputs)
+
+        # The renditions finished after the batch was fetched
+        Product.objects.filter(pk=batch[0].pk).update(marketplace_image='product_images/tiny_bear_marketplace.jpg')
+        self.assertEqual(save_regenerated('amazon', batch, fingerprint, results), (1, 0))
+
+        product = Product.objects.get(pk=batch[0].pk)
+        self.assertEqual(product.csv_fingerprint, csv_fingerprint('amazon'))
+        self.assertIn(product.marketplace_image.url, self.csv_text(product))
+
+    def test_resumes_where_it_stopped(self):
+        Product.objects.update(csv_fingerprint='')
+        self.assertIn('regenerated 1 CSVs', self.regenerate('--label', 'shopify', '--limit', '1'))
+        self.assertIn('shopify: 1 outdated CSVs', self.regenerate('--label', 'shopify', '--dry-run'))
+        self.assertIn('regenerated 1 CSVs', self.regenerate('--label', 'shopify'))
+        self.assertEqual(Product.objects.filter(csv_fingerprint='').count(), 1)
+
+    def test_products_with_a_queued_job_are_skipped(self):
+        Product.objects.update(csv_fingerprint='')
+        ProductJob.objects.create(product=Product.objects.get(label='amazon'), base_filename='tiny bear')
+        self.assertIn('amazon: 0 outdated CSVs', self.regenerate('--label', 'amazon'))
+
+    def test_legacy_base_filenames_are_recovered(self):
+        backfill = importlib.import_module('product.migrations.0006_product_base_filename').backfill_base_filename
+        self.client.post('/api/shopify-products/create/', {'product_image': upload("mom's boy_2-go.png", png_bytes((65, 64)))})
+        self.client.post('/api/amazon-products/create/', {'product_image': upload("mom's boy!.png", png_bytes((66, 64)))})
+        before = {product.pk: (product.base_filename, product.product_name, self.csv_text(product)) for product in Product.objects.all()}
+
+        # As the products were before base_filename was stored
+        Product.objects.update(base_filename='', csv_fingerprint='')
+        backfill(django_apps, None)
+        self.assertEqual(dict(Product.objects.values_list('pk', 'base_filename')), {pk: base for pk, (base, _, _) in before.items()})
+
+        # So regenerating the legacy CSVs doesn't change them
+        self.regenerate()
+        for product in Product.objects.all():
+            self.assertEqual((product.base_filename, product.product_name, self.csv_text(product)), before[product.pk])
+
+        # Without a readable CSV, the title is the next best thing
+        Product.objects.update(base_filename='', csv_file='')
+        backfill(django_apps, None)
+        self.assertEqual(Product.objects.get(pk=min(before)).base_filename, 'little cupcake')
+        self.assertEqual(Product.objects.get(label='amazon', product_name__startswith='Tiny').base_filename, 'tiny bear')
+
+
+def xlsx_rows(data):
+    """
+    The cell values of the first sheet of an XLSX workbook, read with the
+    standard library
+    """
+    namespace = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+    return [
+        [''.join(cell.itertext()) for cell in row.findall('x:c', namespace)]
+        for row in sheet.find('x:sheetData', namespace)
+    ]
+
+
+class ImageDerivativeTests(ProductAPITestCase):
+    """
+    Renditions point the stored CSV at the marketplace image without
+    moving it
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Render in this process instead of the spawned pool
+        self.enterContext(mock.patch('product.images.get_process_pool', return_value=mock.Mock(submit=completed)))
+
+    def test_created_urls_survive_derivatives(self):
+        response = self.client.post('/api/amazon-products/create/', {'product_image': upload('tiny bear.png', png_bytes())})
+        self.assertEqual(response.status_code, 201)
+        product = Product.objects.get()
+        csv_name = response.data['csv_file'].removeprefix(settings.MEDIA_URL)
+        excel_name = product.excel_file.name
+
+        generate_derivatives(product.pk)
+
+        product.refresh_from_db()
+        self.assertTrue(product.marketplace_image)
+        self.assertEqual(product.csv_file.name, csv_name)
+        self.assertEqual(product.excel_file.name, excel_name)
+        with product.csv_file.storage.open(csv_name, 'rb') as csv_file:
+            self.assertIn(product.marketplace_image.url.encode(), csv_file.read())
+        with product.excel_file.open('rb') as excel_file:
+            self.assertEqual(xlsx_rows(excel_file.read())[1][-1], product.marketplace_image.url)
+
+
+class XlsxExportTests(ProductAPITestCase):
+    """
+    Amazon products get an XLSX flat file, and catalogues export as XLSX
+    """
+
+    def test_amazon_product_gets_an_xlsx_file(self):
+        self.client.post('/api/amazon-products/create/', {'product_image': upload('tiny bear.png', png_bytes())})
+        product = Product.objects.get()
+        with product.excel_file.open('rb') as excel_file:
+            rows = xlsx_rows(excel_file.read())
+        self.assertEqual(rows[0], AMAZON_COLUMNS)
+        self.assertEqual(rows[1][:3], ['Tiny Bear-Parent', 'TINY BEAR - Baby Boy Girl Clothes Bodysuit Funny', 'Parent'])
+        self.assertEqual(len(rows), 1 + 1 + len(AMAZON_VARIANTS))
+
+        # Shopify products only get one with PRODUCT_EXCEL_LABELS
+        self.client.post('/api/shopify-products/create/', {'product_image': upload('baby shark.png', png_bytes())})
+        self.assertFalse(Product.objects.get(label='shopify').excel_file)
+
+    def test_catalogue_export(self):
+        for i in range(3):
+            self.client.post('/api/amazon-products/create/', {'product_image': upload(f'design {i}.png', png_bytes())})
+        response = self.client.get('/api/products/export/amazon/xlsx/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        rows = xlsx_rows(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 1 + 3 * (1 + len(AMAZON_VARIANTS)))
+        self.assertEqual(rows[-1][0], 'Design 2-24MNaturalShortSleeve')
+
+    def test_escaping(self):
+        rows = xlsx_rows(render_xlsx([['a & <b>', 'tab\tand\x01control'], [1, '']]))
+        self.assertEqual(rows, [['a & <b>', 'tab\tandcontrol'], ['1']])
+
+
+class ProductArchiveTests(ProductAPITestCase):
+    """
+    Many products' CSVs and images download as one streamed ZIP archive
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Different images: identical uploads share one stored file
+        for i, name in enumerate(('little cupcake', 'baby shark', 'tiny bear')):
+            self.client.post('/api/shopify-products/create/', {'product_image': upload(f'{name}.png', png_bytes((64 + i, 64)))})
+
+    def download(self, body):
+        response = self.client.post('/api/products/bulk/download/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_bulk_download(self):
+        cupcake, shark, bear = Product.objects.order_by('pk')
+        bear.is_active = False
+        bear.save(update_fields=['is_active'])
+
+        archive = self.download({'label': 'shopify'})
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), [
+            f'{cupcake.pk}_little cupcake/{os.path.basename(cupcake.csv_file.name)}',
+            f'{cupcake.pk}_little cupcake/{os.path.basename(cupcake.product_image.name)}',
+            f'{shark.pk}_baby shark/{os.path.basename(shark.csv_file.name)}',
+            f'{shark.pk}_baby shark/{os.path.basename(shark.product_image.name)}',
+        ])
+        with shark.product_image.open('rb') as image:
+            self.assertEqual(archive.read(archive.namelist()[3]), image.read())
+        # Images are stored as they are, CSVs deflated
+        self.assertEqual([info.compress_type for info in archive.infolist()[:2]], [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+
+    def test_missing_files_are_listed(self):
+        cupcake = Product.objects.order_by('pk').first()
+        cupcake.product_image.storage.delete(cupcake.product_image.name)
+
+        with self.assertLogs('product.archives', 'WARNING'):
+            archive = self.download({'ids': [cupcake.pk]})
+        self.assertEqual(len(archive.namelist()), 2)
+        self.assertEqual(archive.read('missing_files.txt').decode(), f'{cupcake.pk}\t{cupcake.product_image.name}\n')
+
+    def test_storage_reads_count_for_the_view(self):
+        def read_bytes(view):
+            return REGISTRY.get_sample_value('django_view_storage_read_bytes_total', {'view': view}) or 0
+
+        before = read_bytes('bulk-download-products'), read_bytes(NO_VIEW)
+        self.download({'label': 'shopify'})
+        stored = sum(field.size for product in Product.objects.all() for field in (product.csv_file, product.product_image))
+        self.assertEqual(read_bytes('bulk-download-products') - before[0], stored)
+        self.assertEqual(read_bytes(NO_VIEW), before[1])
+
+    def test_no_products(self):
+        response = self.client.post('/api/products/bulk/download/', {'label': 'amazon'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+S3_STORAGES = {
+    'default': {
+        'BACKEND': 'backend_django.storage_backends.DirectUploadS3Storage',
+        'OPTIONS': {'bucket_name': 'stevie-test-media', 'region_name': 'us-east-1', 'querystring_auth': False},
+    },
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@unittest.skipUnless(mock_aws, 'moto is not installed')
+@override_settings(STORAGES=S3_STORAGES, PRODUCT_IMAGE_DERIVATIVES=False, PRODUCT_JOB_RUN_IN_PROCESS=False)
+class DirectUploadTests(TestCase):
+    """
+    Presign, upload straight to an in-memory S3 (moto), then finalize
+    """
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='stevie-test-media')
+
+        user_cache.clear()
+        self.user = User.objects.create_user(username='upload@example.com', email='upload@example.com', password='upload-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def presign(self, filename='little cupcake.png', content_type='image/png', label='shopify'):
+        response = self.client.post('/api/uploads/presign/', {
+            'filename': filename, 'content_type': content_type, 'label': label,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def upload(self, presigned, content, content_type='image/png'):
+        upload = presigned['upload']
+        return requests.post(upload['url'], data=upload['fields'], files={'file': ('upload', content, content_type)})
+
+    def finalize(self, presigned, **kwargs):
+        return self.client.post('/api/uploads/finalize/', {'upload_token': presigned['upload_token']}, format='json', **kwargs)
+
+    def test_presign_upload_and_finalize(self):
+        presigned = self.presign()
+        self.assertTrue(presigned['upload']['fields']['key'].startswith('product_images/'))
+        self.assertLess(self.upload(presigned, png_bytes()).status_code, 300)
+
+        response = self.finalize(presigned)
+        self.assertEqual(response.status_code, 201, response.data)
+        product = Product.objects.get()
+        self.assertEqual(product.label, 'shopify')
+        self.assertEqual(product.product_name, 'Little Cupcake - Baby Boy Girl Clothes Bodysuit Funny Cute')
+        self.assertEqual(product.product_image.name, presigned['upload']['fields']['key'])
+        with product.csv_file.open('rb') as csv_file:
+            self.assertIn(product.product_image.url.encode(), csv_file.read())
+
+        # Finalizing again returns the same product
+        response = self.finalize(presigned)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['product']['id'], product.pk)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_finalize_queues_the_csv(self):
+        presigned = self.presign(label='amazon')
+        self.upload(presigned, png_bytes())
+        response = self.client.post(
+            '/api/uploads/finalize/?async=true', {'upload_token': presigned['upload_token']}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ProductJob.objects.get().product.label, 'amazon')
+        self.assertFalse(Product.objects.get().csv_file)
+
+    def test_finalize_before_upload(self):
+        response = self.finalize(self.presign())
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_not_an_image(self):
+        presigned = self.presign()
+        self.upload(presigned, b'not an image at all')
+        response = self.finalize(presigned)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_token_of_another_user(self):
+        presigned = self.presign()
+        self.upload(presigned, png_bytes())
+        other = User.objects.create_user(username='other@example.com', email='other@example.com', password='other-password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.finalize(presigned).status_code, 400)
+
+    def test_bad_token(self):
+        response = self.client.post('/api/uploads/finalize/', {'upload_token': 'forged'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(STORAGES={**S3_STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}})
+    def test_needs_object_storage(self):
+        response = self.client.post('/api/uploads/presign/', {
+            'filename': 'a.png', 'content_type': 'image/png', 'label': 'shopify',
+        }, format='json')
+        self.assertEqual(response.status_code, 501)
+
+    def test_bulk_download_streams_from_s3(self):
+        presigned = self.presign()
+        self.upload(presigned, png_bytes())
+        self.finalize(presigned)
+        product = Product.objects.get()
+
+        response = self.client.post('/api/products/bulk/download/', {'ids': [product.pk]}, format='json')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.read(f'{product.pk}_little cupcake/{os.path.basename(product.product_image.name)}'), png_bytes())
+
+
+class MetricsAccessTests(TestCase):
+    """
+    /metrics is closed unless a token or an allowed address opens it
+    """
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-token', METRICS_ALLOWED_IPS=[])
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'django_view_', response.content)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.6').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+# A lazy route to a view that can't be imported
+LAZY_URLCONF = types.ModuleType('lazy_urls')
+LAZY_URLCONF.urlpatterns = [
+    lazy_path('missing/<int:pk>/', 'product.missing_views.view', name='missing-view'),
+    lazy_path('jobs/<int:pk>/', 'product.views.get_job_status', name='job-status'),
+]
+
+
+@override_settings(ROOT_URLCONF=LAZY_URLCONF)
+class LazyURLTests(TestCase):
+    """
+    Lazy routes import their view when a request is routed to them, not
+    when URLs are reversed
+    """
+
+    def test_reversing_imports_nothing(self):
+        self.assertEqual(reverse('missing-view', args=[1]), '/missing/1/')
+        self.assertEqual(reverse('job-status', args=[1]), '/jobs/1/')
+
+    def test_resolving_imports_the_view(self):
+        self.assertEqual(resolve('/jobs/1/').func, views.get_job_status)
+        with self.assertRaises(ImportError):
+            resolve('/missing/1/')
@@ -0,0 +1,131 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.db.models import F, Q
+from .models import Product
+
+# Image fields whose stored files can be shared by several products
+SHARED_IMAGE_FIELDS = ('product_image', 'marketplace_image', 'thumbnail_image')
+
+
+def upload_sha256(file):
+    """
+    Return the SHA-256 of an uploaded file, from the upload handler if it
+    computed one, otherwise by reading the file
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    file.sha256 = sha256.hexdigest()
+    return file.sha256
+
+
+def existing_products(image_sha256, label):
+    return (
+        Product.objects
+        .filter(image_sha256=image_sha256, label=label, is_active=True)
+        .order_by('-created_at', '-pk')
+    )
+
+
+def find_existing_product(image_sha256, label):
+    """
+    The newest active product of a label made from an identical image
+    """
+    return existing_products(image_sha256, label).first()
+
+
+async def afind_existing_product(image_sha256, label):
+    return await existing_products(image_sha256, label).afirst()
+
+
+def image_blobs(image_sha256):
+    """
+    Products holding a stored copy of an image, the ones that also have
+    renditions first
+    """
+    return (
+        Product.objects
+        .filter(image_sha256=image_sha256)
+        .exclude(product_image='')
+        .order_by(F('marketplace_image').desc(nulls_last=True), '-pk')
+        .only(*SHARED_IMAGE_FIELDS)
+    )
+
+
+def share_blob(product, blob):
+    for field_name in SHARED_IMAGE_FIELDS:
+        setattr(product, field_name, getattr(blob, field_name).name)
+
+
+def assign_image(product, image, batch_blobs=None):
+    """
+    Give an unsaved product its image, reusing the stored blob (and its
+    renditions) of an earlier product with the same content when there is
+    one. batch_blobs maps the SHA-256 of the images stored for a batch
+    whose products aren't inserted yet to the product that stored each.
+    Returns True if new bytes were written to storage.
+    """
+    if not product.image_sha256:
+        product.image_sha256 = upload_sha256(image)
+
+    if batch_blobs and product.image_sha256 in batch_blobs:
+        share_blob(product, batch_blobs[product.image_sha256])
+        return False
+
+    blob = image_blobs(product.image_sha256).first()
+    if blob is not None and blob.product_image.storage.exists(blob.product_image.name):
+        share_blob(product, blob)
+        return False
+
+    product.product_image.save(image.name, image, save=False)
+    if batch_blobs is not None:
+        batch_blobs[product.image_sha256] = product
+    return True
+
+
+async def aassign_image(product, image):
+    """
+    assign_image() for async views: the lookup uses the async ORM and the
+    storage calls run in a worker thread instead of blocking the event loop
+    """
+    if not product.image_sha256:
+        product.image_sha256 = await sync_to_async(upload_sha256, thread_sensitive=False)(image)
+
+    blob = await image_blobs(product.image_sha256).afirst()
+    if blob is not None:
+        exists = await sync_to_async(blob.product_image.storage.exists, thread_sensitive=False)(blob.product_image.name)
+        if exists:
+            share_blob(product, blob)
+            return False
+
+    await sync_to_async(product.product_image.save, thread_sensitive=False)(image.name, image, save=False)
+    return True
+
+
+def is_shared_file(file_name):
+    """
+    Whether a saved product references this stored image file
+    """
+    references = Q()
+    for field_name in SHARED_IMAGE_FIELDS:
+        references |= Q(**{field_name: file_name})
+    return Product.objects.filter(references).exists()
+
+
+def delete_unshared_image(product, batch_blobs=None):
+    """
+    Delete the stored image of an unsaved product unless a saved product,
+    or another product of its batch (see assign_image), shares it
+    """
+    if batch_blobs and product.image_sha256 in batch_blobs:
+        if batch_blobs[product.image_sha256] is not product:
+            return
+        # Later images of the batch must not share the deleted file
+        del batch_blobs[product.image_sha256]
+    if product.product_image and not is_shared_file(product.product_image.name):
+        product.product_image.delete(save=False)
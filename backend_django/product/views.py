@@ -2,10 +2,251 @@ from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Product as ShopifyProduct
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import condition
+from backend_django.image_uploads import image_upload_handlers
+from .archives import iter_products_zip
+from .conditional import (
+    filtered_products,
+    product_detail_etag,
+    product_detail_last_modified,
+    product_list_etag,
+)
+from .models import Product as ShopifyProduct, ProductJob
+from .exports import EXPORT_LABELS, iter_export, iter_xlsx_export
+from .direct_uploads import new_upload, supports_direct_uploads
+from .images import enqueue_derivatives
+from .jobs import enqueue_csv_jobs, resume_stale_job
+from .pagination import CreatedAtCursorPagination
+from .xlsx import XLSX_CONTENT_TYPE
 from .serializers import *
 
+
+def batch_create_products(request, create_serializer_class, represent):
+    """
+    Create one product per image in the 'product_images' field of a
+    multipart request.
+
+    Every image is validated and stored on its own so a bad file only
+    fails its own item; the valid products are inserted with a single
+    bulk_create. Returns the per-item results and the response status.
+    """
+    images = request.FILES.getlist('product_images')
+    if not images:
+        return {'error': 'Please provide at least one file in product_images'}, status.HTTP_400_BAD_REQUEST
+    if len(images) > settings.PRODUCT_BATCH_MAX_SIZE:
+        return (
+            {'error': f'A batch can contain at most {settings.PRODUCT_BATCH_MAX_SIZE} images'},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    reuse_existing = request_flag(request, 'reuse_existing', settings.PRODUCT_DEDUP_REUSE_PRODUCT)
+    # Images stored for this batch by content hash, so identical images
+    # in it are stored once
+    batch_blobs = {}
+    results = []
+    prepared = []
+    existing = []
+    for index, image in enumerate(images):
+        result = {'index': index, 'filename': image.name}
+        results.append(result)
+
+        serializer = create_serializer_class(data={'product_image': image}, context={'reuse_existing': reuse_existing, 'batch_blobs': batch_blobs})
+        if not serializer.is_valid():
+            result.update(status='error', errors=serializer.errors)
+            continue
+        try:
+            product = serializer.prepare_product(serializer.validated_data['product_image'])
+        except serializers.ValidationError as e:
+            result.update(status='error', errors=e.detail)
+            continue
+        except Exception as e:
+            result.update(status='error', errors={'non_field_errors': [str(e)]})
+            continue
+        if product.pk:
+            # An identical image already has a product
+            result.update(status='existing', product=represent(product))
+            existing.append(product)
+        else:
+            prepared.append((result, product))
+
+    if prepared:
+        try:
+            ShopifyProduct.objects.bulk_create([product for _, product in prepared])
+        except Exception as e:
+            for result, product in prepared:
+                ProductCreateSerializer.discard_files(product, batch_blobs)
+                result.update(status='error', errors={'non_field_errors': [str(e)]})
+            prepared = []
+
+    for result, product in prepared:
+        result.update(status='created', product=represent(product))
+    enqueue_derivatives([product.pk for _, product in prepared])
+
+    succeeded = len(prepared) + len(existing)
+    if succeeded == len(results):
+        response_status = status.HTTP_201_CREATED if prepared else status.HTTP_200_OK
+    elif succeeded:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+
+    return {
+        'created': len(prepared),
+        'existing': len(existing),
+        'failed': len(results) - succeeded,
+        'results': results,
+    }, response_status
+
+
+def request_flag(request, name, default=False):
+    """
+    Read a boolean option from the query string or the form data
+    """
+    value = request.query_params.get(name, request.data.get(name))
+    if value is None:
+        return default
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def wants_async(request):
+    """
+    Whether the CSV should be rendered by a background job: requested
+    with ?async=true (or an 'async' form field), or on by default with
+    the PRODUCT_CSV_ASYNC setting
+    """
+    return request_flag(request, 'async', settings.PRODUCT_CSV_ASYNC)
+
+
+def create_context(request):
+    """
+    Serializer context of the create endpoints. With ?reuse_existing=true
+    an upload identical to an existing product's image returns that
+    product instead of creating a new one.
+    """
+    return {
+        'defer_csv': wants_async(request),
+        'reuse_existing': request_flag(request, 'reuse_existing', settings.PRODUCT_DEDUP_REUSE_PRODUCT),
+    }
+
+
+def job_accepted_response(request, product, job, message):
+    return Response(job_accepted_data(request, product, job, message), status=status.HTTP_202_ACCEPTED)
+
+
+def job_accepted_data(request, product, job, message):
+    return {
+        'message': message,
+        'product_id': product.id,
+        'job': ProductJobSerializer(job).data,
+        'status_url': request.build_absolute_uri(reverse('job-status', args=[job.id])),
+    }
+
+
+def amazon_product_data(product):
+    return {
+        'id': product.id,
+        'product_name': product.product_name,
+        'product_image': product.product_image.url if product.product_image else None,
+        'csv_file': product.csv_file.url if product.csv_file else None,
+    }
+
+
+def soft_delete_response(pk, message):
+    """
+    Soft delete one product with a single UPDATE. updated_at is set
+    explicitly because update() skips auto_now.
+    """
+    if not ShopifyProduct.objects.filter(pk=pk).update(is_active=False, updated_at=timezone.now()):
+        return Response(
+            {'error': 'Shopify product not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response({'message': message}, status=status.HTTP_200_OK)
+
+
+def bulk_selection(request):
+    """
+    Validate a bulk request body and return (queryset, None), or
+    (None, error response)
+    """
+    serializer = BulkProductSelectionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return None, Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return serializer.get_queryset(), None
+
+
+@api_view(['POST'])
+def bulk_delete_products(request):
+    """
+    Soft delete many products with one UPDATE
+
+    Body (JSON): {"ids": [1, 2, 3]} and/or a filter {"label": "shopify",
+    "created_after": "2025-01-01T00:00:00Z", "created_before": "..."}.
+    Returns how many active products were deleted.
+    """
+    products, error = bulk_selection(request)
+    if error:
+        return error
+    deleted = products.filter(is_active=True).update(is_active=False, updated_at=timezone.now())
+    return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def bulk_restore_products(request):
+    """
+    Restore many soft-deleted products with one UPDATE; same body as
+    bulk_delete_products. Returns how many products were restored.
+    """
+    products, error = bulk_selection(request)
+    if error:
+        return error
+    restored = products.filter(is_active=False).update(is_active=True, updated_at=timezone.now())
+    return Response({'restored': restored}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def bulk_regenerate_products(request):
+    """
+    Queue CSV regeneration jobs for many active products; same body as
+    bulk_delete_products. Products that already have a pending job are
+    skipped. Returns how many jobs were queued; they run like the jobs of
+    ?async=true uploads (see /api/jobs/<id>/).
+    """
+    products, error = bulk_selection(request)
+    if error:
+        return error
+    with transaction.atomic():
+        queued = enqueue_csv_jobs(products.filter(is_active=True))
+    return Response({'queued': queued}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+def bulk_download_products(request):
+    """
+    Stream a ZIP archive with the CSV and image of many active products,
+    one folder per product; same body as bulk_delete_products. The
+    archive is copied from storage as it is sent, so the download starts
+    at once whatever the number of products.
+    """
+    products, error = bulk_selection(request)
+    if error:
+        return error
+    products = products.filter(is_active=True)
+    if not products.exists():
+        return Response({'error': 'No active products match'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(iter_products_zip(products), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="products.zip"'
+    return response
+
+
+@image_upload_handlers
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
 def create_shopify_product(request):
@@ -21,11 +262,21 @@ def create_shopify_product(request):
        - Image Src: Updates with the 5 predefined image URLs
        - Image Position: Sets positions 1-5 for the respective images
     """
-    print("Request data:", request.data)
-    serializer = ShopifyProductCreateSerializer(data=request.data)
+    serializer = ShopifyProductCreateSerializer(data=request.data, context=create_context(request))
     
     if serializer.is_valid():
         product = serializer.save()
+        if getattr(serializer, 'reused', False):
+            return Response(
+                {
+                    'message': 'An identical image was already uploaded, returning the existing product',
+                    'product': ShopifyProductSerializer(product).data
+                },
+                status=status.HTTP_200_OK
+            )
+        job = getattr(serializer, 'job', None)
+        if job:
+            return job_accepted_response(request, product, job, 'Shopify product created, CSV generation queued')
         return Response(
             {
                 'message': 'Shopify product created successfully',
@@ -36,20 +287,60 @@ def create_shopify_product(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@image_upload_handlers
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def batch_create_shopify_products(request):
+    """
+    Create many Shopify products at once, one per file in 'product_images'.
+
+    Returns a result per file; files that fail validation are reported
+    without affecting the others.
+    """
+    data, response_status = batch_create_products(
+        request,
+        ShopifyProductCreateSerializer,
+        lambda product: ShopifyProductSerializer(product).data,
+    )
+    return Response(data, status=response_status)
+
+
 @api_view(['GET'])
+@condition(etag_func=product_list_etag)
 def get_shopify_product_list(request):
     """
     Get a list of all Shopify products
+
+    Responses carry an ETag computed from a single aggregate query, so
+    unchanged polls with If-None-Match get a 304 without any rows being
+    serialized.
+
+    Optional query parameters:
+    - label: only return products with this label (e.g. shopify, amazon)
+    - page_size / cursor: return one page of results, newest first, as
+      {'next_cursor', 'next', 'results'}; follow 'next' for the next page.
+      Without them the full list is returned.
     """
-    products = ShopifyProduct.objects.filter(is_active=True).order_by('-created_at')
+    products = filtered_products(request)
+
+    if CreatedAtCursorPagination.is_requested(request):
+        paginator = CreatedAtCursorPagination()
+        page = paginator.paginate_queryset(products, request)
+        serializer = ShopifyProductSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    products = products.order_by('-created_at', '-pk')
     serializer = ShopifyProductSerializer(products, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@condition(etag_func=product_detail_etag, last_modified_func=product_detail_last_modified)
 def get_shopify_product_detail(request, pk):
     """
     Get details of a specific Shopify product
+
+    Supports conditional GET with If-None-Match / If-Modified-Since.
     """
     try:
         product = ShopifyProduct.objects.get(pk=pk, is_active=True)
@@ -68,63 +359,173 @@ def delete_shopify_product(request, pk):
     """
     Delete a Shopify product (soft delete by setting is_active=False)
     """
-    try:
-        product = ShopifyProduct.objects.get(pk=pk)
-    except ShopifyProduct.DoesNotExist:
-        return Response(
-            {'error': 'Shopify product not found'}, 
-            status=status.HTTP_404_NOT_FOUND
-        )
-        
-    # Soft delete
-    product.is_active = False
-    product.save()
-    
-    return Response(
-        {'message': 'Shopify product deleted successfully'}, 
-        status=status.HTTP_200_OK
-    )
+    return soft_delete_response(pk, 'Shopify product deleted successfully')
 
 
 
 
+@image_upload_handlers
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
 def amazon_product_create(request):
     """
     Create a new Amazon product with CSV generation
     """
-    serializer = AmazonProductCreateSerializer(data=request.data)
+    serializer = AmazonProductCreateSerializer(data=request.data, context=create_context(request))
     if serializer.is_valid():
         product = serializer.save()
+        if getattr(serializer, 'reused', False):
+            return Response({
+                **amazon_product_data(product),
+                'message': 'An identical image was already uploaded, returning the existing product'
+            }, status=status.HTTP_200_OK)
+        job = getattr(serializer, 'job', None)
+        if job:
+            return job_accepted_response(request, product, job, 'Amazon product created, CSV generation queued')
         return Response({
-            'id': product.id,
-            'product_name': product.product_name,
-            'product_image': product.product_image.url if product.product_image else None,
-            'csv_file': product.csv_file.url if product.csv_file else None,
+            **amazon_product_data(product),
             'message': 'Amazon product CSV created successfully'
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+@image_upload_handlers
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def amazon_product_batch_create(request):
+    """
+    Create many Amazon products at once, one per file in 'product_images'.
+
+    Returns a result per file; files that fail validation are reported
+    without affecting the others.
+    """
+    data, response_status = batch_create_products(request, AmazonProductCreateSerializer, amazon_product_data)
+    return Response(data, status=response_status)
+
 @api_view(['DELETE'])
 def amazon_product_delete(request, pk):
     """
     Delete an Amazon product
     """
-        
+    return soft_delete_response(pk, 'amazon product deleted successfully')
+
+
+def direct_uploads_unavailable():
+    return Response(
+        {'error': 'Direct uploads need object storage, set MEDIA_STORAGE=s3'},
+        status=status.HTTP_501_NOT_IMPLEMENTED
+    )
+
+
+@api_view(['POST'])
+def create_direct_upload(request):
+    """
+    Presign the upload of one product image straight to object storage
+
+    Body (JSON): {"filename": "little cupcake.png", "content_type":
+    "image/png", "label": "shopify"}. POST the returned fields, then the
+    image as "file", as multipart/form-data to upload.url, and send
+    upload_token to /api/uploads/finalize/.
+    """
+    if not supports_direct_uploads():
+        return direct_uploads_unavailable()
+    serializer = DirectUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    upload, upload_token = new_upload(request.user, **serializer.validated_data)
+    return Response({
+        'upload': upload,
+        'upload_token': upload_token,
+        'expires_in': settings.PRODUCT_DIRECT_UPLOAD_EXPIRES,
+        'max_size': settings.PRODUCT_DIRECT_UPLOAD_MAX_SIZE,
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def finalize_direct_upload(request):
+    """
+    Create the product for a finished direct upload and render its CSV
+
+    Body (JSON): {"upload_token": "..."}; ?async=true queues the CSV like
+    the create endpoints. Only the object's size and image header are
+    read back from storage.
+    """
+    if not supports_direct_uploads():
+        return direct_uploads_unavailable()
+    serializer = DirectUploadFinalizeSerializer(
+        data=request.data,
+        context={'defer_csv': wants_async(request), 'request': request},
+    )
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    product = serializer.save()
+    if getattr(serializer, 'reused', False):
+        return Response({
+            'message': 'This upload was already finalized, returning its product',
+            'product': ShopifyProductSerializer(product).data
+        }, status=status.HTTP_200_OK)
+    job = getattr(serializer, 'job', None)
+    if job:
+        return job_accepted_response(request, product, job, 'Product created, CSV generation queued')
+    return Response({
+        'message': 'Product created successfully',
+        'product': ShopifyProductSerializer(product).data
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def get_job_status(request, pk):
+    """
+    Get the status of a queued CSV generation job, with the product once
+    the CSV is attached. A job left running by a lost worker is queued
+    again.
+    """
     try:
-        product = ShopifyProduct.objects.get(pk=pk)
-    except ShopifyProduct.DoesNotExist:
+        job = ProductJob.objects.select_related('product').get(pk=pk)
+    except ProductJob.DoesNotExist:
         return Response(
-            {'error': 'Shopify product not found'}, 
+            {'error': 'Job not found'},
             status=status.HTTP_404_NOT_FOUND
         )
-        
-    # Soft delete
-    product.is_active = False
-    product.save()
-    
+
+    job = resume_stale_job(job)
+    data = ProductJobSerializer(job).data
+    if job.status == ProductJob.STATUS_DONE:
+        data['product'] = ShopifyProductSerializer(job.product).data
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def export_products(request, label):
+    """
+    Stream one combined import file with every active product of a label
+    (shopify or amazon), rendered row by row
+    """
+    if label not in EXPORT_LABELS:
+        return unknown_export_label()
+
+    chunks = (chunk.encode('utf-8') for chunk in iter_export(label))
+    response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{label}_products_export.csv"'
+    return response
+
+
+@api_view(['GET'])
+def export_products_xlsx(request, label):
+    """
+    The combined import file of export_products as an XLSX workbook,
+    streamed as it is compressed
+    """
+    if label not in EXPORT_LABELS:
+        return unknown_export_label()
+
+    response = StreamingHttpResponse(iter_xlsx_export(label), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{label}_products_export.xlsx"'
+    return response
+
+
+def unknown_export_label():
     return Response(
-        {'message': 'amazon product deleted successfully'}, 
-        status=status.HTTP_200_OK
-    )
\ No newline at end of file
+        {'error': f"Unknown label, expected one of: {', '.join(EXPORT_LABELS)}"},
+        status=status.HTTP_404_NOT_FOUND
+    )
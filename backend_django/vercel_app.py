@@ -0,0 +1,46 @@
+"""
+WSGI entry point for the serverless (Vercel) deployment.
+
+Uses the lean settings in backend_django/settings_serverless.py: no admin,
+sessions or metrics, and views imported by the first request that needs
+them. Compare its cold start with the regular WSGI app using
+`python manage.py benchmark_startup`.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+# Optional packages rest_framework.compat imports whenever they are
+# installed: requests (requirements.txt has it) for DRF's test client,
+# yaml for schema rendering, markdown and pygments for the browsable API.
+# The JSON API here uses none of them, so they are hidden while Django and
+# DRF's compat module load, and import normally if anything needs them
+# later.
+SKIPPED_OPTIONAL_MODULES = ('requests', 'yaml', 'markdown', 'pygments')
+
+
+@contextmanager
+def hidden_modules(names):
+    """
+    Make importing these modules fail inside the block, unless they are
+    already loaded
+    """
+    hidden = [name for name in names if name not in sys.modules]
+    for name in hidden:
+        sys.modules[name] = None
+    try:
+        yield
+    finally:
+        for name in hidden:
+            if sys.modules.get(name, False) is None:
+                del sys.modules[name]
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_django.settings_serverless')
+
+with hidden_modules(SKIPPED_OPTIONAL_MODULES):
+    from django.core.wsgi import get_wsgi_application
+
+    app = get_wsgi_application()
+    # The views import it with the first request otherwise, after the block
+    import rest_framework.compat  # noqa: F401